@@ -1,12 +1,22 @@
+import asyncio
+import signal
+
 from fastapi import FastAPI, Request
 from fastapi.responses import JSONResponse
 from uvicorn import run
 
-from soc_network.config import DefaultSettings, get_settings
+from soc_network.config import DefaultSettings, get_settings, on_settings_reload, reload_settings
 from soc_network.db.connection import SessionManager
 from soc_network.services.common import get_hostname
 from soc_network.api import list_of_routes
 from soc_network.repositories.exceptions import DbUnavailable
+from soc_network.services.rate_limit import RateLimitMiddleware
+from soc_network.services.trending import maintain_trending
+from soc_network.services.purge import purge_deleted
+from soc_network.services.partition import maintain_partitions
+from soc_network.services.cache import listen_invalidations
+from soc_network.services.warmup import connect_database, warm_up
+from soc_network.services.diagnostics import BlockingCallWatchdog, InFlightMiddleware, LoopLagMonitor
 
 
 def bind_routes(application: FastAPI, setting: DefaultSettings) -> None:
@@ -25,6 +35,78 @@ def init_database() -> None:
     SessionManager()
 
 
+def init_warm_up(application: FastAPI) -> None:
+    """
+    Warms up connection pools and caches after startup, the application is not ready until then.
+    """
+    application.state.ready = False
+
+    @application.on_event("startup")
+    async def start_warm_up():
+        # before the background tasks, they would connect concurrently
+        await connect_database()
+        application.state.warm_up_task = asyncio.create_task(warm_up(application), name="warm_up")
+
+    @application.on_event("shutdown")
+    async def stop_warm_up():
+        application.state.warm_up_task.cancel()
+
+
+def init_shutdown(application: FastAPI) -> None:
+    """
+    Closes pooled connections after in-flight requests have been drained.
+    """
+
+    @application.on_event("shutdown")
+    async def dispose_engine():
+        await SessionManager().engine.dispose()
+
+
+def init_background_tasks(application: FastAPI, setting: DefaultSettings) -> None:
+    """
+    Starts periodic jobs of the application and stops them on shutdown.
+    """
+
+    @application.on_event("startup")
+    async def start_background_tasks():
+        # names are reported by /health_check/diagnostics
+        application.state.background_tasks = [
+            asyncio.create_task(maintain_trending(setting.TRENDING_COMPACT_INTERVAL_SECONDS), name="trending"),
+            asyncio.create_task(purge_deleted(setting.PURGE_INTERVAL_SECONDS), name="purge"),
+            asyncio.create_task(maintain_partitions(setting.PARTITION_INTERVAL_SECONDS), name="partitions"),
+            asyncio.create_task(listen_invalidations(), name="cache_invalidation"),
+            asyncio.create_task(LoopLagMonitor().run(setting.LOOP_LAG_SAMPLE_SECONDS), name="loop_lag"),
+        ]
+        if setting.BLOCKING_WATCHDOG_ENABLED:
+            watchdog = BlockingCallWatchdog().run(
+                setting.BLOCKING_WATCHDOG_THRESHOLD_MS / 1000, setting.BLOCKING_WATCHDOG_LOG,
+            )
+            application.state.background_tasks.append(asyncio.create_task(watchdog, name="blocking_watchdog"))
+
+    @application.on_event("shutdown")
+    async def stop_background_tasks():
+        for task in application.state.background_tasks:
+            task.cancel()
+
+
+def init_settings_reload(application: FastAPI) -> None:
+    """
+    Reloads settings snapshot on SIGHUP without restarting the application.
+    """
+
+    @on_settings_reload
+    def update_app_settings(settings: DefaultSettings) -> None:
+        application.state.settings = settings
+
+    @application.on_event("startup")
+    async def add_reload_signal_handler():
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, reload_settings)
+        except (NotImplementedError, RuntimeError, ValueError, AttributeError):
+            # no signals on windows and outside of the main thread (e.g. in test client)
+            pass
+
+
 def get_app() -> FastAPI:
     """
     Creates application and all dependable objects.
@@ -55,8 +137,15 @@ def get_app() -> FastAPI:
         )
 
     settings = get_settings()
+    application.add_middleware(RateLimitMiddleware)
+    # outermost, requests rejected by the rate limit are counted too
+    application.add_middleware(InFlightMiddleware)
     bind_routes(application, settings)
     init_database()
+    init_warm_up(application)
+    init_background_tasks(application, settings)
+    init_shutdown(application)
+    init_settings_reload(application)
     application.state.settings = settings
     return application
 
@@ -65,11 +154,16 @@ app = get_app()
 
 if __name__ == "__main__":
     settings_for_application = get_settings()
-    run(
-        "soc_network.__main__:app",
-        host=get_hostname(settings_for_application.APP_HOST),
-        port=settings_for_application.APP_PORT,
-        reload=True,
-        reload_dirs=["soc_network", "tests"],
-        log_level="debug",
-    )
+    if settings_for_application.APP_SERVE_MODE == "prod":
+        from soc_network.server import run_production
+
+        run_production(app, settings_for_application)
+    else:
+        run(
+            "soc_network.__main__:app",
+            host=get_hostname(settings_for_application.APP_HOST),
+            port=settings_for_application.APP_PORT,
+            reload=True,
+            reload_dirs=["soc_network", "tests"],
+            log_level="debug",
+        )
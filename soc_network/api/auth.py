@@ -1,17 +1,29 @@
-from datetime import timedelta
-from fastapi import APIRouter, Body, Depends, HTTPException, Response, status, BackgroundTasks, Request
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Response, status, BackgroundTasks, Request
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.ext.asyncio import AsyncSession
+from redis import Redis
 import logging
 
-from soc_network.config import get_settings
-from soc_network.db.connection import get_session
+from soc_network.db.connection import get_session, get_redis, get_state_redis
 from soc_network.db.models import User
-from soc_network.schemas import RegistrationForm, RegistrationSuccess, Token
+from soc_network.schemas import (
+    Principal,
+    RefreshRequest,
+    RegistrationForm,
+    RegistrationSuccess,
+    Token,
+    UserReactionsPage,
+)
 from soc_network.schemas import User as UserSchema
 from soc_network.services.user import service
+from soc_network.services.post import service as post_service
 from soc_network.services import exceptions as serv_exc
-from soc_network.repositories import UserRepository
+from soc_network.repositories import (
+    UserRepository,
+    PostActionRepository,
+    RefreshTokenRepository,
+    RevocationRepository,
+)
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -40,12 +52,16 @@ api_router = APIRouter(
         status.HTTP_500_INTERNAL_SERVER_ERROR: {
             "description": "Internal server error."
         },
+        status.HTTP_503_SERVICE_UNAVAILABLE: {
+            "description": "Token store unavailable."
+        },
     }
 )
 async def authentication(
         request: Request,
         form_data: OAuth2PasswordRequestForm = Depends(),
         session: AsyncSession = Depends(get_session),
+        redis_sess: Redis = Depends(get_state_redis),
 ):
     """
     Authenticates user.
@@ -53,7 +69,8 @@ async def authentication(
         - username
         - password
     - output:
-        - access_token
+        - access_token: short living token for requests
+        - refresh_token: token for /user/token/refresh
         - token_type
     """
     user_repo = UserRepository(session)
@@ -70,9 +87,63 @@ async def authentication(
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token_expires = timedelta(minutes=get_settings().ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = service.create_access_token(data={"sub": user.username}, expires_delta=access_token_expires)
-    return {"access_token": access_token, "token_type": "bearer"}
+    refresh_repo = RefreshTokenRepository(redis_sess)
+    return await service.create_token_pair(username=user.username, user_id=user.id, refresh_repo=refresh_repo)
+
+
+@api_router.post(
+    "/token/refresh",
+    status_code=status.HTTP_200_OK,
+    response_model=Token,
+    responses={
+        status.HTTP_401_UNAUTHORIZED: {
+            "description": "Invalid, expired, revoked or already used refresh token."
+        },
+        status.HTTP_500_INTERNAL_SERVER_ERROR: {
+            "description": "Internal server error."
+        },
+        status.HTTP_503_SERVICE_UNAVAILABLE: {
+            "description": "Token store unavailable."
+        },
+    }
+)
+async def refresh_token(
+        request: Request,
+        refresh_request: RefreshRequest = Body(...),
+        redis_sess: Redis = Depends(get_state_redis),
+):
+    """
+    Issues a new token pair for the refresh token, the refresh token can be used once.
+    - input:
+        - refresh_token
+    - output:
+        - access_token
+        - refresh_token
+        - token_type
+    """
+    refresh_repo = RefreshTokenRepository(redis_sess)
+    revocation_repo = RevocationRepository(redis_sess)
+    try:
+        tokens = await service.refresh_tokens(refresh_request.refresh_token, refresh_repo, revocation_repo)
+    except (serv_exc.InvalidTokenError, serv_exc.TokenReuseError) as exc:
+        logger.info("method: %(method)s, client: %(client)s, path: %(path)s, params: {reason: %(reason)s}, "
+                    "status_code: %(status_code)s" %
+                    {'method': request.method,
+                     'client': request.client.host,
+                     'path': request.url.path,
+                     'reason': exc,
+                     'status_code': 401})
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate refresh token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    logger.info("method: %(method)s, client: %(client)s, path: %(path)s, status_code: %(status_code)s" %
+                {'method': request.method,
+                 'client': request.client.host,
+                 'path': request.url.path,
+                 'status_code': 200})
+    return tokens
 
 
 @api_router.post(
@@ -206,6 +277,67 @@ async def get_me(
     return UserSchema.from_orm(current_user)
 
 
+@api_router.get(
+    "/me/reactions",
+    status_code=status.HTTP_200_OK,
+    response_model=UserReactionsPage,
+    responses={
+        status.HTTP_400_BAD_REQUEST: {
+            "description": "Bad pagination cursor.",
+        },
+        status.HTTP_401_UNAUTHORIZED: {
+            "description": "Could not validate credentials.",
+        },
+        status.HTTP_500_INTERNAL_SERVER_ERROR: {
+            "description": "Internal server error."
+        },
+    },
+)
+async def get_my_reactions(
+        request: Request,
+        limit: int = Query(50, ge=1, le=200),
+        cursor: str | None = Query(None),
+        current_user: Principal = Depends(service.get_current_principal),
+        session: AsyncSession = Depends(get_session),
+):
+    """
+    Returns reactions of current user, newest first.
+    - input:
+        - limit: page size
+        - cursor: next_cursor from the previous page
+    - output:
+        - items: post_id, action, dt_created
+        - next_cursor: cursor of the next page, empty on the last page
+    """
+    post_act_repo = PostActionRepository(session)
+    try:
+        page = await post_service.list_user_reactions(
+            user=current_user,
+            limit=limit,
+            post_act_repo=post_act_repo,
+            cursor=cursor,
+        )
+    except serv_exc.BadCursorError:
+        logger.info("method: %(method)s, client: %(client)s, path: %(path)s, params: {username: %(username)s, "
+                    "cursor: %(cursor)s}, status_code: %(status_code)s" %
+                    {'method': request.method,
+                     'client': request.client.host,
+                     'path': request.url.path,
+                     'username': current_user.username,
+                     'cursor': cursor,
+                     'status_code': 400})
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f'Bad cursor {cursor}')
+    logger.info("method: %(method)s, client: %(client)s, path: %(path)s, params: {username: %(username)s, "
+                "cursor: %(cursor)s}, status_code: %(status_code)s" %
+                {'method': request.method,
+                 'client': request.client.host,
+                 'path': request.url.path,
+                 'username': current_user.username,
+                 'cursor': cursor,
+                 'status_code': 200})
+    return page
+
+
 @api_router.delete(
     "/me",
     status_code=status.HTTP_204_NO_CONTENT,
@@ -220,12 +352,17 @@ async def get_me(
         status.HTTP_500_INTERNAL_SERVER_ERROR: {
             "description": "Internal server error."
         },
+        status.HTTP_503_SERVICE_UNAVAILABLE: {
+            "description": "Token store unavailable, tokens of the user are not revoked. Retry the request."
+        },
     },
 )
 async def delete_user(
         request: Request,
-        current_user: User = Depends(service.get_current_user),
+        current_user: Principal = Depends(service.get_current_principal),
         session: AsyncSession = Depends(get_session),
+        redis_sess: Redis = Depends(get_redis),
+        state_redis: Redis = Depends(get_state_redis),
 ):
     """
     Deletes current user.
@@ -234,9 +371,10 @@ async def delete_user(
     - output:
         - empty
     """
-    user_repo = UserRepository(session)
+    user_repo = UserRepository(session, redis_sess)
+    revocation_repo = RevocationRepository(state_redis)
     try:
-        await service.delete_user(user_repo, current_user.id)
+        await service.delete_user(user_repo, revocation_repo, current_user.id)
         logger.info("method: %(method)s, client: %(client)s, path: %(path)s, params: {username: %(username)s}, "
                     "status_code: %(status_code)s" %
                     {'method': request.method,
@@ -247,3 +385,43 @@ async def delete_user(
     except serv_exc.NoUserError:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                             detail=f'No user {current_user.username}')
+
+
+@api_router.post(
+    "/logout",
+    status_code=status.HTTP_204_NO_CONTENT,
+    response_class=Response,
+    responses={
+        status.HTTP_401_UNAUTHORIZED: {
+            "description": "Could not validate credentials.",
+        },
+        status.HTTP_500_INTERNAL_SERVER_ERROR: {
+            "description": "Internal server error."
+        },
+        status.HTTP_503_SERVICE_UNAVAILABLE: {
+            "description": "Token store unavailable, the token is not revoked."
+        },
+    },
+)
+async def logout(
+        request: Request,
+        current_user: Principal = Depends(service.get_current_principal),
+        redis_sess: Redis = Depends(get_state_redis),
+):
+    """
+    Revokes the access token of the request and the refresh tokens of its login.
+    - input:
+        - empty
+    - output:
+        - empty
+    """
+    revocation_repo = RevocationRepository(redis_sess)
+    refresh_repo = RefreshTokenRepository(redis_sess)
+    await service.logout(current_user, revocation_repo, refresh_repo)
+    logger.info("method: %(method)s, client: %(client)s, path: %(path)s, params: {username: %(username)s}, "
+                "status_code: %(status_code)s" %
+                {'method': request.method,
+                 'client': request.client.host,
+                 'path': request.url.path,
+                 'username': current_user.username,
+                 'status_code': 204})
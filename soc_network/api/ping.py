@@ -1,10 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException
+import asyncio
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from redis import Redis
 from sqlalchemy.ext.asyncio import AsyncSession
 from starlette import status
 
-from soc_network.db.connection import get_session
-from soc_network.schemas import PingResponse
-from soc_network.services.health_check import health_check_db
+from soc_network.config import get_settings
+from soc_network.db.connection import RedisManager, SessionManager, get_redis, get_session, get_state_redis
+from soc_network.repositories import CacheStatsRepository
+from soc_network.repositories.local_cache import LocalCache
+from soc_network.schemas import BlockingCalls, CacheStats, Diagnostics, PingResponse, PoolStats
+from soc_network.services.diagnostics import BlockingCallWatchdog, InFlightMiddleware, LoopLagMonitor
+from soc_network.services.health_check import health_check_db, health_check_redis
 
 
 api_router = APIRouter(
@@ -22,6 +29,24 @@ async def ping_application():
     return {"message": "Application worked!"}
 
 
+@api_router.get(
+    "/ready",
+    response_model=PingResponse,
+    status_code=status.HTTP_200_OK,
+    responses={status.HTTP_503_SERVICE_UNAVAILABLE: {"description": "Warm-up is not done yet."}},
+)
+async def ready(request: Request):
+    """
+    For the load balancer: fails until connection pools and caches of this worker process are warmed up.
+    """
+    if request.app.state.ready:
+        return {"message": "Application is ready!"}
+    raise HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Application is warming up",
+    )
+
+
 @api_router.get(
     "/ping_database",
     response_model=PingResponse,
@@ -37,3 +62,101 @@ async def ping_database(
         status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
         detail="Database isn't working",
     )
+
+
+@api_router.get(
+    "/db_pool",
+    response_model=dict[str, PoolStats],
+    status_code=status.HTTP_200_OK,
+)
+async def db_pool_stats():
+    """
+    Connection pools of this worker process: connections in use and how long they are held.
+    """
+    return {name: metrics.snapshot() for name, metrics in SessionManager().pool_metrics.items()}
+
+
+@api_router.get(
+    "/cache",
+    response_model=CacheStats,
+    status_code=status.HTTP_200_OK,
+)
+async def cache_stats(
+    redis_sess: Redis = Depends(get_redis),
+):
+    """
+    Redis memory and eviction counters, redis memory by key class (estimated on a sample of keys)
+    and the local cache of this worker process.
+    """
+    cache_stats_repo = CacheStatsRepository(redis_sess)
+    return {
+        "server": await cache_stats_repo.server_stats(),
+        "key_classes": await cache_stats_repo.memory_by_class(get_settings().CACHE_METRICS_SAMPLE_KEYS),
+        "local": LocalCache().stats(),
+    }
+
+
+def task_state(task: asyncio.Task) -> str:
+    if not task.done():
+        return "running"
+    if task.cancelled():
+        return "cancelled"
+    return "failed" if task.exception() is not None else "done"
+
+
+@api_router.get(
+    "/diagnostics",
+    response_model=Diagnostics,
+    status_code=status.HTTP_200_OK,
+)
+async def diagnostics(
+    request: Request,
+    redis_sess: Redis = Depends(get_redis),
+    state_redis: Redis = Depends(get_state_redis),
+):
+    """
+    Worker process state for troubleshooting: connection pools, redis latency, event loop lag, requests
+    in flight per route and background jobs. Reads only counters of the process and a PING of the cache
+    and the state redis, so it can be polled every few seconds.
+    """
+    latency = await health_check_redis(redis_sess)
+    state_latency = await health_check_redis(state_redis)
+    tasks = list(getattr(request.app.state, "background_tasks", []))
+    warm_up_task = getattr(request.app.state, "warm_up_task", None)
+    if warm_up_task is not None:
+        tasks.append(warm_up_task)
+    return {
+        "db_pools": {name: metrics.snapshot() for name, metrics in SessionManager().pool_metrics.items()},
+        "redis": {
+            "available": latency is not None,
+            "latency_seconds": latency,
+            "pool": RedisManager().pool_stats(),
+        },
+        "state_redis": {
+            "available": state_latency is not None,
+            "latency_seconds": state_latency,
+            "pool": RedisManager().pool_stats(state=True),
+        },
+        "loop_lag": LoopLagMonitor().snapshot(),
+        "requests": InFlightMiddleware.snapshot(),
+        "background_jobs": {task.get_name(): task_state(task) for task in tasks},
+        "pending_tasks": len(asyncio.all_tasks()),
+    }
+
+
+@api_router.get(
+    "/blocking_calls",
+    response_model=BlockingCalls,
+    status_code=status.HTTP_200_OK,
+)
+async def blocking_calls():
+    """
+    Code that held the event loop of this worker process longer than BLOCKING_WATCHDOG_THRESHOLD_MS,
+    by call site with a sample stack, the worst first. Collected only with BLOCKING_WATCHDOG_ENABLED.
+    """
+    watchdog = BlockingCallWatchdog()
+    return {
+        "enabled": watchdog.running,
+        "threshold_seconds": watchdog.threshold,
+        "calls": watchdog.snapshot(),
+    }
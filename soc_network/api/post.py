@@ -1,4 +1,5 @@
 import uuid
+from datetime import datetime
 from uuid import UUID
 from fastapi import APIRouter, Body, Query, Depends, HTTPException, Response, status, Request
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -7,13 +8,13 @@ import logging
 
 from soc_network.config import get_settings
 from soc_network.db.connection import get_session
-from soc_network.db.connection import get_redis
-from soc_network.db.models import User
-from soc_network.schemas import Post as PostSchema, PostActionEnum
+from soc_network.db.connection import get_redis, get_state_redis
+from soc_network.schemas import Post as PostSchema, PostActionEnum, PostSearchPage, TrendingPost
+from soc_network.schemas import EngagementRequest, PostEngagement, Principal
 from soc_network.services.post import service
 from soc_network.services.user import service as user_service
 from soc_network.services import exceptions as serv_exc
-from soc_network.repositories import PostRepository, UserRepository, PostActionRepository
+from soc_network.repositories import PostRepository, UserRepository, PostActionRepository, TrendingRepository
 
 
 logger = logging.getLogger(__name__)
@@ -47,7 +48,7 @@ api_router = APIRouter(
 async def create_post(
         request: Request,
         body: str = Body(..., min_length=1),
-        current_user: User = Depends(user_service.get_current_user),
+        current_user: Principal = Depends(user_service.get_current_principal),
         session: AsyncSession = Depends(get_session),
 ):
     """
@@ -59,9 +60,10 @@ async def create_post(
 
     """
     post_repo = PostRepository(session)
+    user_repo = UserRepository(session)
     post = PostSchema(body=body, author_id=current_user.id)
     try:
-        post_id = await service.create_post(post=post, post_repo=post_repo)
+        post_id = await service.create_post(post=post, post_repo=post_repo, user_repo=user_repo)
         logger.info(
             "method: %(method)s, client: %(client)s, path: %(path)s, user: %(user)s, params {body: %(body)s}, "
             "status_code: %(status)s" %
@@ -111,8 +113,9 @@ async def update_post(
         request: Request,
         post_id: uuid.UUID = Query(...),
         new_body: str = Body(..., min_length=1),
-        current_user: User = Depends(user_service.get_current_user),
+        current_user: Principal = Depends(user_service.get_current_principal),
         session: AsyncSession = Depends(get_session),
+        redis_sess: Redis = Depends(get_redis),
 ):
     """
     Updates post.
@@ -122,7 +125,7 @@ async def update_post(
     - output:
         - empty
     """
-    post_repo = PostRepository(session)
+    post_repo = PostRepository(session, redis_sess)
     try:
         await service.update_post(post_id=post_id, new_body=new_body, user=current_user, post_repo=post_repo)
         logger.info(
@@ -181,19 +184,41 @@ async def update_post(
 )
 async def get_post(
         request: Request,
+        response: Response,
         post_id: uuid.UUID = Query(...),
-        current_user: User = Depends(user_service.get_current_user),
+        current_user: Principal = Depends(user_service.get_current_principal),
         session: AsyncSession = Depends(get_session),
+        redis_sess: Redis = Depends(get_redis),
 ):
     """
-    Gets post
+    Gets post. Supports conditional requests with If-None-Match.
     - input:
         - post_id: post id
     - output:
         body: post body
         author: post author
     """
-    post_repo = PostRepository(session)
+    settings = get_settings()
+    # revalidated by ETag, never stored by shared caches: the post is read on behalf of an authenticated user
+    cache_headers = {
+        "Cache-Control": f"private, max-age={settings.POST_CACHE_MAX_AGE}",
+        "Vary": "Authorization",
+    }
+    post_repo = PostRepository(session, redis_sess)
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        etag = await service.get_post_etag(post_id=post_id, post_repo=post_repo)
+        if etag is not None and service.etag_matches(if_none_match, etag):
+            logger.info(
+                "method: %(method)s, client: %(client)s, path: %(path)s, user: %(user)s, "
+                "params {post_id: %(post_id)s}, status_code: %(status)s" %
+                {'method': request.method,
+                 'client': request.client.host,
+                 'user': current_user.username,
+                 'path': request.url.path,
+                 'post_id': post_id,
+                 'status': 304})
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag, **cache_headers})
     post = await service.get_post(post_id=post_id, post_repo=post_repo)
     logger.info(
         "method: %(method)s, client: %(client)s, path: %(path)s, user: %(user)s, params {post_id: %(post_id)s}, "
@@ -205,11 +230,150 @@ async def get_post(
          'post_id': post_id,
          'status': 200 if post else 404})
     if post:
+        response.headers["ETag"] = service.make_post_etag(post.id, int(post.dt_updated.timestamp() * 1_000_000))
+        response.headers.update(cache_headers)
         return PostSchema.from_orm(post)
     raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                         detail=f'Post {post_id} not found.')
 
 
+@api_router.get(
+    "/search",
+    status_code=status.HTTP_200_OK,
+    response_model=PostSearchPage,
+    responses={
+        status.HTTP_400_BAD_REQUEST: {
+            "description": "Bad pagination cursor.",
+        },
+        status.HTTP_401_UNAUTHORIZED: {
+            "description": "Could not validate credentials.",
+        },
+        status.HTTP_500_INTERNAL_SERVER_ERROR: {
+            "description": "Internal server error."
+        },
+    },
+)
+async def search_posts(
+        request: Request,
+        q: str = Query(..., min_length=1, max_length=256),
+        author_id: UUID | None = Query(None),
+        limit: int = Query(20, ge=1, le=100),
+        cursor: str | None = Query(None),
+        since: datetime | None = Query(None),
+        current_user: Principal = Depends(user_service.get_current_principal),
+        session: AsyncSession = Depends(get_session),
+):
+    """
+    Searches posts by body text.
+    - input:
+        - q: search query
+        - author_id: optional post author filter
+        - limit: page size
+        - cursor: next_cursor from the previous page
+        - since: optional lower bound of the post creation time, the older partitions are not searched
+    - output:
+        - items: found posts ordered by rank
+        - next_cursor: cursor of the next page, empty on the last page
+    """
+    post_repo = PostRepository(session)
+    try:
+        page = await service.search_posts(
+            query=q,
+            limit=limit,
+            post_repo=post_repo,
+            author_id=author_id,
+            cursor=cursor,
+            since=since,
+        )
+    except serv_exc.BadCursorError:
+        logger.info(
+            "method: %(method)s, client: %(client)s, path: %(path)s, user: %(user)s, params {q: %(q)s, "
+            "cursor: %(cursor)s}, status_code: %(status)s" %
+            {'method': request.method,
+             'client': request.client.host,
+             'user': current_user.username,
+             'path': request.url.path,
+             'q': q,
+             'cursor': cursor,
+             'status': 400})
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f'Bad cursor {cursor}')
+    logger.info(
+        "method: %(method)s, client: %(client)s, path: %(path)s, user: %(user)s, params {q: %(q)s, "
+        "cursor: %(cursor)s}, status_code: %(status)s" %
+        {'method': request.method,
+         'client': request.client.host,
+         'user': current_user.username,
+         'path': request.url.path,
+         'q': q,
+         'cursor': cursor,
+         'status': 200})
+    return page
+
+
+@api_router.get(
+    "/trending",
+    status_code=status.HTTP_200_OK,
+    response_model=list[TrendingPost],
+    responses={
+        status.HTTP_401_UNAUTHORIZED: {
+            "description": "Could not validate credentials.",
+        },
+        status.HTTP_500_INTERNAL_SERVER_ERROR: {
+            "description": "Internal server error."
+        },
+    },
+)
+async def get_trending_posts(
+        request: Request,
+        limit: int = Query(20, ge=1, le=100),
+        current_user: Principal = Depends(user_service.get_current_principal),
+        session: AsyncSession = Depends(get_session),
+        state_redis: Redis = Depends(get_state_redis),
+):
+    """
+    Returns top posts by time-decayed engagement.
+    - input:
+        - limit: number of posts
+    - output:
+        - list of posts with their scores, best first
+    """
+    post_repo = PostRepository(session)
+    trending_repo = TrendingRepository(session, state_redis)
+    posts = await service.get_trending_posts(limit=limit, post_repo=post_repo, trending_repo=trending_repo)
+    logger.info(
+        "method: %(method)s, client: %(client)s, path: %(path)s, user: %(user)s, params {limit: %(limit)s}, "
+        "status_code: %(status)s" %
+        {'method': request.method,
+         'client': request.client.host,
+         'user': current_user.username,
+         'path': request.url.path,
+         'limit': limit,
+         'status': 200})
+    return posts
+
+
+@api_router.get(
+    "/reactions",
+    status_code=status.HTTP_200_OK,
+    response_model=list[str],
+)
+async def list_reactions(request: Request):
+    """
+    Returns reactions that can be put on a post.
+    - input:
+        - empty
+    - output:
+        - list of reaction names
+    """
+    logger.info(
+        "method: %(method)s, client: %(client)s, path: %(path)s, status_code: %(status)s" %
+        {'method': request.method,
+         'client': request.client.host,
+         'path': request.url.path,
+         'status': 200})
+    return [action.value for action in PostActionEnum]
+
+
 @api_router.delete(
     "",
     status_code=status.HTTP_204_NO_CONTENT,
@@ -232,9 +396,10 @@ async def get_post(
 async def delete_post(
         request: Request,
         post_id: uuid.UUID,
-        current_user: User = Depends(user_service.get_current_user),
+        current_user: Principal = Depends(user_service.get_current_principal),
         session: AsyncSession = Depends(get_session),
-        redis_sess: Redis = Depends(get_redis)
+        redis_sess: Redis = Depends(get_redis),
+        state_redis: Redis = Depends(get_state_redis),
 ):
     """
     Deletes post.
@@ -243,16 +408,14 @@ async def delete_post(
     - output:
         - empty
     """
-    post_repo = PostRepository(session)
-    user_repo = UserRepository(session)
-    post_act_repo = PostActionRepository(session, redis_sess)
+    post_repo = PostRepository(session, redis_sess)
+    trending_repo = TrendingRepository(session, state_redis)
     try:
         await service.delete_post(
             post_id=post_id,
             user=current_user,
             post_repo=post_repo,
-            user_repo=user_repo,
-            post_act_repo=post_act_repo,
+            trending_repo=trending_repo,
         )
         logger.info(
             "method: %(method)s, client: %(client)s, path: %(path)s, user: %(user)s, params {post_id: %(post_id)s}, "
@@ -275,18 +438,6 @@ async def delete_post(
              'status': 403})
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
                             detail=f'The user `{current_user.username}` can not delete the post `{post_id}`')
-    except serv_exc.NoUserError:
-        logger.info(
-            "method: %(method)s, client: %(client)s, path: %(path)s, user: %(user)s, params {post_id: %(post_id)s}, "
-            "status_code: %(status)s" %
-            {'method': request.method,
-             'client': request.client.host,
-             'user': current_user.username,
-             'path': request.url.path,
-             'post_id': post_id,
-             'status': 404})
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
-                            detail=f'User {current_user.username} not found')
     except serv_exc.NoPostError:
         logger.info(
             "method: %(method)s, client: %(client)s, path: %(path)s, user: %(user)s, params {post_id: %(post_id)s}, "
@@ -301,6 +452,52 @@ async def delete_post(
                             detail=f'Post {post_id} not found')
 
 
+@api_router.post(
+    "/engagement",
+    status_code=status.HTTP_200_OK,
+    response_model=list[PostEngagement],
+    responses={
+        status.HTTP_401_UNAUTHORIZED: {
+            "description": "Could not validate credentials.",
+        },
+        status.HTTP_500_INTERNAL_SERVER_ERROR: {
+            "description": "Internal server error."
+        },
+    },
+)
+async def get_posts_engagement(
+        request: Request,
+        engagement_request: EngagementRequest,
+        current_user: Principal = Depends(user_service.get_current_principal),
+        session: AsyncSession = Depends(get_session),
+        redis_sess: Redis = Depends(get_redis),
+):
+    """
+    Returns reactions summary of a batch of posts, e.g. of a feed page.
+    - input:
+        - post_ids: up to 300 post ids
+    - output:
+        - list of likes and dislikes counts, counts of every reaction and the reaction of the current user,
+          in the order of post_ids
+    """
+    post_act_repo = PostActionRepository(session, redis_sess)
+    engagement = await service.get_posts_engagement(
+        posts_ids=engagement_request.post_ids,
+        user=current_user,
+        post_act_repo=post_act_repo,
+    )
+    logger.info(
+        "method: %(method)s, client: %(client)s, path: %(path)s, user: %(user)s, params {posts: %(posts)s}, "
+        "status_code: %(status)s" %
+        {'method': request.method,
+         'client': request.client.host,
+         'user': current_user.username,
+         'path': request.url.path,
+         'posts': len(engagement_request.post_ids),
+         'status': 200})
+    return engagement
+
+
 @api_router.post(
     "/{action}",
     status_code=status.HTTP_201_CREATED,
@@ -326,28 +523,30 @@ async def rate_post(
         request: Request,
         action: PostActionEnum,
         post_id: UUID = Query(...),
-        current_user: User = Depends(user_service.get_current_user),
+        current_user: Principal = Depends(user_service.get_current_principal),
         session: AsyncSession = Depends(get_session),
         redis_sess: Redis = Depends(get_redis),
+        state_redis: Redis = Depends(get_state_redis),
 ):
     """
-    Adds like/dislike to post.
+    Puts the reaction on the post, replacing the previous reaction of the user.
     - input:
+        - action: one of /post/reactions
         - post_id: post id.
     - output:
         - message: operation status.
     """
     post_repo = PostRepository(session)
-    user_repo = UserRepository(session)
     post_act_repo = PostActionRepository(session, redis_sess)
+    trending_repo = TrendingRepository(session, state_redis)
     try:
         await service.rate_post(
             post_id=post_id,
             user=current_user,
             action=action,
             post_repo=post_repo,
-            user_repo=user_repo,
             post_act_repo=post_act_repo,
+            trending_repo=trending_repo,
         )
         logger.info(
             "method: %(method)s, client: %(client)s, path: %(path)s, user: %(user)s, params {post_id: %(post_id)s, "
@@ -373,18 +572,6 @@ async def rate_post(
              'status': 403})
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
                             detail=f'The user `{current_user.username}` can not rate the post `{post_id}`')
-    except serv_exc.NoUserError:
-        logger.info(
-            "method: %(method)s, client: %(client)s, path: %(path)s, user: %(user)s, params {post_id: %(post_id)s, "
-            "action: %(action)s}, status_code: %(status)s" %
-            {'method': request.method,
-             'client': request.client.host,
-             'user': current_user.username,
-             'path': request.url.path,
-             'post_id': post_id,
-             'action': action,
-             'status': 404})
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f'No user `{current_user.username}`')
     except serv_exc.NoPostError:
         logger.info(
             "method: %(method)s, client: %(client)s, path: %(path)s, user: %(user)s, params {post_id: %(post_id)s, "
@@ -436,29 +623,30 @@ async def delete_post_action(
         request: Request,
         action: PostActionEnum,
         post_id: UUID = Query(...),
-        current_user: User = Depends(user_service.get_current_user),
+        current_user: Principal = Depends(user_service.get_current_principal),
         session: AsyncSession = Depends(get_session),
         redis_sess: Redis = Depends(get_redis),
+        state_redis: Redis = Depends(get_state_redis),
 ):
     """
-    Deletes like/dislike on post.
+    Deletes the reaction on post.
     - input
-        - action: string 'LIKE' or 'DISLIKE'
+        - action: one of /post/reactions
         - post_id
     - output:
         - empty
     """
     post_repo = PostRepository(session)
-    user_repo = UserRepository(session)
     post_act_repo = PostActionRepository(session, redis_sess)
+    trending_repo = TrendingRepository(session, state_redis)
     try:
         await service.delete_post_rate(
             post_id=post_id,
             user=current_user,
             action=action,
             post_repo=post_repo,
-            user_repo=user_repo,
             post_act_repo=post_act_repo,
+            trending_repo=trending_repo,
         )
         logger.info(
             "method: %(method)s, client: %(client)s, path: %(path)s, user: %(user)s, params {post_id: %(post_id)s, "
@@ -484,19 +672,6 @@ async def delete_post_action(
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                             detail=f'There is no action {action} on the post {post_id} from the '
                                    f'user {current_user.username}')
-    except serv_exc.NoUserError:
-        logger.info(
-            "method: %(method)s, client: %(client)s, path: %(path)s, user: %(user)s, params {post_id: %(post_id)s, "
-            "action: %(action)s}, status_code: %(status)s" %
-            {'method': request.method,
-             'client': request.client,
-             'user': current_user.username,
-             'path': request.url.path,
-             'post_id': post_id,
-             'action': action,
-             'status': 404})
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
-                            detail=f'User {current_user.username} not found')
     except serv_exc.NoPostError:
         logger.info(
             "method: %(method)s, client: %(client)s, path: %(path)s, user: %(user)s, params {post_id: %(post_id)s, "
@@ -1,8 +1,10 @@
 from .default import DefaultSettings
-from .utils import get_settings
+from .utils import get_settings, on_settings_reload, reload_settings
 
 
 __all__ = [
     "DefaultSettings",
     "get_settings",
+    "on_settings_reload",
+    "reload_settings",
 ]
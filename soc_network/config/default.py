@@ -2,7 +2,7 @@ from os import environ
 
 from fastapi.security import OAuth2PasswordBearer
 from passlib.context import CryptContext
-from pydantic import BaseSettings
+from pydantic import BaseSettings, validator
 
 
 class DefaultSettings(BaseSettings):
@@ -14,23 +14,132 @@ class DefaultSettings(BaseSettings):
     PATH_PREFIX: str = environ.get("PATH_PREFIX", "/api/v1")
     APP_HOST: str = environ.get("APP_HOST", "http://127.0.0.1")
     APP_PORT: int = int(environ.get("APP_PORT", 8000))
+    # "dev" - single process with autoreload, "prod" - pre-forked workers
+    APP_SERVE_MODE: str = environ.get("APP_SERVE_MODE", "dev")
+    # 0 - one worker per CPU core
+    APP_WORKERS: int = int(environ.get("APP_WORKERS", 0))
+    APP_MAX_REQUESTS: int = int(environ.get("APP_MAX_REQUESTS", 10000))
+    APP_MAX_REQUESTS_JITTER: int = int(environ.get("APP_MAX_REQUESTS_JITTER", 1000))
+    APP_GRACEFUL_TIMEOUT: int = int(environ.get("APP_GRACEFUL_TIMEOUT", 30))
+    APP_KEEPALIVE: int = int(environ.get("APP_KEEPALIVE", 5))
 
     POSTGRES_DB: str = environ.get("POSTGRES_DB", "soc_network_db")
     POSTGRES_HOST: str = environ.get("POSTGRES_HOST", "localhost")
     POSTGRES_USER: str = environ.get("POSTGRES_USER", "user")
     POSTGRES_PORT: int = int(environ.get("POSTGRES_PORT", "5432")[-4:])
     POSTGRES_PASSWORD: str = environ.get("POSTGRES_PASSWORD", "hackme")
+    # attempts to open the first connections on startup, with a pause in between
     DB_CONNECT_RETRY: int = environ.get("DB_CONNECT_RETRY", 20)
+    DB_CONNECT_RETRY_DELAY_SECONDS: float = float(environ.get("DB_CONNECT_RETRY_DELAY_SECONDS", 1))
     DB_POOL_SIZE: int = environ.get("DB_POOL_SIZE", 15)
+    # startup warm-up: connections opened in every pool (at most DB_POOL_SIZE) with the hot statements prepared
+    # on them, top trending posts loaded into the caches; /health_check/ready fails until it is done
+    WARMUP_DB_CONNECTIONS: int = int(environ.get("WARMUP_DB_CONNECTIONS", 5))
+    WARMUP_TOP_POSTS: int = int(environ.get("WARMUP_TOP_POSTS", 100))
+    # failed warm-up is retried after this delay, doubled after every failure up to the max
+    WARMUP_RETRY_DELAY_SECONDS: float = float(environ.get("WARMUP_RETRY_DELAY_SECONDS", 1))
+    WARMUP_RETRY_MAX_DELAY_SECONDS: float = float(environ.get("WARMUP_RETRY_MAX_DELAY_SECONDS", 60))
+    # connections held longer are logged, a sign of db sessions kept open across slow calls
+    DB_SLOW_CHECKOUT_SECONDS: float = float(environ.get("DB_SLOW_CHECKOUT_SECONDS", 5))
+    # event loop lag is sampled by a sleep of this length, see /health_check/diagnostics
+    LOOP_LAG_SAMPLE_SECONDS: float = float(environ.get("LOOP_LAG_SAMPLE_SECONDS", 0.5))
+    # debug runs and load tests: code holding the event loop longer than the threshold is logged with its stack
+    # to BLOCKING_WATCHDOG_LOG, totals by call site are at /health_check/blocking_calls
+    BLOCKING_WATCHDOG_ENABLED: bool = environ.get("BLOCKING_WATCHDOG_ENABLED", "false").lower() == "true"
+    BLOCKING_WATCHDOG_THRESHOLD_MS: int = int(environ.get("BLOCKING_WATCHDOG_THRESHOLD_MS", 100))
+    BLOCKING_WATCHDOG_LOG: str = environ.get("BLOCKING_WATCHDOG_LOG", "soc_network.blocking_calls.log")
+    # comma separated "host[:port]" of read replicas, credentials and database are the same as on the primary
+    POSTGRES_REPLICA_HOSTS: str = environ.get("POSTGRES_REPLICA_HOSTS", "")
+    # reads of the session/user that has just written go to the primary during this window
+    DB_PRIMARY_STICKY_SECONDS: float = float(environ.get("DB_PRIMARY_STICKY_SECONDS", 5))
+    # failed replica is excluded from balancing for this time
+    DB_REPLICA_RETRY_SECONDS: float = float(environ.get("DB_REPLICA_RETRY_SECONDS", 10))
 
     REDIS_HOST: str = environ.get("REDIS_HOST", "localhost")
     REDIS_PORT: int = environ.get("REDIS_PORT", 6379)
     REDIS_CACHE_DB: int = 0
+    # state that is not a copy of the database: rate limit buckets, refresh tokens and revocations, the trending
+    # ranking, read-your-writes marks of the clients and locks of the background jobs. The server must not evict keys and must persist them
+    # (docker-compose redis_state), the cache redis is free to evict. Not set, they are the ones of the cache redis.
+    REDIS_STATE_HOST: str | None = environ.get("REDIS_STATE_HOST")
+    REDIS_STATE_PORT: int | None = environ.get("REDIS_STATE_PORT")
+    REDIS_STATE_DB: int | None = environ.get("REDIS_STATE_DB")
+    # redis is called synchronously on the event loop (rate limit of every request, caches),
+    # an unreachable or stuck server has to fail fast so the callers fall back to their local paths
+    REDIS_CONNECT_TIMEOUT_SECONDS: float = float(environ.get("REDIS_CONNECT_TIMEOUT_SECONDS", 0.25))
+    REDIS_SOCKET_TIMEOUT_SECONDS: float = float(environ.get("REDIS_SOCKET_TIMEOUT_SECONDS", 1))
 
     # to get a string like this run: "openssl rand -hex 32"
     SECRET_KEY: str = environ.get("SECRET_KEY", "")
     ALGORITHM: str = environ.get("ALGORITHM", "HS256")
-    ACCESS_TOKEN_EXPIRE_MINUTES: int = int(environ.get("ACCESS_TOKEN_EXPIRE_MINUTES", 1440))
+    # access tokens are short, clients renew them with the refresh token instead of the password
+    ACCESS_TOKEN_EXPIRE_MINUTES: int = int(environ.get("ACCESS_TOKEN_EXPIRE_MINUTES", 15))
+    REFRESH_TOKEN_EXPIRE_DAYS: int = int(environ.get("REFRESH_TOKEN_EXPIRE_DAYS", 30))
+    # revocation checks (logout, account delete) are cached per process for this time
+    AUTH_REVOCATION_CACHE_SECONDS: float = float(environ.get("AUTH_REVOCATION_CACHE_SECONDS", 5))
+
+    # trending posts: reaction weight halves every TRENDING_HALF_LIFE_HOURS
+    TRENDING_HALF_LIFE_HOURS: float = float(environ.get("TRENDING_HALF_LIFE_HOURS", 6))
+    TRENDING_WEIGHTS: dict[str, float] = {
+        "LIKE": 1.0, "DISLIKE": 0.5, "LOVE": 1.5, "HAHA": 1.0, "WOW": 1.0, "SAD": 0.5, "ANGRY": 0.5,
+    }
+    TRENDING_SIZE: int = int(environ.get("TRENDING_SIZE", 1000))
+    TRENDING_MIN_SCORE: float = float(environ.get("TRENDING_MIN_SCORE", 0.01))
+    # posts of this age are used when the ranking is rebuilt from database
+    TRENDING_WINDOW_HOURS: int = int(environ.get("TRENDING_WINDOW_HOURS", 72))
+    TRENDING_COMPACT_INTERVAL_SECONDS: int = int(environ.get("TRENDING_COMPACT_INTERVAL_SECONDS", 300))
+    # older posts are not ranked, so the rebuild reads only the partitions of the recent months
+    TRENDING_POST_MAX_AGE_DAYS: int = int(environ.get("TRENDING_POST_MAX_AGE_DAYS", 30))
+
+    RATE_LIMIT_ENABLED: bool = environ.get("RATE_LIMIT_ENABLED", "true").lower() == "true"
+    # "METHOD /path" of route without PATH_PREFIX: (tokens per second, bucket size), applied per ip and per user
+    RATE_LIMITS: dict[str, tuple[float, int]] = {
+        "POST /user/authentication": (0.2, 5),
+        "POST /user/registration": (0.1, 3),
+        "POST /post/{action}": (2.0, 10),
+        "DELETE /post/{action}": (2.0, 10),
+    }
+    RATE_LIMIT_DEFAULT: tuple[float, int] = (20.0, 50)
+    # while redis is unavailable limits are checked per process
+    RATE_LIMIT_REDIS_RETRY_SECONDS: float = float(environ.get("RATE_LIMIT_REDIS_RETRY_SECONDS", 5))
+
+    # post reads: cached version stamp lifetime and Cache-Control max-age for the client; responses are private,
+    # a shared cache would serve them without the authentication and revocation checks
+    POST_VERSION_TTL_SECONDS: int = int(environ.get("POST_VERSION_TTL_SECONDS", 300))
+    POST_CACHE_MAX_AGE: int = int(environ.get("POST_CACHE_MAX_AGE", 0))
+
+    # cache fill coalescing: lifetime of the cross-process fill lock and how often the waiters check it
+    CACHE_FILL_LOCK_MS: int = int(environ.get("CACHE_FILL_LOCK_MS", 2000))
+    CACHE_FILL_POLL_MS: int = int(environ.get("CACHE_FILL_POLL_MS", 20))
+    # reactions a user can put on a post, name: code stored in post_action.reaction (json in the env variable),
+    # codes of existing rows must be kept, a new reaction gets a new code
+    REACTIONS: dict[str, int] = {"LIKE": 1, "DISLIKE": 2, "LOVE": 3, "HAHA": 4, "WOW": 5, "SAD": 6, "ANGRY": 7}
+    # how long "the user has not reacted to the post" is remembered when reactions of the post are not cached
+    REACTION_NEGATIVE_TTL_SECONDS: int = int(environ.get("REACTION_NEGATIVE_TTL_SECONDS", 30))
+    # cached reactions of a post expire when the post is not read or reacted to for this long
+    REACTION_CACHE_TTL_SECONDS: int = int(environ.get("REACTION_CACHE_TTL_SECONDS", 3600))
+    # redis memory by key class is estimated from this many keys, see /health_check/cache
+    CACHE_METRICS_SAMPLE_KEYS: int = int(environ.get("CACHE_METRICS_SAMPLE_KEYS", 1000))
+    # in-process cache of posts, users and reactions in front of redis and the db: approximate size limit
+    # of every worker process (0 turns it off) and the longest time an entry is served
+    LOCAL_CACHE_MAX_BYTES: int = int(environ.get("LOCAL_CACHE_MAX_BYTES", 64 * 2 ** 20))
+    LOCAL_CACHE_TTL_SECONDS: float = float(environ.get("LOCAL_CACHE_TTL_SECONDS", 30))
+
+    # purge of deleted posts and users: rows are removed in short transactions of PURGE_BATCH_SIZE,
+    # one run does at most PURGE_MAX_BATCHES of them with a pause in between
+    PURGE_INTERVAL_SECONDS: int = int(environ.get("PURGE_INTERVAL_SECONDS", 30))
+    PURGE_BATCH_SIZE: int = int(environ.get("PURGE_BATCH_SIZE", 500))
+    PURGE_BATCH_PAUSE_MS: int = int(environ.get("PURGE_BATCH_PAUSE_MS", 50))
+    PURGE_MAX_BATCHES: int = int(environ.get("PURGE_MAX_BATCHES", 200))
+
+    # monthly partitions of post and post_action: PARTITION_MONTHS_AHEAD months are created in advance,
+    # months older than PARTITION_ARCHIVE_AFTER_MONTHS are moved to gzip files in PARTITION_ARCHIVE_DIR (0 keeps all)
+    PARTITION_INTERVAL_SECONDS: int = int(environ.get("PARTITION_INTERVAL_SECONDS", 3600))
+    PARTITION_MONTHS_AHEAD: int = int(environ.get("PARTITION_MONTHS_AHEAD", 3))
+    PARTITION_ARCHIVE_AFTER_MONTHS: int = int(environ.get("PARTITION_ARCHIVE_AFTER_MONTHS", 0))
+    PARTITION_ARCHIVE_DIR: str = environ.get("PARTITION_ARCHIVE_DIR", "archive")
+    # partition changes give up instead of queueing the queries behind their lock
+    PARTITION_LOCK_TIMEOUT_MS: int = int(environ.get("PARTITION_LOCK_TIMEOUT_MS", 5000))
 
     HUNTER_API_KEY: str = environ.get("HUNTER_API_KEY", "")
     CLEARBIT_API_KEY: str = environ.get("CLEARBIT_API_KEY", "")
@@ -60,6 +169,21 @@ class DefaultSettings(BaseSettings):
             **self.database_settings,
         )
 
+    @property
+    def database_replica_uris(self) -> list[str]:
+        """
+        Get uris for connection with read replicas.
+        """
+        uris = []
+        for replica in filter(None, map(str.strip, self.POSTGRES_REPLICA_HOSTS.split(","))):
+            host, _, port = replica.partition(":")
+            uris.append(
+                "postgresql+asyncpg://{user}:{password}@{host}:{port}/{database}".format(
+                    **{**self.database_settings, "host": host, "port": port or self.POSTGRES_PORT},
+                )
+            )
+        return uris
+
     @property
     def database_uri_sync(self) -> str:
         """
@@ -69,6 +193,26 @@ class DefaultSettings(BaseSettings):
             **self.database_settings,
         )
 
+    @validator("REDIS_STATE_HOST", "REDIS_STATE_PORT", "REDIS_STATE_DB", always=True)
+    def default_to_cache_redis(cls, value, values, field):
+        cache_field = {
+            "REDIS_STATE_HOST": "REDIS_HOST", "REDIS_STATE_PORT": "REDIS_PORT", "REDIS_STATE_DB": "REDIS_CACHE_DB",
+        }
+        return values[cache_field[field.name]] if value is None else value
+
+    @validator("REACTIONS")
+    def check_reactions(cls, reactions: dict[str, int]) -> dict[str, int]:
+        # likes and dislikes are counted by name in the engagement, a code names one reaction
+        missing = {"LIKE", "DISLIKE"} - set(reactions)
+        if missing:
+            raise ValueError(f"reactions {sorted(missing)} are required")
+        if len(set(reactions.values())) != len(reactions):
+            raise ValueError("reaction codes must be unique")
+        if not all(1 <= code <= 32767 for code in reactions.values()):
+            raise ValueError("reaction codes must fit post_action.reaction, 1 to 32767")
+        return reactions
+
     class Config:
+        frozen = True
         env_file = ".env.app"
         env_file_encoding = "utf-8"
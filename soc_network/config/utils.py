@@ -1,9 +1,19 @@
+from functools import lru_cache
 from os import environ
+from typing import Callable
 
 from soc_network.config.default import DefaultSettings
 
 
+_reload_callbacks: list[Callable[[DefaultSettings], None]] = []
+
+
+@lru_cache(maxsize=1)
 def get_settings() -> DefaultSettings:
+    """
+    Returns the settings snapshot. It is built once and then shared by every caller
+    until `reload_settings` is called.
+    """
     env = environ.get("ENV", "local")
     if env == "local":
         return DefaultSettings()
@@ -11,3 +21,23 @@ def get_settings() -> DefaultSettings:
     # space for other settings
     # ...
     return DefaultSettings()  # fallback to default
+
+
+def on_settings_reload(callback: Callable[[DefaultSettings], None]) -> Callable[[DefaultSettings], None]:
+    """
+    Registers callback that receives the new settings snapshot after every reload.
+    """
+    _reload_callbacks.append(callback)
+    return callback
+
+
+def reload_settings() -> DefaultSettings:
+    """
+    Re-reads environment and env file into a new snapshot and pushes it to the subscribers
+    (database engine, redis pool).
+    """
+    get_settings.cache_clear()
+    settings = get_settings()
+    for callback in _reload_callbacks:
+        callback(settings)
+    return settings
@@ -0,0 +1,220 @@
+"""
+Timings and plans of the hot queries, to compare indexes before and after a migration.
+
+    python3 -m soc_network.db.bench --seed     # fill the database with bench_ users, posts and reactions
+    python3 -m soc_network.db.bench            # EXPLAIN ANALYZE and timings on the current schema
+    python3 -m soc_network.db.bench --clean    # remove the bench data
+    python3 -m soc_network.db.bench --ids      # insert rate and primary key size with random and time-ordered ids
+"""
+import argparse
+import asyncio
+import random
+from statistics import mean, quantiles
+from time import perf_counter
+from uuid import uuid4
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, create_async_engine
+
+from soc_network.config import get_settings
+from soc_network.db.models.action import reaction_code
+from soc_network.db.uuid7 import uuid7
+
+
+BENCH_PREFIX = "bench_"
+PLAN_LINE_WIDTH = 160
+
+# the statements issued by the repositories, written out to be readable in EXPLAIN output
+QUERIES = {
+    "post_actions_by_post": "SELECT user_id, reaction FROM post_action WHERE post_id = :post_id",
+    "engagement_counts": (
+        "SELECT post_id, reaction, count(*), bool_or(user_id = :user_id) FROM post_action "
+        "WHERE post_id = ANY(:posts_ids) GROUP BY post_id, reaction"
+    ),
+    "posts_of_author": "SELECT id FROM post WHERE author_id = :author_id AND deleted_at IS NULL LIMIT 500",
+    "author_has_posts": "SELECT id FROM post WHERE author_id = :author_id LIMIT 1",
+    "user_credentials": (
+        'SELECT id, username, password FROM "user" WHERE username = :username AND deleted_at IS NULL'
+    ),
+}
+# registration, rolled back after the measure
+REGISTRATION = (
+    'INSERT INTO "user" (username, password, email) '
+    "VALUES (:username, :password, :username || '@bench.local')"
+)
+
+
+async def seed(conn: AsyncConnection, users: int, posts_per_user: int, reactions_per_post: int):
+    await conn.execute(
+        text(
+            'INSERT INTO "user" (username, password, email) '
+            "SELECT :prefix || g, md5(g::text), :prefix || g || '@bench.local' FROM generate_series(1, :users) g "
+            "ON CONFLICT DO NOTHING"
+        ),
+        {"prefix": BENCH_PREFIX, "users": users},
+    )
+    await conn.execute(
+        text(
+            "INSERT INTO post (body, author_id) "
+            "SELECT 'bench post ' || g, u.id FROM \"user\" u CROSS JOIN generate_series(1, :posts_per_user) g "
+            "WHERE u.username LIKE :pattern"
+        ),
+        {"posts_per_user": posts_per_user, "pattern": f"{BENCH_PREFIX}%"},
+    )
+    # reactors of a post are spread over the users by two primes, duplicates are skipped
+    await conn.execute(
+        text(
+            "INSERT INTO post_action (user_id, post_id, reaction) "
+            "SELECT u.id, p.id, CASE WHEN (p.n + k) % 5 = 0 THEN CAST(:dislike AS smallint) ELSE CAST(:like AS smallint) END "
+            "FROM (SELECT id, row_number() OVER () AS n FROM post WHERE body LIKE 'bench post %') p "
+            "CROSS JOIN generate_series(1, :reactions_per_post) k "
+            "JOIN \"user\" u ON u.username = :prefix || ((p.n * 7919 + k * 104729) % :users + 1) "
+            "ON CONFLICT DO NOTHING"
+        ),
+        {
+            "reactions_per_post": reactions_per_post,
+            "prefix": BENCH_PREFIX,
+            "users": users,
+            "like": reaction_code("LIKE"),
+            "dislike": reaction_code("DISLIKE"),
+        },
+    )
+    await conn.commit()
+    for table in ("\"user\"", "post", "post_action"):
+        await conn.execute(text(f"ANALYZE {table}"))
+    await conn.commit()
+
+
+async def clean(conn: AsyncConnection):
+    bench_users = 'SELECT id FROM "user" WHERE username LIKE :pattern'
+    params = {"pattern": f"{BENCH_PREFIX}%"}
+    await conn.execute(text(f"DELETE FROM post_action WHERE user_id IN ({bench_users})"), params)
+    await conn.execute(
+        text(f"DELETE FROM post_action WHERE post_id IN (SELECT id FROM post WHERE author_id IN ({bench_users}))"),
+        params,
+    )
+    await conn.execute(text(f"DELETE FROM post WHERE author_id IN ({bench_users})"), params)
+    await conn.execute(text('DELETE FROM "user" WHERE username LIKE :pattern'), params)
+    await conn.commit()
+
+
+async def sample_params(conn: AsyncConnection, size: int) -> list[dict]:
+    users = (await conn.execute(
+        text('SELECT id, username FROM "user" WHERE username LIKE :pattern ORDER BY random() LIMIT :size'),
+        {"pattern": f"{BENCH_PREFIX}%", "size": size},
+    )).all()
+    posts_ids = list((await conn.execute(
+        text("SELECT id FROM post WHERE body LIKE 'bench post %' ORDER BY random() LIMIT :size"),
+        {"size": max(size, 300)},
+    )).scalars())
+    if not users or not posts_ids:
+        raise SystemExit("No bench data, run with --seed first.")
+    return [
+        {
+            "post_id": random.choice(posts_ids),
+            "posts_ids": random.sample(posts_ids, min(len(posts_ids), 300)),
+            "user_id": user.id,
+            "author_id": user.id,
+            "username": user.username,
+        }
+        for user in users
+    ]
+
+
+async def measure(conn: AsyncConnection, query: str, params: list[dict], repeat: int) -> list[float]:
+    statement = text(query)
+    timings = []
+    for i in range(repeat):
+        started = perf_counter()
+        await conn.execute(statement, params[i % len(params)])
+        timings.append((perf_counter() - started) * 1000)
+    return timings
+
+
+async def measure_registration(conn: AsyncConnection, repeat: int) -> list[float]:
+    statement = text(REGISTRATION)
+    timings = []
+    transaction = await conn.begin_nested()
+    for i in range(repeat):
+        started = perf_counter()
+        await conn.execute(statement, {"username": f"{BENCH_PREFIX}new_{i}", "password": f"{i:060d}"})
+        timings.append((perf_counter() - started) * 1000)
+    await transaction.rollback()
+    return timings
+
+
+async def bench_ids(conn: AsyncConnection, rows: int, batch_size: int):
+    """
+    Inserts the same rows into a post-like table keyed by version 4 and by version 7 ids.
+    """
+    for name, make_id in (("uuid4", uuid4), ("uuid7", uuid7)):
+        table = f"{BENCH_PREFIX}ids_{name}"
+        await conn.execute(text(f"DROP TABLE IF EXISTS {table}"))
+        await conn.execute(text(
+            f"CREATE TABLE {table} (id uuid PRIMARY KEY, dt_created timestamptz NOT NULL DEFAULT now(), body text)"
+        ))
+        await conn.commit()
+        insert = text(f"INSERT INTO {table} (id, body) SELECT unnest(CAST(:ids AS uuid[])), 'bench post'")
+        started = perf_counter()
+        for _ in range(0, rows, batch_size):
+            await conn.execute(insert, {"ids": [make_id() for _ in range(batch_size)]})
+            await conn.commit()
+        elapsed = perf_counter() - started
+        index_size = (await conn.execute(text(f"SELECT pg_relation_size('{table}_pkey')"))).scalar()
+        print(f"{name:8} {rows / elapsed:10.0f} rows/s   primary key {index_size / 2 ** 20:8.1f} MiB")
+        await conn.execute(text(f"DROP TABLE {table}"))
+        await conn.commit()
+
+
+async def explain(conn: AsyncConnection, query: str, params: dict) -> str:
+    plan = await conn.execute(text(f"EXPLAIN (ANALYZE, BUFFERS, COSTS OFF) {query}"), params)
+    # filters with hundreds of ids are cut to keep the plan readable
+    return "\n".join(f"    {line[:PLAN_LINE_WIDTH]}" for line in plan.scalars())
+
+
+def report(name: str, timings: list[float]) -> str:
+    p95 = quantiles(timings, n=20)[-1] if len(timings) > 1 else timings[0]
+    return f"{name:32} mean {mean(timings):8.3f} ms   p95 {p95:8.3f} ms   n={len(timings)}"
+
+
+async def run(args: argparse.Namespace):
+    engine = create_async_engine(get_settings().database_uri)
+    async with engine.connect() as conn:
+        if args.clean:
+            await clean(conn)
+            return
+        if args.ids:
+            await bench_ids(conn, args.id_rows, batch_size=1000)
+            return
+        if args.seed:
+            await seed(conn, args.users, args.posts_per_user, args.reactions_per_post)
+        revision = (await conn.execute(text("SELECT version_num FROM alembic_version"))).scalar()
+        print(f"revision {revision}")
+        params = await sample_params(conn, size=100)
+        for name, query in QUERIES.items():
+            # warm up the cache and the prepared statement
+            await measure(conn, query, params, repeat=10)
+            print(report(name, await measure(conn, query, params, args.repeat)))
+            if args.explain:
+                print(await explain(conn, query, params[0]))
+        print(report("registration", await measure_registration(conn, args.repeat)))
+        await conn.rollback()
+    await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seed", action="store_true", help="add bench data before the run")
+    parser.add_argument("--clean", action="store_true", help="remove bench data and exit")
+    parser.add_argument("--ids", action="store_true", help="compare random and time-ordered ids and exit")
+    parser.add_argument("--id-rows", type=int, default=2_000_000)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--posts-per-user", type=int, default=20)
+    parser.add_argument("--reactions-per-post", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=500)
+    parser.add_argument("--no-explain", dest="explain", action="store_false")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
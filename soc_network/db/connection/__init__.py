@@ -1,10 +1,14 @@
-from .session import SessionManager, get_session, get_session_for_test
-from .redis import get_redis
+from .session import SessionManager, get_session, get_session_for_test, release_connection, set_sticky_key
+from .redis import RedisManager, get_redis, get_state_redis
 
 
 __all__ = [
     "get_session",
     "get_redis",
+    "get_state_redis",
     "SessionManager",
+    "RedisManager",
     "get_session_for_test",
+    "set_sticky_key",
+    "release_connection",
 ]
@@ -0,0 +1,97 @@
+import logging
+from bisect import bisect_left
+from time import monotonic
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+logger = logging.getLogger(__name__)
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """
+    Queue pool that reports to its PoolMetrics how long checkouts wait for a connection
+    (a free one or a newly opened one).
+    """
+
+    metrics = None
+
+    def _do_get(self):
+        if self.metrics is None:
+            return super()._do_get()
+        self.metrics.waiting += 1
+        started = monotonic()
+        try:
+            return super()._do_get()
+        finally:
+            self.metrics.waiting -= 1
+            self.metrics.record_wait(monotonic() - started)
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+
+class PoolMetrics:
+    """
+    How long connections of the engine pool stay checked out, from the first statement of a unit of work
+    till the connection is returned, and how long checkouts wait for them (with TimedQueuePool).
+    """
+
+    # upper bounds of the histogram buckets in seconds, the last bucket is unbounded
+    BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0)
+
+    def __init__(self, engine: AsyncEngine, slow_checkout_seconds: float):
+        # the pool itself is replaced on dispose, listeners are carried over to the new one
+        self.engine = engine.sync_engine
+        self.slow_checkout_seconds = slow_checkout_seconds
+        self.checkouts = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.buckets = [0] * (len(self.BUCKETS) + 1)
+        self.waiting = 0
+        self.waits = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        if isinstance(self.engine.pool, TimedQueuePool):
+            self.engine.pool.metrics = self
+        event.listen(engine.sync_engine, "checkout", self._on_checkout)
+        event.listen(engine.sync_engine, "checkin", self._on_checkin)
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy) -> None:
+        connection_record.info["checkout_time"] = monotonic()
+
+    def _on_checkin(self, dbapi_connection, connection_record) -> None:
+        checkout_time = connection_record.info.pop("checkout_time", None)
+        if checkout_time is None:
+            return
+        duration = monotonic() - checkout_time
+        self.checkouts += 1
+        self.total_seconds += duration
+        self.max_seconds = max(self.max_seconds, duration)
+        self.buckets[bisect_left(self.BUCKETS, duration)] += 1
+        if duration >= self.slow_checkout_seconds:
+            logger.warning(f"Connection was checked out for {duration:.2f}s, the pool may be starved.")
+
+    def record_wait(self, duration: float) -> None:
+        self.waits += 1
+        self.total_wait_seconds += duration
+        self.max_wait_seconds = max(self.max_wait_seconds, duration)
+
+    def snapshot(self) -> dict:
+        bounds = [f"le_{bound:g}" for bound in self.BUCKETS] + ["le_inf"]
+        pool = self.engine.pool
+        return {
+            "pool_size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+            "checkouts": self.checkouts,
+            "avg_seconds": self.total_seconds / self.checkouts if self.checkouts else 0.0,
+            "max_seconds": self.max_seconds,
+            "buckets": dict(zip(bounds, self.buckets)),
+            "waiting": self.waiting,
+            "avg_wait_seconds": self.total_wait_seconds / self.waits if self.waits else 0.0,
+            "max_wait_seconds": self.max_wait_seconds,
+        }
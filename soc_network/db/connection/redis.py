@@ -1,10 +1,78 @@
 import redis
-from soc_network.config import get_settings
+from soc_network.config import DefaultSettings, get_settings, on_settings_reload
+
+
+class RedisManager:
+    """
+    Keeps connection pools of the cache and the state redis per process, redis clients are issued on top of them.
+    Both share one pool when REDIS_STATE_* point to the cache redis.
+    """
+
+    def __init__(self) -> None:
+        if not hasattr(self, "pool"):
+            self.refresh()
+
+    def __new__(cls):
+        if not hasattr(cls, "instance"):
+            cls.instance = super(RedisManager, cls).__new__(cls)
+        return cls.instance  # noqa
+
+    def get_client(self) -> redis.Redis:
+        return redis.Redis(connection_pool=self.pool)
+
+    def get_state_client(self) -> redis.Redis:
+        return redis.Redis(connection_pool=self.state_pool)
+
+    def pool_stats(self, state: bool = False) -> dict:
+        pool = self.state_pool if state else self.pool
+        return {
+            "created": pool._created_connections,
+            "in_use": len(pool._in_use_connections),
+            "available": len(pool._available_connections),
+            "max": pool.max_connections,
+        }
+
+    def reset(self) -> None:
+        self.pool.reset()
+        if self.state_pool is not self.pool:
+            self.state_pool.reset()
+
+    def refresh(self, settings: DefaultSettings | None = None) -> None:
+        settings = settings or get_settings()
+        timeouts = (settings.REDIS_CONNECT_TIMEOUT_SECONDS, settings.REDIS_SOCKET_TIMEOUT_SECONDS)
+        pool_params = (settings.REDIS_HOST, settings.REDIS_PORT, settings.REDIS_CACHE_DB, *timeouts)
+        state_pool_params = (settings.REDIS_STATE_HOST, settings.REDIS_STATE_PORT, settings.REDIS_STATE_DB, *timeouts)
+        if (getattr(self, "pool_params", None), getattr(self, "state_pool_params", None)) == \
+                (pool_params, state_pool_params):
+            return
+        old_pools = {id(pool): pool for pool in (getattr(self, "pool", None), getattr(self, "state_pool", None))}
+        self.pool_params, self.state_pool_params = pool_params, state_pool_params
+        self.pool = self._create_pool(*pool_params)
+        self.state_pool = self.pool if state_pool_params == pool_params else self._create_pool(*state_pool_params)
+        for old_pool in old_pools.values():
+            if old_pool is not None:
+                old_pool.disconnect(inuse_connections=False)
+
+    @staticmethod
+    def _create_pool(host: str, port: int, db: int, connect_timeout: float, socket_timeout: float):
+        return redis.ConnectionPool(
+            host=host,
+            port=port,
+            db=db,
+            socket_connect_timeout=connect_timeout,
+            socket_timeout=socket_timeout,
+        )
+
+
+@on_settings_reload
+def _refresh_pool(settings: DefaultSettings) -> None:
+    if hasattr(RedisManager, "instance"):
+        RedisManager().refresh(settings)
 
 
 async def get_redis():
-    return redis.Redis(
-        host=get_settings().REDIS_HOST,
-        port=get_settings().REDIS_PORT,
-        db=get_settings().REDIS_CACHE_DB,
-    )
\ No newline at end of file
+    return RedisManager().get_client()
+
+
+async def get_state_redis():
+    return RedisManager().get_state_client()
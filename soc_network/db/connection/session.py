@@ -1,7 +1,57 @@
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
-from sqlalchemy.orm import sessionmaker
+import asyncio
+import itertools
+from contextvars import ContextVar
+from time import monotonic
 
-from soc_network.config import get_settings
+import redis
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.sql import Select
+
+from soc_network.config import DefaultSettings, get_settings, on_settings_reload
+from .pool_metrics import PoolMetrics, TimedQueuePool
+from .redis import RedisManager
+
+
+# key of the current client (user id), writes of this client keep his reads on the primary
+_sticky_key: ContextVar[str | None] = ContextVar("sticky_key", default=None)
+# set in the state redis for DB_PRIMARY_STICKY_SECONDS after a write of the client, the next request
+# of the client is served by any worker process
+STICKY_KEY_PREFIX = "db:sticky:"
+
+
+def set_sticky_key(key: str) -> None:
+    """
+    Binds current request to the key, used for read-your-writes routing across sessions.
+    """
+    _sticky_key.set(key)
+
+
+class RoutingSession(Session):
+    """
+    Session that sends writes to the primary and plain reads to one of the replicas.
+    Statements can be pinned to the primary with `execution_options(use_primary=True)`.
+    Only Select constructs count as reads: raw `text("SELECT ...")` statements go to the primary,
+    since what they do is not known.
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kw) -> Engine:
+        manager = SessionManager()
+        if not manager.replica_engines:
+            return manager.engine.sync_engine
+        if self._flushing or not isinstance(clause, Select) or _is_primary_only(clause):
+            self.info["last_write"] = monotonic()
+            manager.mark_write(_sticky_key.get())
+            return manager.engine.sync_engine
+        if manager.is_sticky(self.info, _sticky_key.get()):
+            return manager.engine.sync_engine
+        return manager.get_replica()
+
+
+def _is_primary_only(clause: Select) -> bool:
+    return clause._for_update_arg is not None or clause.get_execution_options().get("use_primary", False)
 
 
 class SessionManager:
@@ -11,7 +61,8 @@ class SessionManager:
     """
 
     def __init__(self) -> None:
-        self.refresh()
+        if not hasattr(self, "engine"):
+            self.refresh()
 
     def __new__(cls):
         if not hasattr(cls, "instance"):
@@ -19,10 +70,125 @@ class SessionManager:
         return cls.instance  # noqa
 
     def get_session_maker(self) -> sessionmaker:
-        return sessionmaker(self.engine, class_=AsyncSession, expire_on_commit=False)
+        return self.session_maker
 
-    def refresh(self) -> None:
-        self.engine = create_async_engine(get_settings().database_uri, echo=True, future=True)
+    def refresh(self, settings: DefaultSettings | None = None) -> None:
+        """
+        Creates the engines for the current settings. Engines are rebuilt only when the connection
+        parameters have changed, the old ones are disposed in the background.
+        """
+        settings = settings or get_settings()
+        self.sticky_seconds = settings.DB_PRIMARY_STICKY_SECONDS
+        self.replica_retry_seconds = settings.DB_REPLICA_RETRY_SECONDS
+        engine_params = (settings.database_uri, tuple(settings.database_replica_uris), settings.DB_POOL_SIZE)
+        if getattr(self, "engine_params", None) == engine_params:
+            return
+        old_engines = [getattr(self, "engine", None), *getattr(self, "replica_engines", [])]
+        self.engine_params = engine_params
+        self.engine = self._create_engine(settings.database_uri, settings)
+        self.replica_engines = [self._create_engine(uri, settings) for uri in settings.database_replica_uris]
+        self.replica_down_until = {}
+        self.replica_counter = itertools.count()
+        self.last_writes = {}
+        for index, replica in enumerate(self.replica_engines):
+            self._watch_replica(index, replica)
+        self.pool_metrics = {
+            "primary": PoolMetrics(self.engine, settings.DB_SLOW_CHECKOUT_SECONDS),
+            **{
+                f"replica_{index}": PoolMetrics(replica, settings.DB_SLOW_CHECKOUT_SECONDS)
+                for index, replica in enumerate(self.replica_engines)
+            },
+        }
+        self.session_maker = sessionmaker(
+            self.engine,
+            class_=AsyncSession,
+            sync_session_class=RoutingSession,
+            expire_on_commit=False,
+        )
+        for old_engine in old_engines:
+            if old_engine is not None:
+                _dispose_later(old_engine)
+
+    def get_replica(self) -> Engine:
+        """
+        Round-robin over healthy replicas, falls back to the primary when all of them are down.
+        """
+        now = monotonic()
+        replicas_count = len(self.replica_engines)
+        for _ in range(replicas_count):
+            index = next(self.replica_counter) % replicas_count
+            if self.replica_down_until.get(index, 0) <= now:
+                return self.replica_engines[index].sync_engine
+        return self.engine.sync_engine
+
+    def mark_write(self, key: str | None) -> None:
+        """
+        Keeps reads of the client on the primary for DB_PRIMARY_STICKY_SECONDS in every worker process.
+        Writes are remembered in the process as well, it is all there is while the state redis is unavailable.
+        """
+        if key is None:
+            return
+        now = monotonic()
+        if len(self.last_writes) > 10000:
+            self.last_writes = {
+                k: write_time for k, write_time in self.last_writes.items() if now - write_time < self.sticky_seconds
+            }
+        self.last_writes[key] = now
+        try:
+            RedisManager().get_state_client().set(
+                STICKY_KEY_PREFIX + key, 1, px=max(int(self.sticky_seconds * 1000), 1),
+            )
+        except (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError):
+            pass
+
+    def is_sticky(self, session_info: dict, key: str | None) -> bool:
+        """
+        Whether reads of the session go to the primary: the session or the client has written recently.
+        Writes of other worker processes are looked up in the state redis once per session.
+        """
+        now = monotonic()
+        session_last_write = session_info.get("last_write")
+        if session_last_write is not None and now - session_last_write < self.sticky_seconds:
+            return True
+        if key is None:
+            return False
+        key_last_write = self.last_writes.get(key)
+        if key_last_write is not None and now - key_last_write < self.sticky_seconds:
+            return True
+        if "client_sticky" not in session_info:
+            try:
+                session_info["client_sticky"] = bool(RedisManager().get_state_client().exists(STICKY_KEY_PREFIX + key))
+            except (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError):
+                session_info["client_sticky"] = False
+        return session_info["client_sticky"]
+
+    def _watch_replica(self, index: int, replica: AsyncEngine) -> None:
+        @event.listens_for(replica.sync_engine, "handle_error")
+        def mark_replica_down(context) -> None:
+            if context.is_disconnect or context.connection is None \
+                    or isinstance(context.original_exception, OSError):
+                self.replica_down_until[index] = monotonic() + self.replica_retry_seconds
+
+    @staticmethod
+    def _create_engine(uri: str, settings: DefaultSettings) -> AsyncEngine:
+        return create_async_engine(
+            uri, echo=True, future=True, pool_size=settings.DB_POOL_SIZE, poolclass=TimedQueuePool,
+        )
+
+
+def _dispose_later(engine: AsyncEngine) -> None:
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        engine.sync_engine.dispose()
+        return
+    loop.create_task(engine.dispose())
+
+
+@on_settings_reload
+def _refresh_engine(settings: DefaultSettings) -> None:
+    if hasattr(SessionManager, "instance"):
+        SessionManager().refresh(settings)
 
 
 async def get_session() -> AsyncSession:
@@ -31,7 +197,18 @@ async def get_session() -> AsyncSession:
         yield session
 
 
+async def release_connection(session: AsyncSession) -> None:
+    """
+    Ends the current transaction, so the connection goes back to the pool before slow non-db work.
+    Loaded objects stay usable (expire_on_commit=False), the next statement checks out a connection again.
+    """
+    if session.in_transaction():
+        await session.commit()
+
+
 async def get_session_for_test() -> AsyncSession:
+    # every test runs in its own event loop, connections of the previous one can not be reused
+    SessionManager().engine.sync_engine.dispose(close=False)
     session_maker = SessionManager().get_session_maker()
     async with session_maker() as session:
         return session
@@ -39,6 +216,8 @@ async def get_session_for_test() -> AsyncSession:
 
 __all__ = [
     "get_session",
+    "set_sticky_key",
+    "release_connection",
     "SessionManager",
     "get_session_for_test",
 ]
@@ -0,0 +1,55 @@
+"""hot query indexes
+
+Revision ID: 2d8c5e7f1a90
+Revises: 9a4f61d2c8b3
+Create Date: 2026-10-19 16:20:54.913307
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '2d8c5e7f1a90'
+down_revision = '9a4f61d2c8b3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            op.f('ix__post__author_id'),
+            'post',
+            ['author_id'],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            op.f('ix__post_action__post_id_action'),
+            'post_action',
+            ['post_id', 'action'],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+        # nothing looks users up by the password hash
+        op.execute('DROP INDEX CONCURRENTLY IF EXISTS ix__user__password')
+        # duplicates the uq__user__username constraint
+        op.execute('DROP INDEX CONCURRENTLY IF EXISTS ix__user__username')
+    # primary keys are unique already, the constraints are missing on databases where they were not created
+    op.execute('ALTER TABLE "user" DROP CONSTRAINT IF EXISTS uq__user__id')
+    op.execute('ALTER TABLE post DROP CONSTRAINT IF EXISTS uq__post__id')
+
+
+def downgrade() -> None:
+    op.create_unique_constraint(op.f('uq__post__id'), 'post', ['id'])
+    op.create_unique_constraint(op.f('uq__user__id'), 'user', ['id'])
+    with op.get_context().autocommit_block():
+        op.create_index(
+            op.f('ix__user__username'), 'user', ['username'], unique=True, postgresql_concurrently=True,
+        )
+        op.create_index(
+            op.f('ix__user__password'), 'user', ['password'], unique=False, postgresql_concurrently=True,
+        )
+        op.drop_index(
+            op.f('ix__post_action__post_id_action'), table_name='post_action', postgresql_concurrently=True,
+        )
+        op.drop_index(op.f('ix__post__author_id'), table_name='post', postgresql_concurrently=True)
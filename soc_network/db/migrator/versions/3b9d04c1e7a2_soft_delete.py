@@ -0,0 +1,46 @@
+"""soft delete
+
+Revision ID: 3b9d04c1e7a2
+Revises: f94570d8e491
+Create Date: 2026-10-19 12:41:37.206415
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '3b9d04c1e7a2'
+down_revision = 'f94570d8e491'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('post', sa.Column('deleted_at', postgresql.TIMESTAMP(timezone=True), nullable=True))
+    op.add_column('user', sa.Column('deleted_at', postgresql.TIMESTAMP(timezone=True), nullable=True))
+    with op.get_context().autocommit_block():
+        op.create_index(
+            op.f('ix__post__deleted_at'),
+            'post',
+            ['deleted_at'],
+            unique=False,
+            postgresql_where=sa.text('deleted_at IS NOT NULL'),
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            op.f('ix__user__deleted_at'),
+            'user',
+            ['deleted_at'],
+            unique=False,
+            postgresql_where=sa.text('deleted_at IS NOT NULL'),
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(op.f('ix__user__deleted_at'), table_name='user', postgresql_concurrently=True)
+        op.drop_index(op.f('ix__post__deleted_at'), table_name='post', postgresql_concurrently=True)
+    op.drop_column('user', 'deleted_at')
+    op.drop_column('post', 'deleted_at')
@@ -0,0 +1,31 @@
+"""post body search
+
+Revision ID: 5e3725a890d5
+Revises: c7eed7141dac
+Create Date: 2026-10-19 11:20:04.118244
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '5e3725a890d5'
+down_revision = 'c7eed7141dac'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('post', sa.Column(
+        'body_tsv',
+        postgresql.TSVECTOR(),
+        sa.Computed("to_tsvector('simple'::regconfig, body)", persisted=True),
+        nullable=True,
+    ))
+    op.create_index(op.f('ix__post__body_tsv'), 'post', ['body_tsv'], unique=False, postgresql_using='gin')
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix__post__body_tsv'), table_name='post')
+    op.drop_column('post', 'body_tsv')
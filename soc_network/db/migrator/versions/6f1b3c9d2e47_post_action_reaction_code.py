@@ -0,0 +1,66 @@
+"""post action reaction code
+
+Revision ID: 6f1b3c9d2e47
+Revises: 2d8c5e7f1a90
+Create Date: 2026-10-19 17:05:38.120946
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '6f1b3c9d2e47'
+down_revision = '2d8c5e7f1a90'
+branch_labels = None
+depends_on = None
+
+
+def create_constraints(key_columns: list[str], kind_column: str) -> None:
+    op.create_primary_key(op.f('pk__post_action'), 'post_action', key_columns)
+    op.create_foreign_key(op.f('fk__post_action__post_id__post'), 'post_action', 'post', ['post_id'], ['id'])
+    op.create_foreign_key(op.f('fk__post_action__user_id__user'), 'post_action', 'user', ['user_id'], ['id'])
+    op.create_index(op.f('ix__post_action__user_id_dt_created'), 'post_action', ['user_id', 'dt_created'])
+    op.create_index(op.f(f'ix__post_action__post_id_{kind_column}'), 'post_action', ['post_id', kind_column])
+
+
+def upgrade() -> None:
+    # the table is copied rather than altered, so it does not keep the dropped TEXT column and dead rows;
+    # writes wait for the copy, reads go on until the swap
+    op.execute('LOCK TABLE post_action IN EXCLUSIVE MODE')
+    op.create_table('post_action_new',
+    sa.Column('user_id', postgresql.UUID(as_uuid=True), nullable=False),
+    sa.Column('post_id', postgresql.UUID(as_uuid=True), nullable=False),
+    sa.Column('reaction', sa.SMALLINT(), nullable=False),
+    sa.Column('dt_created', postgresql.TIMESTAMP(timezone=True), server_default=sa.text('CURRENT_TIMESTAMP'), nullable=False),
+    )
+    # codes of the REACTIONS setting, a user keeps only the latest of the reactions to a post
+    op.execute(
+        "INSERT INTO post_action_new (user_id, post_id, reaction, dt_created) "
+        "SELECT DISTINCT ON (user_id, post_id) user_id, post_id, "
+        "CASE action WHEN 'LIKE' THEN 1 WHEN 'DISLIKE' THEN 2 END, dt_created "
+        "FROM post_action WHERE action IN ('LIKE', 'DISLIKE') "
+        "ORDER BY user_id, post_id, dt_created DESC"
+    )
+    op.drop_table('post_action')
+    op.rename_table('post_action_new', 'post_action')
+    create_constraints(['user_id', 'post_id'], 'reaction')
+
+
+def downgrade() -> None:
+    op.execute('LOCK TABLE post_action IN EXCLUSIVE MODE')
+    op.create_table('post_action_old',
+    sa.Column('user_id', postgresql.UUID(as_uuid=True), nullable=False),
+    sa.Column('post_id', postgresql.UUID(as_uuid=True), nullable=False),
+    sa.Column('action', sa.TEXT(), nullable=False),
+    sa.Column('dt_created', postgresql.TIMESTAMP(timezone=True), server_default=sa.text('CURRENT_TIMESTAMP'), nullable=False),
+    )
+    # reactions other than like and dislike did not exist before
+    op.execute(
+        "INSERT INTO post_action_old (user_id, post_id, action, dt_created) "
+        "SELECT user_id, post_id, CASE reaction WHEN 1 THEN 'LIKE' ELSE 'DISLIKE' END, dt_created "
+        "FROM post_action WHERE reaction IN (1, 2)"
+    )
+    op.drop_table('post_action')
+    op.rename_table('post_action_old', 'post_action')
+    create_constraints(['user_id', 'post_id', 'action'], 'action')
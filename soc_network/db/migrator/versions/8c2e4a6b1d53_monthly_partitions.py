@@ -0,0 +1,126 @@
+"""monthly partitions
+
+Revision ID: 8c2e4a6b1d53
+Revises: 6f1b3c9d2e47
+Create Date: 2026-10-19 18:12:40.503217
+
+"""
+from datetime import date, datetime, timezone
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from soc_network.db.uuid7 import uuid7_min
+
+# revision identifiers, used by Alembic.
+revision = '8c2e4a6b1d53'
+down_revision = '6f1b3c9d2e47'
+branch_labels = None
+depends_on = None
+
+# months created together with the tables, the following ones are added by the partition maintenance
+MONTHS_AHEAD = 3
+
+# time-ordered ids for raw sql inserts: unix milliseconds over the first 48 bits of a random id,
+# version bits turned from 4 to 7
+UUID_GENERATE_V7 = """
+CREATE OR REPLACE FUNCTION uuid_generate_v7() RETURNS uuid AS $$
+    SELECT encode(set_bit(set_bit(overlay(uuid_send(gen_random_uuid())
+        PLACING substring(int8send(floor(extract(epoch FROM clock_timestamp()) * 1000)::bigint) FROM 3)
+        FROM 1 FOR 6), 52, 1), 53, 1), 'hex')::uuid
+$$ LANGUAGE sql VOLATILE
+"""
+
+POST_COLUMNS = 'id, dt_created, dt_updated, body, author_id, deleted_at'
+POST_ACTION_COLUMNS = 'user_id, post_id, reaction, dt_created'
+
+
+def month_bound(month: date) -> str:
+    return str(uuid7_min(datetime(month.year, month.month, 1, tzinfo=timezone.utc)))
+
+
+def create_partitions(table: str, parent: str) -> None:
+    now = datetime.now(timezone.utc)
+    months = []
+    for i in range(MONTHS_AHEAD + 2):
+        year, month = divmod(now.month - 1 + i, 12)
+        months.append(date(now.year + year, month + 1, 1))
+    for month, next_month in zip(months, months[1:]):
+        op.execute(
+            f"CREATE TABLE {table}_p{month:%Y_%m} PARTITION OF {parent} "
+            f"FOR VALUES FROM ('{month_bound(month)}') TO ('{month_bound(next_month)}')"
+        )
+    # random ids of the rows created before and ids of months without a partition
+    op.execute(f"CREATE TABLE {table}_legacy PARTITION OF {parent} DEFAULT")
+
+
+def create_post_tables(post_table: str, post_action_table: str, id_default: str, partitioned: bool) -> None:
+    op.create_table(post_table,
+    sa.Column('id', postgresql.UUID(as_uuid=True), server_default=sa.text(id_default), nullable=False),
+    sa.Column('dt_created', postgresql.TIMESTAMP(timezone=True), server_default=sa.text('CURRENT_TIMESTAMP'), nullable=False),
+    sa.Column('dt_updated', postgresql.TIMESTAMP(timezone=True), server_default=sa.text('CURRENT_TIMESTAMP'), nullable=False),
+    sa.Column('body', sa.TEXT(), nullable=False),
+    sa.Column('author_id', postgresql.UUID(as_uuid=True), nullable=False),
+    sa.Column('body_tsv', postgresql.TSVECTOR(), sa.Computed("to_tsvector('simple'::regconfig, body)", persisted=True), nullable=True),
+    sa.Column('deleted_at', postgresql.TIMESTAMP(timezone=True), nullable=True),
+    **({'postgresql_partition_by': 'RANGE (id)'} if partitioned else {}),
+    )
+    op.create_table(post_action_table,
+    sa.Column('user_id', postgresql.UUID(as_uuid=True), nullable=False),
+    sa.Column('post_id', postgresql.UUID(as_uuid=True), nullable=False),
+    sa.Column('reaction', sa.SMALLINT(), nullable=False),
+    sa.Column('dt_created', postgresql.TIMESTAMP(timezone=True), server_default=sa.text('CURRENT_TIMESTAMP'), nullable=False),
+    **({'postgresql_partition_by': 'RANGE (post_id)'} if partitioned else {}),
+    )
+
+
+def create_constraints(author_fk_name: str) -> None:
+    # created on the filled tables, indexes of partitioned tables are built on every partition
+    op.create_primary_key(op.f('pk__post'), 'post', ['id'])
+    op.create_foreign_key(author_fk_name, 'post', 'user', ['author_id'], ['id'])
+    op.create_index(op.f('ix__post__author_id'), 'post', ['author_id'])
+    op.create_index(op.f('ix__post__body_tsv'), 'post', ['body_tsv'], postgresql_using='gin')
+    op.create_index(
+        op.f('ix__post__deleted_at'), 'post', ['deleted_at'], postgresql_where=sa.text('deleted_at IS NOT NULL'),
+    )
+    op.create_primary_key(op.f('pk__post_action'), 'post_action', ['user_id', 'post_id'])
+    op.create_foreign_key(op.f('fk__post_action__post_id__post'), 'post_action', 'post', ['post_id'], ['id'])
+    op.create_foreign_key(op.f('fk__post_action__user_id__user'), 'post_action', 'user', ['user_id'], ['id'])
+    op.create_index(op.f('ix__post_action__user_id_dt_created'), 'post_action', ['user_id', 'dt_created'])
+    op.create_index(op.f('ix__post_action__post_id_reaction'), 'post_action', ['post_id', 'reaction'])
+
+
+def swap_post_tables(post_table: str, post_action_table: str) -> None:
+    op.execute(f'INSERT INTO {post_table} ({POST_COLUMNS}) SELECT {POST_COLUMNS} FROM post')
+    op.execute(
+        f'INSERT INTO {post_action_table} ({POST_ACTION_COLUMNS}) SELECT {POST_ACTION_COLUMNS} FROM post_action'
+    )
+    op.drop_table('post_action')
+    op.drop_table('post')
+    op.rename_table(post_table, 'post')
+    op.rename_table(post_action_table, 'post_action')
+
+
+def upgrade() -> None:
+    op.execute(UUID_GENERATE_V7)
+    # posts and reactions are partitioned by the month of the post id, reactions go with their post;
+    # writes wait for the copy, reads go on until the swap
+    op.execute('LOCK TABLE post, post_action IN EXCLUSIVE MODE')
+    create_post_tables('post_new', 'post_action_new', 'uuid_generate_v7()', partitioned=True)
+    create_partitions('post', 'post_new')
+    create_partitions('post_action', 'post_action_new')
+    swap_post_tables('post_new', 'post_action_new')
+    create_constraints(op.f('fk__post__author_id__user'))
+    op.alter_column('user', 'id', server_default=sa.text('uuid_generate_v7()'))
+    op.execute('ANALYZE post, post_action')
+
+
+def downgrade() -> None:
+    # rows of detached and archived partitions are not brought back
+    op.execute('LOCK TABLE post, post_action IN EXCLUSIVE MODE')
+    create_post_tables('post_old', 'post_action_old', 'gen_random_uuid()', partitioned=False)
+    swap_post_tables('post_old', 'post_action_old')
+    create_constraints('fk__post__author__user')
+    op.alter_column('user', 'id', server_default=sa.text('gen_random_uuid()'))
+    op.execute('DROP FUNCTION uuid_generate_v7()')
@@ -0,0 +1,101 @@
+"""user profile
+
+Revision ID: 9a4f61d2c8b3
+Revises: 3b9d04c1e7a2
+Create Date: 2026-10-19 15:02:11.480273
+
+"""
+import ast
+import json
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '9a4f61d2c8b3'
+down_revision = '3b9d04c1e7a2'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+
+user_table = sa.table(
+    'user',
+    sa.column('id', postgresql.UUID(as_uuid=True)),
+    sa.column('data', sa.TEXT()),
+)
+user_profile_table = sa.table(
+    'user_profile',
+    sa.column('user_id', postgresql.UUID(as_uuid=True)),
+    sa.column('full_name', sa.TEXT()),
+    sa.column('location', sa.TEXT()),
+    sa.column('company', sa.TEXT()),
+    sa.column('title', sa.TEXT()),
+    sa.column('data', postgresql.JSONB()),
+)
+
+
+def parse_data(data: str) -> dict | None:
+    # the response was saved as str(dict), not as json
+    try:
+        parsed = ast.literal_eval(data)
+    except (ValueError, SyntaxError):
+        try:
+            parsed = json.loads(data)
+        except ValueError:
+            return None
+    return parsed if isinstance(parsed, dict) else None
+
+
+def upgrade() -> None:
+    op.create_table('user_profile',
+    sa.Column('user_id', postgresql.UUID(as_uuid=True), nullable=False),
+    sa.Column('full_name', sa.TEXT(), nullable=True),
+    sa.Column('location', sa.TEXT(), nullable=True),
+    sa.Column('company', sa.TEXT(), nullable=True),
+    sa.Column('title', sa.TEXT(), nullable=True),
+    sa.Column('data', postgresql.JSONB(), nullable=False),
+    sa.Column('dt_updated', postgresql.TIMESTAMP(timezone=True), server_default=sa.text('CURRENT_TIMESTAMP'), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], name=op.f('fk__user_profile__user_id__user'), ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id', name=op.f('pk__user_profile'))
+    )
+
+    connection = op.get_bind()
+    last_id = None
+    while True:
+        query = sa.select(user_table.c.id, user_table.c.data).where(user_table.c.data.is_not(None))
+        if last_id is not None:
+            query = query.where(user_table.c.id > last_id)
+        rows = connection.execute(query.order_by(user_table.c.id).limit(BATCH_SIZE)).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        profiles = []
+        for row in rows:
+            data = parse_data(row.data)
+            if data is None:
+                continue
+            name = data.get('name') or {}
+            employment = data.get('employment') or {}
+            profiles.append({
+                'user_id': row.id,
+                'full_name': name.get('fullName'),
+                'location': data.get('location'),
+                'company': employment.get('name'),
+                'title': employment.get('title'),
+                'data': data,
+            })
+        if profiles:
+            connection.execute(user_profile_table.insert(), profiles)
+
+    op.drop_column('user', 'data')
+
+
+def downgrade() -> None:
+    op.add_column('user', sa.Column('data', sa.TEXT(), nullable=True))
+    op.execute(
+        'UPDATE "user" SET data = user_profile.data::text '
+        'FROM user_profile WHERE user_profile.user_id = "user".id'
+    )
+    op.drop_table('user_profile')
@@ -0,0 +1,44 @@
+"""post action dt_created
+
+Revision ID: f94570d8e491
+Revises: 5e3725a890d5
+Create Date: 2026-10-19 11:58:12.503108
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = 'f94570d8e491'
+down_revision = '5e3725a890d5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # constant default, existing rows are not rewritten
+    op.add_column('post_action', sa.Column(
+        'dt_created',
+        postgresql.TIMESTAMP(timezone=True),
+        server_default=sa.text('CURRENT_TIMESTAMP'),
+        nullable=False,
+    ))
+    with op.get_context().autocommit_block():
+        op.create_index(
+            op.f('ix__post_action__user_id_dt_created'),
+            'post_action',
+            ['user_id', 'dt_created'],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            op.f('ix__post_action__user_id_dt_created'),
+            table_name='post_action',
+            postgresql_concurrently=True,
+        )
+    op.drop_column('post_action', 'dt_created')
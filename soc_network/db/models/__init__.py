@@ -1,10 +1,12 @@
 from .action import PostAction
 from .post import Post
 from .user import User
+from .user_profile import UserProfile
 
 
 __all__ = [
     "PostAction",
     "Post",
     "User",
+    "UserProfile",
 ]
@@ -1,11 +1,48 @@
-from sqlalchemy import Column, ForeignKey
-from sqlalchemy.dialects.postgresql import TEXT
+import logging
 
+from sqlalchemy import Column, ForeignKey, Index
+from sqlalchemy.dialects.postgresql import SMALLINT, TIMESTAMP
+from sqlalchemy.sql import func
+
+from soc_network.config import get_settings
 from soc_network.db import DeclarativeBase
 
+logger = logging.getLogger(__name__)
+
+# codes found in post_action.reaction that are missing from the REACTIONS setting, logged once
+_unknown_codes: set[int] = set()
+
+
+def reaction_code(action: str) -> int:
+    return get_settings().REACTIONS[action]
+
+
+def reaction_name(code: int) -> str | None:
+    """
+    Name of the reaction code, None when the code was removed from the REACTIONS setting.
+    Readers skip such reactions, they are kept in the table until the code is configured again.
+    """
+    for name, reaction in get_settings().REACTIONS.items():
+        if reaction == code:
+            return name
+    if code not in _unknown_codes:
+        _unknown_codes.add(code)
+        logger.warning(f"Reaction code {code} is not in the REACTIONS setting, reactions with it are skipped.")
+    return None
+
 
 class PostAction(DeclarativeBase):
+    """
+    Reaction of the user to the post, a user has at most one reaction to a post.
+    """
     __tablename__ = "post_action"
+    __table_args__ = (
+        Index("ix__post_action__user_id_dt_created", "user_id", "dt_created"),
+        # reactions of the post by kind: cache fill, engagement counts, purge and the post foreign key checks
+        Index("ix__post_action__post_id_reaction", "post_id", "reaction"),
+        # partitioned as the posts, reactions of a post are in the partition of the post
+        {"postgresql_partition_by": "RANGE (post_id)"},
+    )
 
     user_id = Column(
         "user_id",
@@ -19,9 +56,20 @@ class PostAction(DeclarativeBase):
         primary_key=True,
         doc="Identifier of the post user liked.",
     )
-    action = Column(
-        "action",
-        TEXT,
-        primary_key=True,
-        doc="Describes the user's action in relation to the publication.",
+    reaction = Column(
+        "reaction",
+        SMALLINT,
+        nullable=False,
+        doc="Code of the user's reaction to the publication, see REACTIONS setting.",
     )
+    dt_created = Column(
+        "dt_created",
+        TIMESTAMP(timezone=True),
+        server_default=func.current_timestamp(),
+        nullable=False,
+        doc="Date and time of the action.",
+    )
+
+    @property
+    def action(self) -> str | None:
+        return reaction_name(self.reaction)
@@ -3,6 +3,7 @@ from sqlalchemy.dialects.postgresql import TIMESTAMP, UUID
 from sqlalchemy.sql import func
 
 from soc_network.db import DeclarativeBase
+from soc_network.db.uuid7 import uuid7
 
 
 class BaseTable(DeclarativeBase):
@@ -11,8 +12,10 @@ class BaseTable(DeclarativeBase):
     id = Column(
         UUID(as_uuid=True),
         primary_key=True,
-        server_default=func.gen_random_uuid(),
-        unique=True,
+        # time-ordered ids keep inserts at the right edge of the index and pick the monthly partition,
+        # the server default is for raw sql
+        default=uuid7,
+        server_default=func.uuid_generate_v7(),
         doc="Unique index of element (type UUID)",
     )
     dt_created = Column(
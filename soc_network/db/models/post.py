@@ -1,11 +1,25 @@
-from sqlalchemy import Column, ForeignKey
-from sqlalchemy.dialects.postgresql import TEXT
+from sqlalchemy import Column, Computed, ForeignKey, Index, text
+from sqlalchemy.dialects.postgresql import TEXT, TIMESTAMP, TSVECTOR
+from sqlalchemy.orm import deferred
 
 from .base import BaseTable
 
 
+# text search configuration of `body_tsv`, queries must use the same one to hit the index
+SEARCH_CONFIG = "simple"
+
+
 class Post(BaseTable):
     __tablename__ = "post"
+    __table_args__ = (
+        Index("ix__post__body_tsv", "body_tsv", postgresql_using="gin"),
+        # posts of the author: search filter, purge of deleted users and the user foreign key checks
+        Index("ix__post__author_id", "author_id"),
+        # only tombstones waiting for the purge are indexed
+        Index("ix__post__deleted_at", "deleted_at", postgresql_where=text("deleted_at IS NOT NULL")),
+        # monthly partitions by the time-ordered id, see PartitionRepository
+        {"postgresql_partition_by": "RANGE (id)"},
+    )
 
     body = Column(
         "body",
@@ -19,3 +33,15 @@ class Post(BaseTable):
         nullable=False,
         doc="Post author.",
     )
+    body_tsv = deferred(Column(
+        "body_tsv",
+        TSVECTOR,
+        Computed(f"to_tsvector('{SEARCH_CONFIG}'::regconfig, body)", persisted=True),
+        doc="Search vector of the post body.",
+    ))
+    deleted_at = Column(
+        "deleted_at",
+        TIMESTAMP(timezone=True),
+        nullable=True,
+        doc="Date and time of delete, the post is purged in background.",
+    )
@@ -1,25 +1,27 @@
-from sqlalchemy import Column
-from sqlalchemy.dialects.postgresql import TEXT
+from sqlalchemy import Column, Index, text
+from sqlalchemy.dialects.postgresql import TEXT, TIMESTAMP
 
 from .base import BaseTable
 
 
 class User(BaseTable):
     __tablename__ = "user"
+    __table_args__ = (
+        # only tombstones waiting for the purge are indexed
+        Index("ix__user__deleted_at", "deleted_at", postgresql_where=text("deleted_at IS NOT NULL")),
+    )
 
     username = Column(
         "username",
         TEXT,
         nullable=False,
         unique=True,
-        index=True,
         doc="Username for authentication.",
     )
     password = Column(
         "password",
         TEXT,
         nullable=False,
-        index=True,
         doc="Hashed password.",
     )
     email = Column(
@@ -30,9 +32,9 @@ class User(BaseTable):
         unique=True,
         doc="User email.",
     )
-    data = Column(
-        "data",
-        TEXT,
+    deleted_at = Column(
+        "deleted_at",
+        TIMESTAMP(timezone=True),
         nullable=True,
-        doc="Additional user data from Clearbit in json.",
+        doc="Date and time of delete, the user is purged in background.",
     )
@@ -0,0 +1,71 @@
+from sqlalchemy import Column, ForeignKey
+from sqlalchemy.dialects.postgresql import JSONB, TEXT, TIMESTAMP
+from sqlalchemy.sql import func
+
+from soc_network.db import DeclarativeBase
+
+
+class UserProfile(DeclarativeBase):
+    """
+    Additional user data from Clearbit, kept apart from the user row used for authentication.
+    """
+    __tablename__ = "user_profile"
+
+    user_id = Column(
+        "user_id",
+        ForeignKey("user.id", ondelete="CASCADE"),
+        primary_key=True,
+        doc="Identifier of the user.",
+    )
+    full_name = Column(
+        "full_name",
+        TEXT,
+        nullable=True,
+        doc="Full name of the user.",
+    )
+    location = Column(
+        "location",
+        TEXT,
+        nullable=True,
+        doc="Location of the user.",
+    )
+    company = Column(
+        "company",
+        TEXT,
+        nullable=True,
+        doc="Name of the company the user works for.",
+    )
+    title = Column(
+        "title",
+        TEXT,
+        nullable=True,
+        doc="Job title of the user.",
+    )
+    data = Column(
+        "data",
+        JSONB,
+        nullable=False,
+        doc="Whole Clearbit response.",
+    )
+    dt_updated = Column(
+        "dt_updated",
+        TIMESTAMP(timezone=True),
+        server_default=func.current_timestamp(),
+        onupdate=func.current_timestamp(),
+        nullable=False,
+        doc="Date and time of the last enrichment.",
+    )
+
+    @staticmethod
+    def promoted_fields(data: dict) -> dict:
+        """
+        Picks the queried fields out of the Clearbit person response.
+        """
+        name = data.get("name") or {}
+        employment = data.get("employment") or {}
+        return {
+            "full_name": name.get("fullName"),
+            "location": data.get("location"),
+            "company": employment.get("name"),
+            "title": employment.get("title"),
+        }
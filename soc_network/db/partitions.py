@@ -0,0 +1,61 @@
+"""
+Monthly partitions of post and post_action, the application creates and archives them in background too.
+
+    python3 -m soc_network.db.partitions list               # attached partitions and their size
+    python3 -m soc_network.db.partitions create 2027-01     # partitions of the month, its legacy rows are moved in
+    python3 -m soc_network.db.partitions detach 2025-01     # post_p2025_01 and post_action_p2025_01 become plain tables
+    python3 -m soc_network.db.partitions archive 2025-01    # gzip csv files in PARTITION_ARCHIVE_DIR, tables dropped
+    python3 -m soc_network.db.partitions restore 2025-01    # loads the archive files and attaches the month back
+"""
+import argparse
+import asyncio
+from datetime import date, datetime
+from pathlib import Path
+
+from soc_network.config import get_settings
+from soc_network.db.connection import SessionManager
+from soc_network.repositories import PartitionRepository, exceptions as db_exc
+
+
+def parse_month(value: str) -> date:
+    return datetime.strptime(value, "%Y-%m").date()
+
+
+async def run(args: argparse.Namespace):
+    session_maker = SessionManager().get_session_maker()
+    async with session_maker() as session:
+        partition_repo = PartitionRepository(session)
+        if args.command == "list":
+            for table, partition, size in await partition_repo.list_partitions():
+                print(f"{table:12} {partition:28} {size / 2 ** 20:10.1f} MiB")
+        elif args.command == "create":
+            created = await partition_repo.create_month(args.month)
+            print(f"{args.month:%Y-%m} {'created' if created else 'exists already'}")
+        elif args.command == "detach":
+            await partition_repo.detach_month(args.month)
+            print(f"{args.month:%Y-%m} detached")
+        elif args.command == "archive":
+            for path in await partition_repo.archive_month(args.month, args.dir):
+                print(path)
+        elif args.command == "restore":
+            await partition_repo.restore_month(args.month, args.dir)
+            print(f"{args.month:%Y-%m} restored")
+    await SessionManager().engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["list", "create", "detach", "archive", "restore"])
+    parser.add_argument("month", type=parse_month, nargs="?", help="YYYY-MM, required by all but list")
+    parser.add_argument("--dir", type=Path, default=Path(get_settings().PARTITION_ARCHIVE_DIR))
+    args = parser.parse_args()
+    if args.command != "list" and args.month is None:
+        parser.error(f"{args.command} needs the month")
+    try:
+        asyncio.run(run(args))
+    except (db_exc.DbError, db_exc.ArchiveError) as error:
+        raise SystemExit(str(error))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,21 @@
 from .action_repository import PostActionRepository
+from .cache_stats_repository import CacheStatsRepository
+from .partition_repository import PartitionRepository
 from .post_repository import PostRepository
+from .refresh_token_repository import RefreshTokenRepository
+from .revocation_repository import RevocationRepository
+from .trending_repository import TrendingRepository
 from .user_repository import UserRepository
 from . import exceptions
 
 __all__ = [
+    "CacheStatsRepository",
+    "PartitionRepository",
     "PostActionRepository",
     "PostRepository",
+    "RefreshTokenRepository",
+    "RevocationRepository",
+    "TrendingRepository",
     "UserRepository",
     "exceptions",
 ]
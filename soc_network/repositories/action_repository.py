@@ -1,109 +1,284 @@
-import json
+from collections import Counter
+from datetime import datetime
 from types import NoneType
+from typing import AsyncIterator
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, delete, and_, exc
+from sqlalchemy import select, delete, update, exc, func, tuple_
 from uuid import UUID
 import redis
 from redis import Redis
 
-from soc_network.db.models import PostAction
-from soc_network.schemas import PostActionEnum, PostAction as PostActionSchema
+from soc_network.config import get_settings
+from soc_network.db.models import Post, PostAction
+from soc_network.db.models.action import reaction_code, reaction_name
+from soc_network.schemas import PostAction as PostActionSchema
 from . import exceptions as custom_exc
+from .local_cache import LocalCache
+from .single_flight import SingleFlight
+
+
+# field set in both reaction hashes of a post once they are filled from the db, so an empty post is cached too
+FILLED_FIELD = "_"
+
+# moves the user to the new reaction (empty ARGV[2] removes it) in the cached hashes of the post
+# and extends their lifetime to ARGV[3] seconds;
+# the hashes are filled from the db as a whole, when one of them is missing (expired, evicted) both are dropped;
+# the generation of the post (KEYS[3]) is bumped in any case, a fill that started before it is not stored
+SET_REACTION_SCRIPT = """
+redis.call('INCR', KEYS[3])
+redis.call('EXPIRE', KEYS[3], ARGV[3])
+if redis.call('EXISTS', KEYS[1]) == 0 or redis.call('EXISTS', KEYS[2]) == 0 then
+    redis.call('DEL', KEYS[1], KEYS[2])
+    return 0
+end
+local old = redis.call('HGET', KEYS[1], ARGV[1])
+if old then
+    if tonumber(redis.call('HINCRBY', KEYS[2], old, -1)) <= 0 then
+        redis.call('HDEL', KEYS[2], old)
+    end
+end
+if ARGV[2] == '' then
+    redis.call('HDEL', KEYS[1], ARGV[1])
+else
+    redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+    redis.call('HINCRBY', KEYS[2], ARGV[2], 1)
+end
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+return 1
+"""
 
 
 class PostActionRepository:
+    """
+    Reactions of users to posts. Every post is cached in two redis hashes:
+    `post_action:<post id>:users` (user id bytes: reaction code) and `post_action:<post id>:counts`
+    (reaction code: count). Both live REACTION_CACHE_TTL_SECONDS since the last read or write of the post and
+    are filled again from the db when they expire or redis evicts them. Writers bump
+    `post_action:<post id>:generation` after commit, a fill is stored only if the generation has not changed
+    since before its query, otherwise it may miss the write.
+    Reactions read from the users hash are kept in the local cache of the process under the same key.
+    """
+
     def __init__(self, session: AsyncSession, redis_sess: Redis = None):
         self.session = session
-        try:
-            redis_sess.ping()
-            self.redis = redis_sess
-        except redis.exceptions.ConnectionError:
-            self.redis = None
+        self.redis = None
+        if redis_sess is not None:
+            try:
+                redis_sess.ping()
+                self.redis = redis_sess
+            except (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError):
+                pass
 
     async def add(self, user_id: UUID, post_id: UUID, action: str):
-        if self.redis:
-            redis_key = str(post_id) + action
-            self.redis.sadd(redis_key, PostActionSchema(user_id=user_id, post_id=post_id, action=action).json())
-
-        new_post_action = PostAction(user_id=user_id, post_id=post_id, action=action)
+        new_post_action = PostAction(user_id=user_id, post_id=post_id, reaction=reaction_code(action))
         self.session.add(new_post_action)
         try:
             await self.session.commit()
         except exc.IntegrityError:
+            await self.session.rollback()
             raise custom_exc.DbError('This post action already exists.')
         except OSError:
             raise custom_exc.DbUnavailable(code=500, message='Database unavailable.')
-        await self.session.refresh(new_post_action)
+        self._cache_reaction(post_id, user_id, action)
+
+    async def change(self, user_id: UUID, post_id: UUID, action: str) -> tuple[str | None, datetime]:
+        """
+        Replaces the existing reaction of the user to the post.
+        Returns the replaced reaction (None when its code is not configured) and the time it was put.
+        """
+        replaced_post_act_query = (
+            select(PostAction.reaction, PostAction.dt_created)
+            .where(PostAction.user_id == user_id, PostAction.post_id == post_id)
+            .with_for_update()
+        )
+        change_post_act_query = (
+            update(PostAction)
+            .where(PostAction.user_id == user_id, PostAction.post_id == post_id)
+            .values(reaction=reaction_code(action), dt_created=func.current_timestamp())
+        )
+        try:
+            replaced = (await self.session.execute(replaced_post_act_query)).first()
+            if replaced is not None:
+                await self.session.execute(change_post_act_query)
+            await self.session.commit()
+        except OSError:
+            raise custom_exc.DbUnavailable(code=500, message='Database unavailable.')
+        if replaced is None:
+            raise custom_exc.DbError('No post action to change.')
+        self._cache_reaction(post_id, user_id, action)
+        return reaction_name(replaced.reaction), replaced.dt_created
 
     async def list_by_post_id(self, post_id: UUID) -> list:
-        post_acts = []
         if self.redis:
-            redis_key_like = str(post_id) + PostActionEnum.LIKE.value
-            redis_key_dislike = str(post_id) + PostActionEnum.DISLIKE.value
-            redis_key_like_exist = self.cache_key_exists(redis_key_like)
-            redis_key_dislike_exist = self.cache_key_exists(redis_key_dislike)
-            if redis_key_like_exist:
-                post_likes_from_redis = self.redis.smembers(redis_key_like)
-                post_acts.extend(
-                    [PostActionSchema(**json.loads(post_act_json)) for post_act_json in post_likes_from_redis])
-            if redis_key_dislike_exist:
-                post_dislikes_from_redis = self.redis.smembers(redis_key_dislike)
-                post_acts.extend(
-                    [PostActionSchema(**json.loads(post_act_json)) for post_act_json in post_dislikes_from_redis])
-            if redis_key_like_exist and redis_key_dislike_exist:
-                return post_acts
-
-            # Upload missing keys from db, and add this keys to redis
-            likes_from_db = []
-            dislikes_from_db = []
-            if not redis_key_like_exist:
-                likes_from_db = await self.list_by_post_id_action(post_id=post_id, action=PostActionEnum.LIKE.value)
-            if not redis_key_dislike_exist:
-                dislikes_from_db = await self.list_by_post_id_action(post_id=post_id, action=PostActionEnum.DISLIKE.value)
-            post_acts.extend(likes_from_db + dislikes_from_db)
-            return post_acts
+            return [
+                PostActionSchema(user_id=user_id, post_id=post_id, action=reaction_name(code))
+                for user_id, code in (await self._get_cached_reactions(post_id)).items()
+                if reaction_name(code) is not None
+            ]
         else:
             list_post_action_query = select(PostAction).where(PostAction.post_id == post_id)
             try:
                 post_actions_from_db = [post_act for post_act in await self.session.scalars(list_post_action_query)]
             except OSError:
                 raise custom_exc.DbUnavailable(code=500, message='Database unavailable.')
-            if len(post_actions_from_db) == 0:
-                return []
-            return post_actions_from_db
+            return [post_act for post_act in post_actions_from_db if post_act.action is not None]
 
     async def list_by_post_id_action(self, post_id: UUID, action: str) -> list:
-        post_acts = []
+        code = reaction_code(action)
         if self.redis:
-            redis_key_action = str(post_id) + action
-            if self.cache_key_exists(redis_key_action):
-                post_actions_from_redis = self.redis.smembers(redis_key_action)
-                post_acts.extend(
-                    [PostActionSchema(**json.loads(post_act_json)) for post_act_json in post_actions_from_redis])
-            else:
-                list_post_action_query = select(PostAction).where(PostAction.post_id == post_id,
-                                                                  PostAction.action == action)
-                try:
-                    post_actions_from_db = [post_act for post_act in await self.session.scalars(list_post_action_query)]
-                except OSError:
-                    raise custom_exc.DbUnavailable(code=500, message='Database unavailable.')
-                if len(post_actions_from_db) == 0:
-                    # todo: add key to redis with empty set
-                    return []
-
-                self.redis.sadd(redis_key_action,
-                                *[PostActionSchema.from_orm(post_act).json() for post_act in post_actions_from_db])
-                return post_actions_from_db
+            return [
+                PostActionSchema(user_id=user_id, post_id=post_id, action=action)
+                for user_id, user_code in (await self._get_cached_reactions(post_id)).items()
+                if user_code == code
+            ]
         else:
             list_post_action_query = select(PostAction).where(PostAction.post_id == post_id,
-                                                              PostAction.action == action)
+                                                              PostAction.reaction == code)
             try:
-                post_actions_from_db = [post_act for post_act in await self.session.scalars(list_post_action_query)]
+                return [post_act for post_act in await self.session.scalars(list_post_action_query)]
             except OSError:
                 raise custom_exc.DbUnavailable(code=500, message='Database unavailable.')
-            return post_actions_from_db
+
+    async def _get_cached_reactions(self, post_id: UUID) -> dict[UUID, int]:
+        local_cache = LocalCache()
+        reactions = local_cache.get(self._users_key(post_id))
+        if reactions is not None:
+            return reactions
+        stamp = local_cache.stamp()
+        reactions = self._read_cached(post_id)
+        if reactions is None:
+            # concurrent misses of the same post wait for a single db query
+            reactions = await SingleFlight(self.redis).do(
+                self._users_key(post_id),
+                fill=lambda: self._fill_cache(post_id),
+                read_cached=lambda: self._read_cached(post_id),
+            )
+        local_cache.set(self._users_key(post_id), reactions, stamp)
+        return reactions
+
+    async def _select_by_post_id(self, post_id: UUID) -> list[tuple[UUID, int]]:
+        # fills the cache: a lagging replica would miss a write whose generation bump the filler has already seen
+        list_post_action_query = (
+            select(PostAction.user_id, PostAction.reaction)
+            .where(PostAction.post_id == post_id)
+            .execution_options(use_primary=True)
+        )
+        try:
+            return [tuple(row) for row in await self.session.execute(list_post_action_query)]
+        except OSError:
+            raise custom_exc.DbUnavailable(code=500, message='Database unavailable.')
+
+    async def _fill_cache(self, post_id: UUID) -> dict[UUID, int]:
+        generation_key = self._generation_key(post_id)
+        generation = self.redis.get(generation_key)
+        reactions = dict(await self._select_by_post_id(post_id))
+        users_key, counts_key = self._users_key(post_id), self._counts_key(post_id)
+        try:
+            with self.redis.pipeline() as pipeline:
+                pipeline.watch(generation_key)
+                if pipeline.get(generation_key) != generation:
+                    # a reaction was written meanwhile, the next read fills the cache
+                    return reactions
+                # both hashes appear at once, the reaction script never sees only one of them
+                pipeline.multi()
+                pipeline.delete(users_key, counts_key)
+                pipeline.hset(users_key, mapping={
+                    FILLED_FIELD: 1, **{user_id.bytes: code for user_id, code in reactions.items()},
+                })
+                pipeline.hset(counts_key, mapping={FILLED_FIELD: 1, **Counter(reactions.values())})
+                self._refresh_ttl(pipeline, post_id)
+                pipeline.execute()
+        except redis.exceptions.WatchError:
+            pass
+        return reactions
+
+    def _read_cached(self, post_id: UUID) -> dict[UUID, int] | None:
+        pipeline = self.redis.pipeline(transaction=False)
+        pipeline.hgetall(self._users_key(post_id))
+        self._refresh_ttl(pipeline, post_id)
+        cached = pipeline.execute()[0]
+        if not cached:
+            return None
+        return {
+            UUID(bytes=user_id): int(code)
+            for user_id, code in cached.items() if user_id != FILLED_FIELD.encode()
+        }
+
+    async def summarize_by_post_ids(
+            self,
+            posts_ids: list[UUID],
+            user_id: UUID,
+    ) -> dict[UUID, dict[str, tuple[int, bool]]]:
+        """
+        Returns {post_id: {action: (actions count, whether the user did it)}} for every requested post.
+        Cached posts are served by one redis pipeline, the rest by one grouped query.
+        """
+        actions = list(get_settings().REACTIONS)
+        summary = {post_id: {action: (0, False) for action in actions} for post_id in posts_ids}
+        not_cached_posts_ids = list(summary)
+        if self.redis:
+            local_cache = LocalCache()
+            not_cached_posts_ids = []
+            for post_id, post_summary in summary.items():
+                reactions = local_cache.get(self._users_key(post_id))
+                if reactions is None:
+                    not_cached_posts_ids.append(post_id)
+                    continue
+                user_code = reactions.get(user_id)
+                for code, count in Counter(reactions.values()).items():
+                    if reaction_name(code) is not None:
+                        post_summary[reaction_name(code)] = (count, code == user_code)
+            pipeline = self.redis.pipeline(transaction=False)
+            for post_id in not_cached_posts_ids:
+                pipeline.hgetall(self._counts_key(post_id))
+                pipeline.hget(self._users_key(post_id), user_id.bytes)
+                pipeline.exists(self._users_key(post_id))
+            # replies of the ttl refresh follow the reads and are not consumed
+            for post_id in not_cached_posts_ids:
+                self._refresh_ttl(pipeline, post_id)
+            try:
+                replies = iter(pipeline.execute())
+            except (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError):
+                replies = None
+            if replies is not None:
+                redis_posts_ids, not_cached_posts_ids = not_cached_posts_ids, []
+                for post_id in redis_posts_ids:
+                    counts, user_code, users_cached = next(replies), next(replies), next(replies)
+                    if not counts or not users_cached:
+                        not_cached_posts_ids.append(post_id)
+                        continue
+                    for code, count in counts.items():
+                        if code != FILLED_FIELD.encode() and reaction_name(int(code)) is not None:
+                            summary[post_id][reaction_name(int(code))] = (int(count), code == user_code)
+
+        if not not_cached_posts_ids:
+            return summary
+        summary_query = (
+            select(
+                PostAction.post_id,
+                PostAction.reaction,
+                func.count(),
+                func.bool_or(PostAction.user_id == user_id),
+            )
+            .where(PostAction.post_id.in_(not_cached_posts_ids))
+            .group_by(PostAction.post_id, PostAction.reaction)
+        )
+        try:
+            post_actions_from_db = await self.session.execute(summary_query)
+        except OSError:
+            raise custom_exc.DbUnavailable(code=500, message='Database unavailable.')
+        for post_id, code, count, user_did in post_actions_from_db:
+            if reaction_name(code) is not None:
+                summary[post_id][reaction_name(code)] = (count, user_did)
+        return summary
 
     async def list_by_user_id(self, user_id: UUID) -> list:
+        """
+        All actions of the user. Reactions are partitioned by the post id and a user reacts to posts of any
+        month, so the (user_id, dt_created) index of every partition, the legacy one included, is probed.
+        Nothing on the request path uses it, /me/reactions pages with iter_by_user_id.
+        """
         list_post_action_query = select(PostAction).where(PostAction.user_id == user_id)
         try:
             post_actions_from_db = [post_act for post_act in await self.session.scalars(list_post_action_query)]
@@ -113,6 +288,42 @@ class PostActionRepository:
             return []
         return post_actions_from_db
 
+    async def iter_by_user_id(
+            self,
+            user_id: UUID,
+            limit: int,
+            after: tuple[datetime, UUID] | None = None,
+    ) -> AsyncIterator[PostAction]:
+        """
+        Streams user actions from newest to oldest.
+        `after` is (dt_created, post_id) of the last action of the previous page.
+        The (user_id, dt_created) index of every partition is probed: a user reacts to posts of any month,
+        and the post id can not bound later pages either, random ids of the legacy rows sort above the version 7
+        ids and the ones falling into a month are moved to its partition when it is attached.
+        """
+        iter_post_action_query = (
+            select(PostAction)
+            .join(Post, Post.id == PostAction.post_id)
+            .where(PostAction.user_id == user_id, Post.deleted_at.is_(None))
+        )
+        if after is not None:
+            after_dt_created, _ = after
+            iter_post_action_query = iter_post_action_query.where(
+                # the first condition is served by the (user_id, dt_created) index
+                PostAction.dt_created <= after_dt_created,
+                tuple_(PostAction.dt_created, PostAction.post_id) < tuple_(*after),
+            )
+        iter_post_action_query = iter_post_action_query.order_by(
+            PostAction.dt_created.desc(),
+            PostAction.post_id.desc(),
+        ).limit(limit).execution_options(yield_per=100)
+        try:
+            post_actions_from_db = await self.session.stream_scalars(iter_post_action_query)
+            async for post_act in post_actions_from_db:
+                yield post_act
+        except OSError:
+            raise custom_exc.DbUnavailable(code=500, message='Database unavailable.')
+
     async def list_by_post_id_user_id(self, post_id: UUID, user_id: UUID) -> list:
         list_post_action_query = select(PostAction).where(PostAction.post_id == post_id, PostAction.user_id == user_id)
         try:
@@ -123,46 +334,174 @@ class PostActionRepository:
             return []
         return post_actions_from_db
 
-    async def delete(self, user_id: UUID, post_id: UUID, action: str):
+    async def get_user_action(self, post_id: UUID, user_id: UUID) -> str | None:
+        """
+        Returns the user reaction to the post or None, a reaction with a code not configured is None as well.
+        Answered from the cached reactions of the post in one round-trip when possible.
+        """
+        no_action_key = self._no_action_key(post_id, user_id)
         if self.redis:
-            redis_key = str(post_id) + action
-            self.redis.srem(redis_key, PostActionSchema(user_id=user_id, post_id=post_id, action=action).json())
+            reactions = LocalCache().get(self._users_key(post_id))
+            if reactions is not None:
+                user_code = reactions.get(user_id)
+                return reaction_name(user_code) if user_code is not None else None
+            pipeline = self.redis.pipeline(transaction=False)
+            pipeline.hget(self._users_key(post_id), user_id.bytes)
+            pipeline.exists(self._users_key(post_id))
+            pipeline.exists(no_action_key)
+            self._refresh_ttl(pipeline, post_id)
+            try:
+                replies = pipeline.execute()
+            except (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError):
+                replies = None
+            if replies is not None:
+                user_code, users_cached, no_action_cached = replies[:3]
+                if user_code is not None:
+                    return reaction_name(int(user_code))
+                if users_cached or no_action_cached:
+                    return None
+
+        user_action_query = select(PostAction.reaction).where(PostAction.post_id == post_id,
+                                                              PostAction.user_id == user_id)
+        if self.redis:
+            # a miss is cached as the negative key, it must not come from a lagging replica
+            user_action_query = user_action_query.execution_options(use_primary=True)
+        try:
+            user_code = (await self.session.scalars(user_action_query)).first()
+        except OSError:
+            raise custom_exc.DbUnavailable(code=500, message='Database unavailable.')
+        if user_code is None:
+            if self.redis:
+                self.redis.set(no_action_key, 1, ex=get_settings().REACTION_NEGATIVE_TTL_SECONDS)
+            return None
+        return reaction_name(user_code)
+
+    @staticmethod
+    def _no_action_key(post_id: UUID, user_id: UUID) -> str:
+        # set while the user is known to have no reaction to the post
+        return f'post_action:none:{post_id}:{user_id}'
+
+    @staticmethod
+    def _users_key(post_id: UUID) -> str:
+        return f'post_action:{post_id}:users'
+
+    @staticmethod
+    def _counts_key(post_id: UUID) -> str:
+        return f'post_action:{post_id}:counts'
 
+    @staticmethod
+    def _generation_key(post_id: UUID) -> str:
+        return f'post_action:{post_id}:generation'
+
+    def _refresh_ttl(self, pipeline, post_id: UUID):
+        """
+        Adds the sliding lifetime extension of both hashes of the post to the pipeline.
+        """
+        ttl = get_settings().REACTION_CACHE_TTL_SECONDS
+        pipeline.expire(self._users_key(post_id), ttl)
+        pipeline.expire(self._counts_key(post_id), ttl)
+
+    def _cache_reaction(self, post_id: UUID, user_id: UUID, action: str | None):
+        """
+        Applies the reaction of the user (None when it is removed) to the cached hashes of the post.
+        """
+        if not self.redis:
+            return
+        code = reaction_code(action) if action is not None else ''
+        self.redis.eval(SET_REACTION_SCRIPT, 3, self._users_key(post_id), self._counts_key(post_id),
+                        self._generation_key(post_id), user_id.bytes, code, get_settings().REACTION_CACHE_TTL_SECONDS)
+        if action is not None:
+            self.redis.delete(self._no_action_key(post_id, user_id))
+        LocalCache().invalidate(self.redis, self._users_key(post_id))
+
+    async def delete(self, user_id: UUID, post_id: UUID, action: str) -> datetime | None:
+        """
+        Removes the reaction of the user to the post.
+        Returns the time the reaction was put, None when there was no such reaction.
+        """
         delete_post_act_query = delete(PostAction).where(
-            and_(
-                PostAction.user_id == user_id,
-                PostAction.post_id == post_id,
-                PostAction.action == action,
-            )
-        )
-        await self.session.execute(delete_post_act_query)
+            PostAction.user_id == user_id,
+            PostAction.post_id == post_id,
+            PostAction.reaction == reaction_code(action),
+        ).returning(PostAction.dt_created)
         try:
+            reacted_at = (await self.session.execute(delete_post_act_query)).scalar_one_or_none()
             await self.session.commit()
         except OSError:
             raise custom_exc.DbUnavailable(code=500, message='Database unavailable.')
+        if reacted_at is not None:
+            self._cache_reaction(post_id, user_id, None)
+        return reacted_at
 
     async def delete_by_post_user_id(self, post_id: UUID, user_id: UUID):
-        if self.redis:
-            redis_key_like = str(post_id) + PostActionEnum.LIKE.value
-            self.redis.srem(redis_key_like, PostActionSchema(user_id=user_id,
-                                                             post_id=post_id,
-                                                             action=PostActionEnum.LIKE.value).json())
-            redis_key_dislike = str(post_id) + PostActionEnum.DISLIKE.value
-            self.redis.srem(redis_key_dislike, PostActionSchema(user_id=user_id,
-                                                                post_id=post_id,
-                                                                action=PostActionEnum.DISLIKE.value).json())
-
         delete_post_act_query = delete(PostAction).where(
-            and_(
-                PostAction.user_id == user_id,
-                PostAction.post_id == post_id,
-            )
+            PostAction.user_id == user_id,
+            PostAction.post_id == post_id,
         )
-        await self.session.execute(delete_post_act_query)
         try:
+            await self.session.execute(delete_post_act_query)
             await self.session.commit()
         except OSError:
             raise custom_exc.DbUnavailable(code=500, message='Database unavailable.')
+        self._cache_reaction(post_id, user_id, None)
+
+    async def user_has_actions(self, user_id: UUID) -> bool:
+        """
+        Checks if any action of the user is left.
+        """
+        user_action_query = (
+            select(PostAction.post_id)
+            .where(PostAction.user_id == user_id)
+            .limit(1)
+            .execution_options(use_primary=True)
+        )
+        try:
+            return await self.session.scalar(user_action_query) is not None
+        except OSError:
+            raise custom_exc.DbUnavailable(code=500, message='Database unavailable.')
+
+    async def purge_batch(self, limit: int, post_id: UUID | None = None, user_id: UUID | None = None) -> int:
+        """
+        Deletes up to `limit` actions to the post or of the user in a short transaction.
+        Returns the number of deleted actions, 0 means nothing is left.
+        Actions of the user can not be bounded by the post id, they are looked for by the (user_id, dt_created)
+        index of every attached partition, the legacy one included. Archived months are detached and not probed.
+        """
+        actions_batch = select(PostAction.user_id, PostAction.post_id)
+        if post_id is not None:
+            actions_batch = actions_batch.where(PostAction.post_id == post_id)
+        if user_id is not None:
+            actions_batch = actions_batch.where(PostAction.user_id == user_id)
+        purge_query = (
+            delete(PostAction)
+            .where(tuple_(PostAction.user_id, PostAction.post_id).in_(actions_batch.limit(limit)))
+            .returning(PostAction.user_id, PostAction.post_id)
+            .execution_options(synchronize_session=False)
+        )
+        try:
+            purged = (await self.session.execute(purge_query)).all()
+            await self.session.commit()
+        except OSError:
+            raise custom_exc.DbUnavailable(code=500, message='Database unavailable.')
+        if self.redis and purged:
+            ttl = get_settings().REACTION_CACHE_TTL_SECONDS
+            pipeline = self.redis.pipeline(transaction=False)
+            for purged_user_id, purged_post_id in purged:
+                pipeline.eval(SET_REACTION_SCRIPT, 3, self._users_key(purged_post_id),
+                              self._counts_key(purged_post_id), self._generation_key(purged_post_id),
+                              purged_user_id.bytes, '', ttl)
+            pipeline.execute()
+            LocalCache().invalidate(self.redis, *{self._users_key(purged_post_id) for _, purged_post_id in purged})
+        return len(purged)
+
+    def forget_post(self, post_id: UUID):
+        if self.redis:
+            pipeline = self.redis.pipeline()
+            pipeline.incr(self._generation_key(post_id))
+            pipeline.expire(self._generation_key(post_id), get_settings().REACTION_CACHE_TTL_SECONDS)
+            pipeline.delete(self._users_key(post_id), self._counts_key(post_id))
+            pipeline.execute()
+            LocalCache().invalidate(self.redis, self._users_key(post_id))
 
     def cache_key_exists(self, key):
         try:
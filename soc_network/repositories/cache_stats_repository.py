@@ -0,0 +1,99 @@
+from fnmatch import fnmatchcase
+
+import redis
+from redis import Redis
+
+
+# key class: patterns of its keys, the first matching class takes the key;
+# trending, auth, rate_limit, db_sticky and the job locks are in the state redis when it is configured apart
+KEY_CLASSES = {
+    "reactions": ["post_action:*:users", "post_action:*:counts", "post_action:*:generation"],
+    "reaction_misses": ["post_action:none:*"],
+    "post_versions": ["post:version:*"],
+    "trending": ["post:trending", "post:trending:epoch", "post:trending:built"],
+    "auth": ["auth:*"],
+    "rate_limit": ["rate_limit:*"],
+    "db_sticky": ["db:sticky:*"],
+    "locks": ["lock:*", "*:lock", "purge:progress"],
+}
+OTHER_CLASS = "other"
+# server counters reported as they are, see INFO memory and INFO stats
+SERVER_FIELDS = (
+    "used_memory", "maxmemory", "maxmemory_policy", "evicted_keys", "expired_keys", "keyspace_hits",
+    "keyspace_misses",
+)
+
+
+def key_class(key: str) -> str:
+    for name, patterns in KEY_CLASSES.items():
+        if any(fnmatchcase(key, pattern) for pattern in patterns):
+            return name
+    return OTHER_CLASS
+
+
+class CacheStatsRepository:
+    """
+    Memory of the redis cache by key class. Classes are measured on a sample of keys and scaled to the whole
+    database, memory is unknown (None) on servers without MEMORY USAGE.
+    """
+
+    def __init__(self, redis_sess: Redis = None):
+        self.redis = None
+        if redis_sess is not None:
+            try:
+                redis_sess.ping()
+                self.redis = redis_sess
+            except (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError):
+                pass
+
+    async def server_stats(self) -> dict:
+        if not self.redis:
+            return {}
+        try:
+            info = {**self.redis.info("memory"), **self.redis.info("stats")}
+        except redis.exceptions.ResponseError:
+            # INFO may be disabled, e.g. by a managed service
+            return {}
+        return {field: info[field] for field in SERVER_FIELDS if field in info}
+
+    async def memory_by_class(self, sample_keys: int) -> dict[str, dict[str, int | None]]:
+        """
+        Returns {key class: {"keys": number of keys, "bytes": memory of their keys and values}}.
+        """
+        stats = {name: {"keys": 0, "bytes": 0} for name in [*KEY_CLASSES, OTHER_CLASS]}
+        if not self.redis:
+            return stats
+        keys = []
+        cursor = None
+        while cursor != 0 and len(keys) < sample_keys:
+            cursor, batch = self.redis.scan(cursor or 0, count=min(sample_keys, 1000))
+            keys.extend(key.decode() for key in batch)
+        if not keys:
+            return stats
+        sizes = self._memory_usage(keys)
+        # the sample is a prefix of the scan order, which does not depend on the key names
+        scale = self.redis.dbsize() / len(keys) if cursor != 0 else 1
+        for key, size in zip(keys, sizes):
+            class_stats = stats[key_class(key)]
+            class_stats["keys"] += 1
+            if size is None:
+                class_stats["bytes"] = None
+            elif class_stats["bytes"] is not None:
+                class_stats["bytes"] += size
+        for class_stats in stats.values():
+            class_stats["keys"] = round(class_stats["keys"] * scale)
+            if class_stats["bytes"] is not None:
+                class_stats["bytes"] = round(class_stats["bytes"] * scale)
+        return stats
+
+    def _memory_usage(self, keys: list[str]) -> list[int | None]:
+        try:
+            # checked by a single command, an unknown command in a pipeline makes some servers drop the connection
+            self.redis.memory_usage(keys[0])
+        except redis.exceptions.ResponseError:
+            return [None] * len(keys)
+        pipeline = self.redis.pipeline(transaction=False)
+        for key in keys:
+            pipeline.memory_usage(key)
+        # keys expired since the scan have no size
+        return [size or 0 for size in pipeline.execute()]
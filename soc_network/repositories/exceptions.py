@@ -2,6 +2,10 @@ class DbError(Exception):
     pass
 
 
+class ArchiveError(Exception):
+    pass
+
+
 class DbUnavailable(Exception):
     def __init__(self, code: int, message: str):
         self.code = code
@@ -0,0 +1,157 @@
+import sys
+from collections import OrderedDict
+from time import monotonic
+from typing import Any
+
+import redis
+from redis import Redis
+
+from soc_network.config import get_settings
+
+
+# keys written by any worker process, newline separated; every process drops them from its local cache
+INVALIDATION_CHANNEL = "cache:invalidate"
+# containers larger than this are measured by a sample of their items
+SIZE_SAMPLE = 32
+
+
+def approximate_size(value: Any) -> int:
+    """
+    Rough memory footprint in bytes of the value and the objects it holds, for the cache budget.
+    """
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        items = list(value.items())
+        sample = items[:SIZE_SAMPLE]
+        if sample:
+            sample_size = sum(approximate_size(key) + approximate_size(item) for key, item in sample)
+            size += sample_size * len(items) // len(sample)
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        sample = list(value)[:SIZE_SAMPLE]
+        if sample:
+            size += sum(approximate_size(item) for item in sample) * len(value) // len(sample)
+    elif hasattr(value, "__dict__"):
+        # mapped objects keep their state in `_sa_instance_state`, it is shared with the mapper
+        size += approximate_size({key: item for key, item in vars(value).items() if not key.startswith("_sa_")})
+    return size
+
+
+class LocalCache:
+    """
+    In-process LRU cache in front of redis and database reads, one per worker process.
+    Entries live up to LOCAL_CACHE_TTL_SECONDS, the least recently used ones are evicted when the approximate
+    size goes over LOCAL_CACHE_MAX_BYTES. Writes drop the keys in every process through INVALIDATION_CHANNEL,
+    so entries are served only while the channel is listened to (see services.cache).
+    Cached values are shared between requests and must not be changed.
+    """
+
+    def __init__(self) -> None:
+        if not hasattr(self, "entries"):
+            # key: (value, size, expires at by monotonic clock), least recently used first
+            self.entries: OrderedDict[str, tuple[Any, int, float]] = OrderedDict()
+            self.size = 0
+            self.listening = False
+            # every invalidation gets a number, a value loaded before the invalidation of its key is not stored
+            self.invalidations = 0
+            self.invalidated: dict[str, int] = {}
+            self.invalidated_floor = 0
+            self.hits = 0
+            self.misses = 0
+
+    def __new__(cls):
+        if not hasattr(cls, "instance"):
+            cls.instance = super(LocalCache, cls).__new__(cls)
+        return cls.instance  # noqa
+
+    @property
+    def enabled(self) -> bool:
+        return self.listening and get_settings().LOCAL_CACHE_MAX_BYTES > 0
+
+    def get(self, key: str) -> Any | None:
+        if not self.enabled:
+            return None
+        entry = self.entries.get(key)
+        if entry is None or entry[2] <= monotonic():
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def stamp(self) -> int:
+        """
+        Taken before loading a value, `set` skips the value when its key was invalidated since.
+        """
+        return self.invalidations
+
+    def set(self, key: str, value: Any, stamp: int):
+        if not self.enabled or value is None:
+            return
+        if self.invalidated.get(key, self.invalidated_floor) > stamp:
+            return
+        settings = get_settings()
+        size = approximate_size(value)
+        if size > settings.LOCAL_CACHE_MAX_BYTES:
+            return
+        self._remove(key)
+        self.entries[key] = (value, size, monotonic() + settings.LOCAL_CACHE_TTL_SECONDS)
+        self.size += size
+        while self.size > settings.LOCAL_CACHE_MAX_BYTES:
+            self._remove(next(iter(self.entries)))
+
+    def discard(self, *keys: str):
+        """
+        Drops the keys from the cache of this process.
+        """
+        self.invalidations += 1
+        for key in keys:
+            self._remove(key)
+            self.invalidated[key] = self.invalidations
+        if len(self.invalidated) > 10000:
+            # forgotten keys are treated as invalidated now
+            self.invalidated_floor = self.invalidations
+            self.invalidated = {}
+
+    def invalidate(self, redis_sess: Redis | None, *keys: str):
+        """
+        Drops the keys in every worker process, called after the change is written.
+        """
+        self.discard(*keys)
+        if redis_sess is None:
+            return
+        try:
+            redis_sess.publish(INVALIDATION_CHANNEL, "\n".join(keys))
+        except (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError):
+            # listeners lose the channel too and clear their caches
+            pass
+
+    def start_listening(self):
+        self.clear()
+        self.listening = True
+
+    def stop_listening(self):
+        self.listening = False
+        self.clear()
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+        self.invalidations += 1
+        self.invalidated_floor = self.invalidations
+        self.invalidated = {}
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "entries": len(self.entries),
+            "size_bytes": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def _remove(self, key: str):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[1]
@@ -0,0 +1,268 @@
+import asyncio
+import gzip
+import os
+from datetime import date, datetime, timezone
+from pathlib import Path
+
+from sqlalchemy import exc, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from soc_network.config import get_settings
+from soc_network.db.models import Post, PostAction
+from soc_network.db.uuid7 import uuid7_min
+from . import exceptions as custom_exc
+
+
+def month_start(moment: datetime | date) -> date:
+    return date(moment.year, moment.month, 1)
+
+
+def add_months(month: date, months: int) -> date:
+    year, month_index = divmod(month.month - 1 + months, 12)
+    return date(month.year + year, month_index + 1, 1)
+
+
+class PartitionRepository:
+    """
+    Monthly partitions of posts and their reactions.
+    A month partition of post holds the posts with time-ordered ids of the month, the partition of post_action
+    holds the reactions to them. The `_legacy` default partition holds random ids of the rows created before
+    partitioning and ids of months without a partition.
+    """
+
+    # partitioned table: partition key, months are attached in this order and detached in the reverse one
+    TABLES = {
+        Post.__tablename__: "id",
+        PostAction.__tablename__: "post_id",
+    }
+    # columns of the archive files, generated ones are computed again on restore
+    COLUMNS = {
+        model.__tablename__: [column.name for column in model.__table__.columns if column.computed is None]
+        for model in (Post, PostAction)
+    }
+
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    @staticmethod
+    def partition_name(table: str, month: date) -> str:
+        return f"{table}_p{month:%Y_%m}"
+
+    @staticmethod
+    def month_bounds(month: date) -> tuple[str, str]:
+        """
+        Ids of the month are from the lower bound inclusive to the upper bound exclusive.
+        """
+        lower, upper = month, add_months(month, 1)
+        return (
+            str(uuid7_min(datetime(lower.year, lower.month, 1, tzinfo=timezone.utc))),
+            str(uuid7_min(datetime(upper.year, upper.month, 1, tzinfo=timezone.utc))),
+        )
+
+    async def list_partitions(self) -> list[tuple[str, str, int]]:
+        """
+        Returns table, partition and its size in bytes (indexes included) of the attached partitions.
+        """
+        list_partitions_query = text(
+            "SELECT parent.relname, child.relname, pg_total_relation_size(child.oid) "
+            "FROM pg_inherits JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE parent.relname = ANY(:tables) ORDER BY 1, 2"
+        ).bindparams(tables=list(self.TABLES))
+        try:
+            partitions = await self.session.execute(list_partitions_query)
+        except OSError:
+            raise custom_exc.DbUnavailable(code=500, message='Database unavailable.')
+        return [tuple(partition) for partition in partitions]
+
+    async def detached_months(self) -> set[date]:
+        """
+        Months whose post partition was detached and is not archived yet, e.g. by `detach`.
+        """
+        detached_query = text(
+            "SELECT relname FROM pg_class WHERE relkind = 'r' AND NOT relispartition AND relname LIKE :pattern"
+        ).bindparams(pattern=f"{Post.__tablename__}\\_p____\\___")
+        try:
+            tables = (await self.session.execute(detached_query)).scalars().all()
+        except OSError:
+            raise custom_exc.DbUnavailable(code=500, message='Database unavailable.')
+        prefix = f"{Post.__tablename__}_p"
+        return {datetime.strptime(table[len(prefix):], "%Y_%m").date() for table in tables}
+
+    async def attached_months(self) -> set[date]:
+        prefix = f"{Post.__tablename__}_p"
+        return {
+            datetime.strptime(partition[len(prefix):], "%Y_%m").date()
+            for table, partition, _ in await self.list_partitions()
+            if table == Post.__tablename__ and partition.startswith(prefix)
+        }
+
+    async def create_month(self, month: date) -> bool:
+        """
+        Creates partitions of the month, returns False when they exist already.
+        """
+        if month in await self.attached_months():
+            return False
+        await self._attach_month(month)
+        return True
+
+    async def detach_month(self, month: date):
+        """
+        Detaches partitions of the month, they are left as plain tables out of the queries.
+        """
+        statements = [
+            f"ALTER TABLE {table} DETACH PARTITION {self.partition_name(table, month)}"
+            for table in reversed(self.TABLES)
+        ]
+        try:
+            await self._lock_timeout()
+            for statement in statements:
+                await self.session.execute(text(statement))
+            await self.session.commit()
+        except OSError:
+            raise custom_exc.DbUnavailable(code=500, message='Database unavailable.')
+        except exc.DBAPIError as error:
+            await self.session.rollback()
+            raise custom_exc.DbError(f'Partitions of {month:%Y-%m} are not detached: {error.orig}')
+
+    async def archive_month(self, month: date, directory: Path) -> list[Path]:
+        """
+        Writes rows of the month to gzip csv files in the directory, then detaches and drops its partitions.
+        All of it is one transaction: the month stays readable while it is dumped, its writes wait,
+        and on any failure it is left as it was. Attached and detached months are archived alike.
+        """
+        try:
+            directory.mkdir(parents=True, exist_ok=True)
+        except OSError as error:
+            raise custom_exc.ArchiveError(f'Archive directory {directory} is not usable: {error}')
+        attached = month in await self.attached_months()
+        partitions = [self.partition_name(table, month) for table in self.TABLES]
+        paths = []
+        try:
+            await self._lock_timeout()
+            for partition in partitions:
+                if not await self._table_exists(partition):
+                    raise custom_exc.DbError(f'No partitions of {month:%Y-%m}.')
+            # rows of the month can not change between the dump and the drop, reads are not blocked
+            await self.session.execute(text(f"LOCK TABLE {', '.join(partitions)} IN SHARE MODE"))
+            for table, partition in zip(self.TABLES, partitions):
+                paths.append(await self._dump(partition, self.COLUMNS[table], directory))
+            # the tables are dropped only when both files are on disk
+            for table, partition in reversed(list(zip(self.TABLES, partitions))):
+                if attached:
+                    await self.session.execute(text(f"ALTER TABLE {table} DETACH PARTITION {partition}"))
+                await self.session.execute(text(f"DROP TABLE {partition}"))
+            await self.session.commit()
+        except (custom_exc.ArchiveError, custom_exc.DbError):
+            await self.session.rollback()
+            raise
+        except OSError:
+            raise custom_exc.DbUnavailable(code=500, message='Database unavailable.')
+        except exc.DBAPIError as error:
+            await self.session.rollback()
+            raise custom_exc.DbError(f'Partitions of {month:%Y-%m} are not archived: {error.orig}')
+        return paths
+
+    async def restore_month(self, month: date, directory: Path):
+        """
+        Loads the month written by archive_month and attaches it back.
+        """
+        paths = {table: self._archive_path(directory, self.partition_name(table, month)) for table in self.TABLES}
+        missing = [str(path) for path in paths.values() if not path.exists()]
+        if missing:
+            raise custom_exc.DbError(f'No archive files {", ".join(missing)}.')
+        if month in await self.attached_months():
+            raise custom_exc.DbError(f'Partitions of {month:%Y-%m} exist already.')
+        await self._attach_month(month, paths)
+
+    async def _attach_month(self, month: date, archives: dict[str, Path] | None = None):
+        lower, upper = self.month_bounds(month)
+        try:
+            await self._lock_timeout()
+            for table, key in self.TABLES.items():
+                partition = self.partition_name(table, month)
+                columns = ", ".join(self.COLUMNS[table])
+                await self.session.execute(text(
+                    f"CREATE TABLE {partition} (LIKE {table} INCLUDING DEFAULTS INCLUDING GENERATED)"
+                ))
+                if archives:
+                    await self._load(partition, self.COLUMNS[table], archives[table])
+                # random ids of the legacy partition may fall into the month, attach fails while they are there
+                await self.session.execute(text(
+                    f"INSERT INTO {partition} ({columns}) SELECT {columns} FROM {table}_legacy "
+                    f"WHERE {key} >= '{lower}' AND {key} < '{upper}'"
+                ))
+            for table, key in reversed(self.TABLES.items()):
+                await self.session.execute(text(
+                    f"DELETE FROM {table}_legacy WHERE {key} >= '{lower}' AND {key} < '{upper}'"
+                ))
+            # indexes and foreign keys of the table are created on the partition when it is attached
+            for table in self.TABLES:
+                await self.session.execute(text(
+                    f"ALTER TABLE {table} ATTACH PARTITION {self.partition_name(table, month)} "
+                    f"FOR VALUES FROM ('{lower}') TO ('{upper}')"
+                ))
+            await self.session.commit()
+        except OSError:
+            raise custom_exc.DbUnavailable(code=500, message='Database unavailable.')
+        except exc.DBAPIError as error:
+            await self.session.rollback()
+            raise custom_exc.DbError(f'Partitions of {month:%Y-%m} are not attached: {error.orig}')
+
+    async def _lock_timeout(self):
+        timeout_ms = get_settings().PARTITION_LOCK_TIMEOUT_MS
+        await self.session.execute(text(f"SET LOCAL lock_timeout = {int(timeout_ms)}"))
+
+    async def _table_exists(self, name: str) -> bool:
+        exists_query = text("SELECT to_regclass(:name) IS NOT NULL").bindparams(name=name)
+        return (await self.session.execute(exists_query)).scalar()
+
+    async def _driver_connection(self):
+        connection = await self.session.connection()
+        return (await connection.get_raw_connection()).driver_connection
+
+    @staticmethod
+    def _archive_path(directory: Path, partition: str) -> Path:
+        return directory / f"{partition}.csv.gz"
+
+    async def _dump(self, partition: str, columns: list[str], directory: Path) -> Path:
+        """
+        File errors are raised as ArchiveError, the OSError of the driver means the database is unavailable.
+        """
+        path = self._archive_path(directory, partition)
+        # a file under the final name is complete and synced
+        part_path = path.with_name(path.name + ".part")
+        driver_connection = await self._driver_connection()
+        try:
+            file = open(part_path, "wb")
+        except OSError as error:
+            raise custom_exc.ArchiveError(f'Archive {part_path} is not written: {error}')
+        try:
+            with file:
+                with gzip.GzipFile(fileobj=file, mode="wb") as archive:
+                    async def write(chunk: bytes):
+                        try:
+                            await asyncio.to_thread(archive.write, chunk)
+                        except OSError as error:
+                            raise custom_exc.ArchiveError(f'Archive {part_path} is not written: {error}')
+
+                    await driver_connection.copy_from_table(
+                        partition, columns=columns, output=write, format="csv", header=True,
+                    )
+                try:
+                    file.flush()
+                    os.fsync(file.fileno())
+                    os.replace(part_path, path)
+                except OSError as error:
+                    raise custom_exc.ArchiveError(f'Archive {path} is not written: {error}')
+        except BaseException:
+            part_path.unlink(missing_ok=True)
+            raise
+        return path
+
+    async def _load(self, partition: str, columns: list[str], path: Path):
+        driver_connection = await self._driver_connection()
+        with gzip.open(path, "rb") as archive:
+            await driver_connection.copy_to_table(
+                partition, columns=columns, source=archive, format="csv", header=True,
+            )
@@ -1,16 +1,46 @@
+from datetime import datetime, timedelta, timezone
+
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, delete, exc
+from sqlalchemy import select, delete, update, exc, func, literal_column, tuple_
 from uuid import UUID
+import redis
+from redis import Redis
 
+from soc_network.config import get_settings
 from soc_network.db.models import Post
+from soc_network.db.models.post import SEARCH_CONFIG
+from soc_network.db.uuid7 import uuid7_min
 from soc_network.schemas import Post as PostSchema
 from . import exceptions as custom_exc
+from .local_cache import LocalCache
+
+
+# cached instead of the version of a deleted post, it is never replaced by a version
+DELETED_VERSION = "deleted"
+# caches the post version (ARGV[1]) for ARGV[2] seconds unless a newer version or the deleted mark is cached,
+# so a read that loaded the version before a change can not put it over the version written after the change;
+# returns the cached value
+SET_VERSION_SCRIPT = """
+local cached = redis.call('GET', KEYS[1])
+if cached and (cached == ARGV[3] or tonumber(cached) >= tonumber(ARGV[1])) then
+    return cached
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+return ARGV[1]
+"""
 
 
 # todo: посмотреть как ведет себя при добавлении текста превышающего допустимую в БД
 class PostRepository:
-    def __init__(self, session: AsyncSession):
+    def __init__(self, session: AsyncSession, redis_sess: Redis = None):
         self.session = session
+        self.redis = None
+        if redis_sess is not None:
+            try:
+                redis_sess.ping()
+                self.redis = redis_sess
+            except (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError):
+                pass
 
     async def add(self, post: PostSchema):
         new_post = Post(body=post.body, author_id=post.author_id)
@@ -22,19 +52,132 @@ class PostRepository:
             raise custom_exc.DbError('No user error.')
         except OSError:
             raise custom_exc.DbUnavailable(code=500, message='Database unavailable.')
-        await self.session.refresh(new_post)
+        # id is returned by the INSERT, a refresh would open a new transaction holding the connection
         return new_post.id
 
     async def get(self, post_id: UUID):
-        get_post_query = select(Post).where(Post.id == post_id)
+        local_cache = LocalCache()
+        post = local_cache.get(self._post_key(post_id))
+        if post is not None:
+            return post
+        stamp = local_cache.stamp()
+        get_post_query = select(Post).where(Post.id == post_id, Post.deleted_at.is_(None))
         try:
             post_from_db = await self.session.scalar(get_post_query)
         except OSError:
             raise custom_exc.DbUnavailable(code=500, message='Database unavailable.')
         if post_from_db is None:
             return None
+        local_cache.set(self._post_key(post_id), self._snapshot(post_from_db), stamp)
         return post_from_db
 
+    async def get_version(self, post_id: UUID) -> int | None:
+        """
+        Returns post version (dt_updated in microseconds) without loading the post body.
+        """
+        redis_key = self._version_key(post_id)
+        local_cache = LocalCache()
+        version = local_cache.get(redis_key)
+        if version is not None:
+            return version
+        stamp = local_cache.stamp()
+        if self.redis:
+            version = self.redis.get(redis_key)
+            if version == DELETED_VERSION.encode():
+                return None
+            if version is not None:
+                local_cache.set(redis_key, int(version), stamp)
+                return int(version)
+        # a lagging replica would let clients revalidate stale content
+        get_version_query = (
+            select(Post.dt_updated)
+            .where(Post.id == post_id, Post.deleted_at.is_(None))
+            .execution_options(use_primary=True)
+        )
+        try:
+            dt_updated = await self.session.scalar(get_version_query)
+        except OSError:
+            raise custom_exc.DbUnavailable(code=500, message='Database unavailable.')
+        if dt_updated is None:
+            return None
+        version = self._version(dt_updated)
+        if self.redis:
+            # the post may have been changed since the query, then the newer cached value is returned
+            cached = self.redis.eval(SET_VERSION_SCRIPT, 1, redis_key, version,
+                                     get_settings().POST_VERSION_TTL_SECONDS, DELETED_VERSION)
+            if cached == DELETED_VERSION.encode():
+                return None
+            version = int(cached)
+        local_cache.set(redis_key, version, stamp)
+        return version
+
+    def forget_cached(self, *posts_ids: UUID, version: int | None = None):
+        """
+        Called after the posts are changed: caches their new version (None for deleted posts) in redis
+        and drops cached posts and versions in the local caches of all processes.
+        """
+        if not posts_ids:
+            return
+        if self.redis:
+            ttl = get_settings().POST_VERSION_TTL_SECONDS
+            pipeline = self.redis.pipeline(transaction=False)
+            for post_id in posts_ids:
+                if version is None:
+                    pipeline.set(self._version_key(post_id), DELETED_VERSION, ex=ttl)
+                else:
+                    pipeline.eval(SET_VERSION_SCRIPT, 1, self._version_key(post_id), version, ttl, DELETED_VERSION)
+            pipeline.execute()
+        LocalCache().invalidate(self.redis, *(
+            key for post_id in posts_ids for key in (self._post_key(post_id), self._version_key(post_id))
+        ))
+
+    @staticmethod
+    def _version(dt_updated: datetime) -> int:
+        return int(dt_updated.timestamp() * 1_000_000)
+
+    @staticmethod
+    def _version_key(post_id: UUID) -> str:
+        return f'post:version:{post_id}'
+
+    @staticmethod
+    def _post_key(post_id: UUID) -> str:
+        return f'post:{post_id}'
+
+    @staticmethod
+    def _snapshot(post: Post) -> Post:
+        """
+        Copy of the loaded columns not bound to any session, shared by the requests of the process.
+        """
+        return Post(**{
+            column.key: getattr(post, column.key)
+            for column in Post.__table__.columns if column.computed is None
+        })
+
+    async def list_by_ids(self, posts_ids: list[UUID]) -> list:
+        """
+        Returns posts in the order of `posts_ids`, missing posts are skipped.
+        """
+        if not posts_ids:
+            return []
+        local_cache = LocalCache()
+        posts = {}
+        for post_id in posts_ids:
+            post = local_cache.get(self._post_key(post_id))
+            if post is not None:
+                posts[post_id] = post
+        not_cached_posts_ids = [post_id for post_id in posts_ids if post_id not in posts]
+        if not_cached_posts_ids:
+            stamp = local_cache.stamp()
+            list_post_query = select(Post).where(Post.id.in_(not_cached_posts_ids), Post.deleted_at.is_(None))
+            try:
+                posts_from_db = list(await self.session.scalars(list_post_query))
+            except OSError:
+                raise custom_exc.DbUnavailable(code=500, message='Database unavailable.')
+            for post in posts_from_db:
+                posts[post.id] = post
+                local_cache.set(self._post_key(post.id), self._snapshot(post), stamp)
+        return [posts[post_id] for post_id in posts_ids if post_id in posts]
+
     async def delete(self, post_id: UUID):
         delete_post_query = delete(Post).where(Post.id == post_id)
         await self.session.execute(delete_post_query)
@@ -42,9 +185,86 @@ class PostRepository:
             await self.session.commit()
         except OSError:
             raise custom_exc.DbUnavailable(code=500, message='Database unavailable.')
+        self.forget_cached(post_id)
+
+    async def mark_deleted(self, post_id: UUID):
+        """
+        Hides the post from reads, its rows and cache are purged in background.
+        """
+        mark_deleted_query = (
+            update(Post)
+            .where(Post.id == post_id, Post.deleted_at.is_(None))
+            .values(deleted_at=func.current_timestamp())
+        )
+        try:
+            await self.session.execute(mark_deleted_query)
+            await self.session.commit()
+        except OSError:
+            raise custom_exc.DbUnavailable(code=500, message='Database unavailable.')
+        self.forget_cached(post_id)
+
+    async def mark_deleted_by_author(self, author_id: UUID, limit: int) -> list[UUID]:
+        """
+        Hides up to `limit` posts of the author, returns their ids.
+        """
+        posts_batch = (
+            select(Post.id)
+            .where(Post.author_id == author_id, Post.deleted_at.is_(None))
+            .limit(limit)
+            .scalar_subquery()
+        )
+        mark_deleted_query = (
+            update(Post)
+            .where(Post.id.in_(posts_batch))
+            .values(deleted_at=func.current_timestamp())
+            .returning(Post.id)
+            .execution_options(synchronize_session=False)
+        )
+        try:
+            posts_ids = list(await self.session.scalars(mark_deleted_query))
+            await self.session.commit()
+        except OSError:
+            raise custom_exc.DbUnavailable(code=500, message='Database unavailable.')
+        self.forget_cached(*posts_ids)
+        return posts_ids
+
+    async def list_deleted(self, limit: int) -> list[UUID]:
+        """
+        Returns ids of the posts waiting for the purge, the oldest tombstones first.
+        """
+        list_deleted_query = (
+            select(Post.id)
+            .where(Post.deleted_at.is_not(None))
+            .order_by(Post.deleted_at)
+            .limit(limit)
+            .execution_options(use_primary=True)
+        )
+        try:
+            return list(await self.session.scalars(list_deleted_query))
+        except OSError:
+            raise custom_exc.DbUnavailable(code=500, message='Database unavailable.')
+
+    async def author_has_posts(self, author_id: UUID) -> bool:
+        """
+        Checks if any post of the author (including not purged ones) is left.
+        """
+        author_post_query = (
+            select(Post.id)
+            .where(Post.author_id == author_id)
+            .limit(1)
+            .execution_options(use_primary=True)
+        )
+        try:
+            return await self.session.scalar(author_post_query) is not None
+        except OSError:
+            raise custom_exc.DbUnavailable(code=500, message='Database unavailable.')
 
     async def update(self, post_id: UUID, new_body: str):
-        get_post_query = select(Post).where(Post.id == post_id)
+        get_post_query = (
+            select(Post)
+            .where(Post.id == post_id, Post.deleted_at.is_(None))
+            .execution_options(use_primary=True)
+        )
         try:
             post_from_db = await self.session.scalar(get_post_query)
         except OSError:
@@ -52,7 +272,51 @@ class PostRepository:
         if post_from_db is None:
             raise custom_exc.DbError(f'No such post id: {post_id}')
         post_from_db.body = new_body
+        # the clock at the change, not at the transaction start: of two concurrent updates of the post
+        # the one committed last gets the larger version
+        post_from_db.dt_updated = func.clock_timestamp()
         try:
+            await self.session.flush()
+            await self.session.refresh(post_from_db, attribute_names=["dt_updated"])
             await self.session.commit()
         except OSError:
             raise custom_exc.DbUnavailable(code=500, message='Database unavailable.')
+        self.forget_cached(post_id, version=self._version(post_from_db.dt_updated))
+
+    async def search(
+            self,
+            query: str,
+            limit: int,
+            author_id: UUID | None = None,
+            after: tuple[float, UUID] | None = None,
+            since: datetime | None = None,
+    ) -> list[tuple[Post, float]]:
+        """
+        Full-text search over post bodies, ordered by rank.
+        `after` is (rank, id) of the last post of the previous page.
+        `since` limits the search to posts created from then on. Without it every partition is scanned,
+        rank order needs all matches.
+        """
+        ts_query = func.websearch_to_tsquery(literal_column(f"'{SEARCH_CONFIG}'::regconfig"), query)
+        rank = func.ts_rank(Post.body_tsv, ts_query)
+        search_query = select(Post, rank).where(Post.body_tsv.op("@@")(ts_query), Post.deleted_at.is_(None))
+        if author_id is not None:
+            search_query = search_query.where(Post.author_id == author_id)
+        if after is not None:
+            search_query = search_query.where(tuple_(rank, Post.id) < tuple_(*after))
+        if since is not None:
+            if since.tzinfo is None:
+                since = since.replace(tzinfo=timezone.utc)
+            # both bounds of the id are inside the monthly partitions, the older ones and the legacy one are pruned;
+            # legacy random ids all predate partitioning
+            search_query = search_query.where(
+                Post.dt_created >= since,
+                Post.id >= uuid7_min(since),
+                Post.id < uuid7_min(datetime.now(timezone.utc) + timedelta(days=1)),
+            )
+        search_query = search_query.order_by(rank.desc(), Post.id.desc()).limit(limit)
+        try:
+            result = await self.session.execute(search_query)
+        except OSError:
+            raise custom_exc.DbUnavailable(code=500, message='Database unavailable.')
+        return [(post, post_rank) for post, post_rank in result]
@@ -0,0 +1,71 @@
+import time
+
+import redis
+from redis import Redis
+
+from . import exceptions as custom_exc
+
+
+# swaps the current token id of the family if the presented one is current,
+# a presented old id means the token was stolen or replayed, so the whole family is dropped
+ROTATE_SCRIPT = """
+local current = redis.call('GET', KEYS[1])
+if not current then
+    return 'missing'
+end
+if current ~= ARGV[1] then
+    redis.call('DEL', KEYS[1])
+    return 'reused'
+end
+redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+return 'rotated'
+"""
+
+
+class RefreshTokenRepository:
+    """
+    Refresh token families: every login starts a family, only its latest refresh token is valid.
+    """
+
+    ROTATED = "rotated"
+    REUSED = "reused"
+    MISSING = "missing"
+
+    def __init__(self, redis_sess: Redis = None):
+        self.redis = None
+        if redis_sess is not None:
+            try:
+                redis_sess.ping()
+                self.redis = redis_sess
+            except (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError):
+                pass
+
+    async def start_family(self, family_id: str, token_id: str, expires_at: float):
+        self._check_available()
+        self.redis.set(self._family_key(family_id), token_id, ex=self._ttl(expires_at))
+
+    async def rotate(self, family_id: str, token_id: str, new_token_id: str, expires_at: float) -> str:
+        """
+        Returns ROTATED, REUSED (the family is revoked) or MISSING (expired or revoked family).
+        """
+        self._check_available()
+        result = self.redis.eval(
+            ROTATE_SCRIPT, 1, self._family_key(family_id), token_id, new_token_id, self._ttl(expires_at),
+        )
+        return result.decode() if isinstance(result, bytes) else result
+
+    async def end_family(self, family_id: str):
+        if self.redis:
+            self.redis.delete(self._family_key(family_id))
+
+    def _check_available(self):
+        if not self.redis:
+            raise custom_exc.DbUnavailable(code=503, message='Token store unavailable.')
+
+    @staticmethod
+    def _family_key(family_id: str) -> str:
+        return f"auth:refresh:{family_id}"
+
+    @staticmethod
+    def _ttl(expires_at: float) -> int:
+        return max(int(expires_at - time.time()), 1)
@@ -0,0 +1,100 @@
+import time
+from time import monotonic
+from uuid import UUID
+
+import redis
+from redis import Redis
+
+from soc_network.config import get_settings
+from . import exceptions as custom_exc
+
+
+# members are "token:<token id>" and "user:<user id>", scored by the time the entry can be forgotten
+# (expiry of the revoked token or of the longest living token of the user)
+REVOKED_KEY = "auth:revoked"
+
+
+class RevocationRepository:
+    """
+    Revoked access tokens and users, kept in a redis sorted set.
+    Checks are cached in the process for AUTH_REVOCATION_CACHE_SECONDS, so other worker processes
+    may accept a revoked token during this time. Without redis nothing can be checked or revoked,
+    both fail with DbUnavailable instead of letting revoked tokens through.
+    """
+
+    # member: (revoked, cached until by monotonic clock)
+    _cache: dict[str, tuple[bool, float]] = {}
+
+    def __init__(self, redis_sess: Redis = None):
+        self.redis = None
+        if redis_sess is not None:
+            try:
+                redis_sess.ping()
+                self.redis = redis_sess
+            except (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError):
+                pass
+
+    async def revoke_token(self, token_id: str, expires_at: float):
+        await self._revoke(f"token:{token_id}", expires_at)
+
+    async def revoke_user(self, user_id: UUID):
+        """
+        Revokes all access and refresh tokens issued to the user.
+        """
+        settings = get_settings()
+        expires_at = time.time() + max(
+            settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60, settings.REFRESH_TOKEN_EXPIRE_DAYS * 24 * 60 * 60,
+        )
+        await self._revoke(f"user:{user_id}", expires_at)
+
+    async def is_revoked(self, token_id: str, user_id: UUID) -> bool:
+        members = [f"token:{token_id}", f"user:{user_id}"]
+        now = monotonic()
+        not_cached = []
+        for member in members:
+            revoked, cached_until = self._cache.get(member, (False, 0.0))
+            if cached_until <= now:
+                not_cached.append(member)
+            elif revoked:
+                return True
+        if not not_cached:
+            return False
+
+        self._check_available()
+        try:
+            scores = self.redis.zmscore(REVOKED_KEY, not_cached)
+        except (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError):
+            raise custom_exc.DbUnavailable(code=503, message='Token store unavailable.')
+        self._evict_expired(now)
+        cache_seconds = get_settings().AUTH_REVOCATION_CACHE_SECONDS
+        wall_now = time.time()
+        is_revoked = False
+        for member, score in zip(not_cached, scores):
+            if score is not None and score > wall_now:
+                self._cache[member] = (True, now + score - wall_now)
+                is_revoked = True
+            else:
+                self._cache[member] = (False, now + cache_seconds)
+        return is_revoked
+
+    async def _revoke(self, member: str, expires_at: float):
+        self._cache[member] = (True, monotonic() + expires_at - time.time())
+        self._check_available()
+        pipeline = self.redis.pipeline(transaction=False)
+        pipeline.zadd(REVOKED_KEY, {member: expires_at})
+        # expired entries can not match a valid token anymore
+        pipeline.zremrangebyscore(REVOKED_KEY, "-inf", time.time())
+        try:
+            pipeline.execute()
+        except (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError):
+            raise custom_exc.DbUnavailable(code=503, message='Token store unavailable.')
+
+    def _check_available(self):
+        if not self.redis:
+            raise custom_exc.DbUnavailable(code=503, message='Token store unavailable.')
+
+    def _evict_expired(self, now: float):
+        if len(self._cache) > 10000:
+            RevocationRepository._cache = {
+                member: cached for member, cached in self._cache.items() if cached[1] > now
+            }
@@ -0,0 +1,89 @@
+import asyncio
+import secrets
+from time import monotonic
+from typing import Any, Awaitable, Callable
+
+import redis
+from redis import Redis
+
+from soc_network.config import get_settings
+
+
+# deletes the lock only if it still belongs to the caller
+RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class SingleFlight:
+    """
+    Lets exactly one coroutine rebuild a cache key while the others wait for its result.
+    Coroutines of one process share an in-flight future, processes are serialized by a short redis lock:
+    those that did not get it wait for the lock release and read the cache filled by the holder.
+    """
+
+    _in_flight: dict[str, asyncio.Future] = {}
+
+    def __init__(self, redis_sess: Redis):
+        self.redis = redis_sess
+        settings = get_settings()
+        self.lock_ms = settings.CACHE_FILL_LOCK_MS
+        self.poll_interval = settings.CACHE_FILL_POLL_MS / 1000
+
+    async def do(
+            self,
+            key: str,
+            fill: Callable[[], Awaitable[Any]],
+            read_cached: Callable[[], Any | None],
+    ) -> Any:
+        """
+        `fill` loads the value and puts it to the cache, `read_cached` returns None on cache miss.
+        """
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None:
+            return await asyncio.shield(in_flight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            result = await self._fill_once(key, fill, read_cached)
+        except BaseException as e:
+            future.set_exception(e)
+            # retrieved here, so the loop does not complain when nobody else waited
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._in_flight[key]
+
+    async def _fill_once(
+            self,
+            key: str,
+            fill: Callable[[], Awaitable[Any]],
+            read_cached: Callable[[], Any | None],
+    ) -> Any:
+        lock_key = f'lock:{key}'
+        token = secrets.token_hex(8)
+        try:
+            locked = self.redis.set(lock_key, token, nx=True, px=self.lock_ms)
+        except (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError):
+            return await fill()
+        if locked:
+            try:
+                return await fill()
+            finally:
+                self.redis.eval(RELEASE_LOCK_SCRIPT, 1, lock_key, token)
+
+        deadline = monotonic() + self.lock_ms / 1000
+        while monotonic() < deadline and self.redis.exists(lock_key):
+            await asyncio.sleep(self.poll_interval)
+        cached = read_cached()
+        if cached is not None:
+            return cached
+        # the holder found nothing to cache or has failed
+        return await fill()
@@ -0,0 +1,173 @@
+import time
+from datetime import datetime, timedelta, timezone
+from uuid import UUID
+
+import redis
+from redis import Redis
+from sqlalchemy import func, literal_column, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from soc_network.config import get_settings
+from soc_network.db.models import PostAction
+from soc_network.db.models.action import reaction_name
+from soc_network.db.uuid7 import uuid7_min, uuid7_time
+from . import exceptions as custom_exc
+
+
+TRENDING_KEY = "post:trending"
+# time the scores are measured from, a reaction at `now` weighs 2 ** ((now - epoch) / half_life)
+TRENDING_EPOCH_KEY = "post:trending:epoch"
+# set by rebuild, its absence means the ranking was lost together with redis data
+TRENDING_BUILT_KEY = "post:trending:built"
+
+# adds the reaction weighed at the moment it was put (ARGV[3]), ARGV[5] is the current time;
+# post is dropped from the ranking when its score is not positive anymore
+BUMP_SCRIPT = """
+local epoch = tonumber(redis.call('GET', KEYS[2]))
+if not epoch then
+    epoch = tonumber(ARGV[5])
+    redis.call('SET', KEYS[2], ARGV[5])
+end
+local delta = tonumber(ARGV[2]) * math.pow(2, (tonumber(ARGV[3]) - epoch) / tonumber(ARGV[4]))
+local score = tonumber(redis.call('ZINCRBY', KEYS[1], delta, ARGV[1]))
+if score <= 0 then
+    redis.call('ZREM', KEYS[1], ARGV[1])
+end
+return tostring(score)
+"""
+
+# moves the epoch to `now` (scores become current decayed values) and trims the ranking
+COMPACT_SCRIPT = """
+local epoch = tonumber(redis.call('GET', KEYS[2]))
+if epoch then
+    local factor = math.pow(2, (epoch - tonumber(ARGV[1])) / tonumber(ARGV[2]))
+    redis.call('ZUNIONSTORE', KEYS[1], 1, KEYS[1], 'WEIGHTS', factor)
+    redis.call('SET', KEYS[2], ARGV[1])
+end
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', '(' .. ARGV[3])
+redis.call('ZREMRANGEBYRANK', KEYS[1], 0, -(tonumber(ARGV[4]) + 1))
+return redis.call('ZCARD', KEYS[1])
+"""
+
+
+class TrendingRepository:
+    """
+    Ranking of posts by time-decayed engagement, kept in a redis sorted set.
+    """
+
+    def __init__(self, session: AsyncSession, redis_sess: Redis = None):
+        self.session = session
+        self.redis = None
+        if redis_sess is not None:
+            try:
+                redis_sess.ping()
+                self.redis = redis_sess
+            except (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError):
+                pass
+
+    async def bump(self, post_id: UUID, action: str | None, sign: int = 1, reacted_at: datetime | None = None):
+        """
+        Adds (sign=1) or takes back (sign=-1) the post reaction put at `reacted_at` (now by default).
+        A reaction is taken back with the time it was put, so exactly the weight it added is subtracted.
+        """
+        if not self.redis:
+            return
+        settings = get_settings()
+        weight = settings.TRENDING_WEIGHTS.get(action, 0.0) * sign
+        if not weight or self._is_too_old(post_id):
+            return
+        now = time.time()
+        try:
+            self.redis.eval(
+                BUMP_SCRIPT, 2, TRENDING_KEY, TRENDING_EPOCH_KEY,
+                str(post_id), weight, reacted_at.timestamp() if reacted_at is not None else now,
+                settings.TRENDING_HALF_LIFE_HOURS * 3600, now,
+            )
+        except (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError):
+            pass
+
+    @staticmethod
+    def _is_too_old(post_id: UUID) -> bool:
+        """
+        Posts older than TRENDING_POST_MAX_AGE_DAYS are left out of the ranking, as they are left out of rebuild.
+        Posts with version 4 ids predate the version 7 ones and are left out as well, rebuild does not see them.
+        """
+        created = uuid7_time(post_id)
+        max_age = timedelta(days=get_settings().TRENDING_POST_MAX_AGE_DAYS)
+        return created is None or created < datetime.now(timezone.utc) - max_age
+
+    async def remove(self, post_id: UUID):
+        if not self.redis:
+            return
+        try:
+            self.redis.zrem(TRENDING_KEY, str(post_id))
+        except (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError):
+            pass
+
+    async def top(self, limit: int) -> list[tuple[UUID, float]]:
+        """
+        Returns ids of the top posts with their scores, best first.
+        """
+        if not self.redis:
+            return []
+        return [
+            (UUID(post_id.decode()), score)
+            for post_id, score in self.redis.zrevrange(TRENDING_KEY, 0, limit - 1, withscores=True)
+        ]
+
+    async def compact(self) -> int:
+        """
+        Rebases scores to the current time and drops stale and overflowing posts.
+        """
+        settings = get_settings()
+        return self.redis.eval(
+            COMPACT_SCRIPT, 2, TRENDING_KEY, TRENDING_EPOCH_KEY,
+            time.time(), settings.TRENDING_HALF_LIFE_HOURS * 3600,
+            settings.TRENDING_MIN_SCORE, settings.TRENDING_SIZE,
+        )
+
+    async def is_built(self) -> bool:
+        return bool(self.redis.exists(TRENDING_BUILT_KEY))
+
+    async def rebuild(self):
+        """
+        Recomputes the ranking from post_action reactions of the last TRENDING_WINDOW_HOURS.
+        """
+        settings = get_settings()
+        now = time.time()
+        half_life = settings.TRENDING_HALF_LIFE_HOURS * 3600
+        window_start = datetime.now(timezone.utc) - timedelta(hours=settings.TRENDING_WINDOW_HOURS)
+        # both bounds of the post id are inside the monthly partitions, the others and the legacy one are pruned
+        posts_since = datetime.now(timezone.utc) - timedelta(days=settings.TRENDING_POST_MAX_AGE_DAYS)
+        posts_until = datetime.now(timezone.utc) + timedelta(days=1)
+        # reactions are bucketed by hour, decay inside the hour is negligible
+        reaction_hour = func.date_trunc(literal_column("'hour'"), PostAction.dt_created)
+        reactions_query = (
+            select(PostAction.post_id, PostAction.reaction, func.count(), reaction_hour)
+            .where(
+                PostAction.dt_created >= window_start,
+                PostAction.post_id >= uuid7_min(posts_since),
+                PostAction.post_id < uuid7_min(posts_until),
+            )
+            .group_by(PostAction.post_id, PostAction.reaction, reaction_hour)
+        )
+        try:
+            reactions = await self.session.execute(reactions_query)
+        except OSError:
+            raise custom_exc.DbUnavailable(code=500, message='Database unavailable.')
+
+        scores = {}
+        for post_id, code, count, reaction_dt in reactions:
+            decay = 2 ** ((reaction_dt.timestamp() - now) / half_life)
+            weight = settings.TRENDING_WEIGHTS.get(reaction_name(code), 0.0)
+            scores[str(post_id)] = scores.get(str(post_id), 0.0) + weight * count * decay
+        scores = {post_id: score for post_id, score in scores.items() if score >= settings.TRENDING_MIN_SCORE}
+        top_scores = dict(sorted(scores.items(), key=lambda item: item[1], reverse=True)[:settings.TRENDING_SIZE])
+
+        pipeline = self.redis.pipeline()
+        pipeline.delete(TRENDING_KEY)
+        if top_scores:
+            pipeline.zadd(TRENDING_KEY, top_scores)
+        pipeline.set(TRENDING_EPOCH_KEY, now)
+        pipeline.set(TRENDING_BUILT_KEY, now)
+        pipeline.execute()
@@ -1,15 +1,28 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, delete, exc
+from sqlalchemy import select, delete, update, exc, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.engine import Row
 from uuid import UUID
+import redis
+from redis import Redis
 
-from soc_network.db.models import User
+from soc_network.db.models import User, UserProfile
 from soc_network.schemas import RegistrationForm
 from . import exceptions as custom_exc
+from .local_cache import LocalCache
 
 
 class UserRepository:
-    def __init__(self, session: AsyncSession):
+    def __init__(self, session: AsyncSession, redis_sess: Redis = None):
         self.session = session
+        # publishes changes of users to the local caches of other processes
+        self.redis = None
+        if redis_sess is not None:
+            try:
+                redis_sess.ping()
+                self.redis = redis_sess
+            except (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError):
+                pass
 
     async def add(self, potential_user: RegistrationForm) -> str:
         new_user = User(**potential_user.dict())
@@ -20,23 +33,38 @@ class UserRepository:
             raise custom_exc.DbError('Username/email already exists.')
         except OSError:
             raise custom_exc.DbUnavailable(code=500, message='Database unavailable.')
-        await self.session.refresh(new_user)
+        # id is returned by the INSERT, a refresh would open a new transaction holding the connection
         return new_user.id
 
     async def get(self, user_id: UUID):
-        get_user_query = select(User).where(User.id == user_id)
+        local_cache = LocalCache()
+        user = local_cache.get(self._user_key(user_id))
+        if user is not None:
+            return user
+        stamp = local_cache.stamp()
+        get_user_query = select(User).where(User.id == user_id, User.deleted_at.is_(None))
         try:
             user_from_db = await self.session.scalar(get_user_query)
         except OSError:
             raise custom_exc.DbUnavailable(code=500, message='Database unavailable.')
         if user_from_db is None:
             return None
+        # a copy not bound to any session, shared by the requests of the process
+        local_cache.set(
+            self._user_key(user_id),
+            User(**{column.key: getattr(user_from_db, column.key) for column in User.__table__.columns}),
+            stamp,
+        )
         return user_from_db
 
+    @staticmethod
+    def _user_key(user_id: UUID) -> str:
+        return f'user:{user_id}'
+
     # todo: refactor
     # todo: add tests
     async def get_by_username(self, username: str):
-        get_user_query = select(User).where(User.username == username)
+        get_user_query = select(User).where(User.username == username, User.deleted_at.is_(None))
         try:
             user_from_db = await self.session.scalar(get_user_query)
         except OSError:
@@ -45,24 +73,89 @@ class UserRepository:
             return None
         return user_from_db
 
+    async def get_credentials(self, username: str) -> Row | None:
+        """
+        Returns id, username and password hash of the user, the only columns authentication needs.
+        """
+        get_credentials_query = (
+            select(User.id, User.username, User.password)
+            .where(User.username == username, User.deleted_at.is_(None))
+        )
+        try:
+            return (await self.session.execute(get_credentials_query)).first()
+        except OSError:
+            raise custom_exc.DbUnavailable(code=500, message='Database unavailable.')
+
     async def delete(self, user_id: UUID):
         delete_user_query = delete(User).where(User.id == user_id)
-        await self.session.execute(delete_user_query)
         try:
+            await self.session.execute(delete_user_query)
             await self.session.commit()
+        except exc.IntegrityError:
+            await self.session.rollback()
+            raise custom_exc.DbError(f'Posts or reactions of the user {user_id} are left.')
         except OSError:
             raise custom_exc.DbUnavailable(code=500, message='Database unavailable.')
+        LocalCache().invalidate(self.redis, self._user_key(user_id))
 
-    async def update_by_email(self, email: str, data: str):
-        get_user_query = select(User).where(User.email == email)
+    async def mark_deleted(self, user_id: UUID):
+        """
+        Hides the user from reads, posts and reactions of the user are purged in background.
+        """
+        mark_deleted_query = (
+            update(User)
+            .where(User.id == user_id, User.deleted_at.is_(None))
+            .values(deleted_at=func.current_timestamp())
+        )
         try:
-            user_from_db = await self.session.scalar(get_user_query)
+            await self.session.execute(mark_deleted_query)
+            await self.session.commit()
         except OSError:
             raise custom_exc.DbUnavailable(code=500, message='Database unavailable.')
-        if user_from_db is None:
+        LocalCache().invalidate(self.redis, self._user_key(user_id))
+
+    async def list_deleted(self, limit: int) -> list[UUID]:
+        """
+        Returns ids of the users waiting for the purge, the oldest tombstones first.
+        """
+        list_deleted_query = (
+            select(User.id)
+            .where(User.deleted_at.is_not(None))
+            .order_by(User.deleted_at)
+            .limit(limit)
+            .execution_options(use_primary=True)
+        )
+        try:
+            return list(await self.session.scalars(list_deleted_query))
+        except OSError:
+            raise custom_exc.DbUnavailable(code=500, message='Database unavailable.')
+
+    async def save_profile_by_email(self, email: str, data: dict):
+        """
+        Saves Clearbit data of the user, replacing the previous one.
+        """
+        get_user_id_query = (
+            select(User.id)
+            .where(User.email == email, User.deleted_at.is_(None))
+            .execution_options(use_primary=True)
+        )
+        try:
+            user_id = await self.session.scalar(get_user_id_query)
+        except OSError:
+            raise custom_exc.DbUnavailable(code=500, message='Database unavailable.')
+        if user_id is None:
             raise custom_exc.DbError(f'No such user with email: {email}')
-        user_from_db.data = data
+        values = {"data": data, **UserProfile.promoted_fields(data)}
+        save_profile_query = (
+            insert(UserProfile)
+            .values(user_id=user_id, **values)
+            .on_conflict_do_update(
+                index_elements=[UserProfile.user_id],
+                set_={**values, "dt_updated": func.current_timestamp()},
+            )
+        )
         try:
+            await self.session.execute(save_profile_query)
             await self.session.commit()
         except OSError:
             raise custom_exc.DbUnavailable(code=500, message='Database unavailable.')
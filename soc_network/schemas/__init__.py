@@ -1,18 +1,39 @@
 from .auth.user import User
 from .auth.registration import RegistrationForm, RegistrationSuccess
-from .post.post import Post
-from .post.post_action import PostAction, PostActionEnum
-from .auth.token import Token, TokenData
-from .application_health.ping import PingResponse
+from .post.post import Post, PostSearchItem, PostSearchPage, TrendingPost
+from .post.post_action import (
+    PostAction,
+    PostActionEnum,
+    UserReaction,
+    UserReactionsPage,
+    EngagementRequest,
+    PostEngagement,
+)
+from .auth.token import Token, TokenData, Principal, RefreshRequest
+from .application_health.ping import PingResponse, PoolStats, CacheStats, KeyClassStats, Diagnostics, BlockingCalls
 
 __all__ = [
     "User",
     "RegistrationForm",
     "RegistrationSuccess",
     "Post",
+    "PostSearchItem",
+    "PostSearchPage",
+    "TrendingPost",
     "PostAction",
     "PostActionEnum",
+    "UserReaction",
+    "UserReactionsPage",
+    "EngagementRequest",
+    "PostEngagement",
     "Token",
     "TokenData",
+    "Principal",
+    "RefreshRequest",
     "PingResponse",
+    "PoolStats",
+    "CacheStats",
+    "KeyClassStats",
+    "Diagnostics",
+    "BlockingCalls",
 ]
@@ -3,3 +3,77 @@ from pydantic import BaseModel
 
 class PingResponse(BaseModel):
     message: str
+
+
+class PoolStats(BaseModel):
+    pool_size: int
+    checked_out: int
+    overflow: int
+    checkouts: int
+    avg_seconds: float
+    max_seconds: float
+    buckets: dict[str, int]
+    waiting: int
+    avg_wait_seconds: float
+    max_wait_seconds: float
+
+
+class KeyClassStats(BaseModel):
+    keys: int
+    bytes: int | None
+
+
+class LocalCacheStats(BaseModel):
+    enabled: bool
+    entries: int
+    size_bytes: int
+    hits: int
+    misses: int
+
+
+class CacheStats(BaseModel):
+    server: dict[str, int | str]
+    key_classes: dict[str, KeyClassStats]
+    local: LocalCacheStats
+
+
+class RedisDiagnostics(BaseModel):
+    available: bool
+    latency_seconds: float | None
+    pool: dict[str, int]
+
+
+class LoopLagStats(BaseModel):
+    last_seconds: float
+    avg_seconds: float
+    max_seconds: float
+    samples: int
+
+
+class RequestsStats(BaseModel):
+    in_flight: dict[str, int]
+    in_background: dict[str, int]
+
+
+class Diagnostics(BaseModel):
+    db_pools: dict[str, PoolStats]
+    redis: RedisDiagnostics
+    state_redis: RedisDiagnostics
+    loop_lag: LoopLagStats
+    requests: RequestsStats
+    background_jobs: dict[str, str]
+    pending_tasks: int
+
+
+class BlockingCallStats(BaseModel):
+    site: str
+    count: int
+    total_seconds: float
+    max_seconds: float
+    stack: list[str]
+
+
+class BlockingCalls(BaseModel):
+    enabled: bool
+    threshold_seconds: float
+    calls: list[BlockingCallStats]
@@ -1,10 +1,30 @@
+from datetime import datetime
+from uuid import UUID
+
 from pydantic import BaseModel
 
 
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: str | None = None
+
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
 
 
 class TokenData(BaseModel):
     username: str
+
+
+class Principal(BaseModel):
+    """
+    Authenticated user as stated by the access token claims, no database row behind it.
+    """
+    id: UUID
+    username: str
+    token_id: str
+    expires_at: datetime
+    # refresh token family the token was issued in, empty for tokens issued before refresh tokens
+    family_id: str | None = None
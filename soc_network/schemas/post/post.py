@@ -1,3 +1,4 @@
+from datetime import datetime
 from uuid import UUID
 from pydantic import BaseModel, constr
 
@@ -9,3 +10,27 @@ class Post(BaseModel):
 
     class Config:
         orm_mode = True
+
+
+class PostSearchItem(BaseModel):
+    id: UUID
+    body: str
+    author_id: UUID
+    dt_created: datetime
+    rank: float
+
+    class Config:
+        orm_mode = True
+
+
+class PostSearchPage(BaseModel):
+    items: list[PostSearchItem]
+    next_cursor: str | None
+
+
+class TrendingPost(BaseModel):
+    id: UUID
+    body: str
+    author_id: UUID
+    dt_created: datetime
+    score: float
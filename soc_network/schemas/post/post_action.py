@@ -1,12 +1,14 @@
+from datetime import datetime
 from enum import Enum
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 from uuid import UUID
 
+from soc_network.config import get_settings
 
-class PostActionEnum(str, Enum):
-    LIKE = "LIKE"
-    DISLIKE = "DISLIKE"
+
+# reactions come from the settings at import, changing them needs a restart
+PostActionEnum = Enum("PostActionEnum", {name: name for name in get_settings().REACTIONS}, type=str)
 
 
 class PostAction(BaseModel):
@@ -21,3 +23,38 @@ class PostAction(BaseModel):
 
 class ActionResult(BaseModel):
     message: str
+
+
+class UserReaction(BaseModel):
+    post_id: UUID
+    action: PostActionEnum
+    dt_created: datetime
+
+    class Config:
+        orm_mode = True
+        use_enum_values = True
+
+
+class UserReactionsPage(BaseModel):
+    items: list[UserReaction]
+    next_cursor: str | None
+
+
+# posts of one feed page, engagement of them is loaded in a single batch
+MAX_ENGAGEMENT_POSTS = 300
+
+
+class EngagementRequest(BaseModel):
+    post_ids: list[UUID] = Field(..., min_items=1, max_items=MAX_ENGAGEMENT_POSTS)
+
+
+class PostEngagement(BaseModel):
+    post_id: UUID
+    likes: int
+    dislikes: int
+    # counts of all reactions, the ones nobody used are omitted
+    reactions: dict[str, int]
+    my_action: PostActionEnum | None
+
+    class Config:
+        use_enum_values = True
@@ -0,0 +1,64 @@
+import os
+
+from fastapi import FastAPI
+from gunicorn.app.base import BaseApplication
+from uvicorn.workers import UvicornWorker as BaseUvicornWorker
+
+from soc_network.config import DefaultSettings, reload_settings
+from soc_network.db.connection import RedisManager, SessionManager
+from soc_network.services.common import get_hostname
+
+
+class UvicornWorker(BaseUvicornWorker):
+    """
+    Uvicorn worker with explicitly selected uvloop event loop and httptools parser.
+    """
+
+    CONFIG_KWARGS = {"loop": "uvloop", "http": "httptools", "lifespan": "on"}
+
+
+def post_fork(server, worker) -> None:
+    """
+    Drops connection pools inherited from the master and re-reads settings,
+    so every worker opens its own database and redis connections.
+    """
+    for engine in [SessionManager().engine, *SessionManager().replica_engines]:
+        engine.sync_engine.dispose(close=False)
+    RedisManager().reset()
+    reload_settings()
+
+
+class Application(BaseApplication):
+    """
+    Pre-fork server: master process loads the application once and forks workers from it.
+    """
+
+    def __init__(self, application: FastAPI, options: dict) -> None:
+        self.application = application
+        self.options = options
+        super().__init__()
+
+    def load_config(self) -> None:
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self) -> FastAPI:
+        return self.application
+
+
+def run_production(application: FastAPI, settings: DefaultSettings) -> None:
+    """
+    Runs application with several worker processes.
+    """
+    options = {
+        "bind": f"{get_hostname(settings.APP_HOST)}:{settings.APP_PORT}",
+        "workers": settings.APP_WORKERS or os.cpu_count() or 1,
+        "worker_class": f"{__name__}.UvicornWorker",
+        "max_requests": settings.APP_MAX_REQUESTS,
+        "max_requests_jitter": settings.APP_MAX_REQUESTS_JITTER,
+        "graceful_timeout": settings.APP_GRACEFUL_TIMEOUT,
+        "keepalive": settings.APP_KEEPALIVE,
+        "post_fork": post_fork,
+        "loglevel": "info",
+    }
+    Application(application, options).run()
@@ -0,0 +1,6 @@
+from .invalidation import listen_invalidations
+
+
+__all__ = [
+    "listen_invalidations",
+]
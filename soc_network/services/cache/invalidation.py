@@ -0,0 +1,46 @@
+import asyncio
+import logging
+
+from redis import asyncio as redis_asyncio
+
+from soc_network.config import get_settings
+from soc_network.repositories.local_cache import INVALIDATION_CHANNEL, LocalCache
+
+logger = logging.getLogger(__name__)
+
+# pause before subscribing again after the channel is lost
+RESUBSCRIBE_DELAY_SECONDS = 1
+
+
+async def listen_invalidations():
+    """
+    Drops keys changed by any worker process from the local cache of this one.
+    The local cache is off while the channel is not listened to, a missed message would leave a stale entry.
+    """
+    local_cache = LocalCache()
+    while True:
+        try:
+            await listen_invalidations_once(local_cache)
+        except Exception:  # noqa: keep the loop alive, redis may come back
+            logger.exception("Cache invalidation channel lost.")
+        finally:
+            local_cache.stop_listening()
+        await asyncio.sleep(RESUBSCRIBE_DELAY_SECONDS)
+
+
+async def listen_invalidations_once(local_cache: LocalCache):
+    settings = get_settings()
+    # a subscribed connection is held for good, it is not taken from the pool of the requests;
+    # the asyncio client waits for messages without a thread and stops on cancel
+    client = redis_asyncio.Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=settings.REDIS_CACHE_DB)
+    pubsub = client.pubsub(ignore_subscribe_messages=True)
+    try:
+        await pubsub.subscribe(INVALIDATION_CHANNEL)
+        local_cache.start_listening()
+        while True:
+            message = await pubsub.get_message(timeout=1.0)
+            if message is not None and message["type"] == "message":
+                local_cache.discard(*message["data"].decode().split("\n"))
+    finally:
+        await pubsub.close()
+        await client.close()
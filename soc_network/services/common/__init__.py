@@ -1,5 +1,8 @@
+from .cursor import decode_cursor, encode_cursor
 from .hostname import get_hostname
 
 __all__ = [
+    "decode_cursor",
+    "encode_cursor",
     "get_hostname",
 ]
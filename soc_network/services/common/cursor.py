@@ -0,0 +1,22 @@
+import base64
+import json
+
+
+def encode_cursor(*values) -> str:
+    """
+    Packs keyset pagination position into an opaque url-safe string.
+    """
+    return base64.urlsafe_b64encode(json.dumps(values, default=str).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> list:
+    """
+    Unpacks position made by `encode_cursor`, raises ValueError on malformed cursor.
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Malformed cursor: {cursor}") from e
+    if not isinstance(values, list):
+        raise ValueError(f"Malformed cursor: {cursor}")
+    return values
@@ -0,0 +1,10 @@
+from .blocking import BlockingCallWatchdog
+from .in_flight import InFlightMiddleware
+from .loop_lag import LoopLagMonitor
+
+
+__all__ = [
+    "BlockingCallWatchdog",
+    "InFlightMiddleware",
+    "LoopLagMonitor",
+]
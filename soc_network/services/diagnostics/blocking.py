@@ -0,0 +1,135 @@
+import asyncio
+import logging
+import sys
+import threading
+import traceback
+from pathlib import Path
+from time import monotonic, sleep
+from types import FrameType
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+# the log is written by the watchdog thread only, so the file writes do not block the event loop
+logger.propagate = False
+
+# call sites are looked for in the frames of these files, the first frame of the stack is taken otherwise
+PACKAGE_DIR = str(Path(__file__).parents[2])
+THIS_FILE = str(Path(__file__))
+# frames kept in the reported stack, innermost ones
+STACK_DEPTH = 30
+
+
+def call_site(stack: traceback.StackSummary) -> str:
+    """
+    "path:line in function" of the innermost frame of the application code, it is what made the blocking call.
+    """
+    for frame in reversed(stack):
+        if frame.filename.startswith(PACKAGE_DIR) and frame.filename != THIS_FILE:
+            break
+    else:
+        frame = stack[-1]
+    return f"{frame.filename}:{frame.lineno} in {frame.name}"
+
+
+class BlockingCallWatchdog:
+    """
+    Finds code holding the event loop of the worker process: a coroutine on the loop bumps a heartbeat,
+    a thread checks it and takes the stack of the loop thread when the heartbeat is late by the threshold.
+    Stalls are aggregated by call site and logged to BLOCKING_WATCHDOG_LOG, the stack once per call site.
+    Meant for debug runs and load tests, it costs a thread waking up several times per threshold.
+    """
+
+    def __init__(self) -> None:
+        if not hasattr(self, "reports"):
+            self.lock = threading.Lock()
+            # call site: {"count", "total_seconds", "max_seconds", "stack"}
+            self.reports: dict[str, dict] = {}
+            self.threshold = 0.0
+            self.running = False
+            self.beat = 0.0
+            # (heartbeat before the latest late one, how late it was)
+            self.late: tuple[float, float] = (0.0, 0.0)
+            self.loop_thread_id: int | None = None
+            # (heartbeat the stall started after, call site, stack) of the stall going on
+            self.stall: tuple[float, str, list[str]] | None = None
+
+    def __new__(cls):
+        if not hasattr(cls, "instance"):
+            cls.instance = super(BlockingCallWatchdog, cls).__new__(cls)
+        return cls.instance  # noqa
+
+    async def run(self, threshold: float, log_path: str):
+        """
+        Watches the running loop till cancelled.
+        """
+        if not logger.handlers:
+            handler = logging.FileHandler(log_path)
+            handler.setFormatter(logging.Formatter("%(asctime)s %(process)d %(levelname)s %(message)s"))
+            logger.addHandler(handler)
+        self.threshold = threshold
+        self.loop_thread_id = threading.get_ident()
+        self.beat = monotonic()
+        self.stall = None
+        self.running = True
+        watcher = threading.Thread(target=self._watch, name="blocking-call-watchdog", daemon=True)
+        watcher.start()
+        interval = threshold / 4
+        try:
+            while True:
+                await asyncio.sleep(interval)
+                beat = monotonic()
+                if beat - self.beat >= threshold:
+                    self.late = (self.beat, beat - self.beat - interval)
+                self.beat = beat
+        finally:
+            self.running = False
+
+    def _watch(self):
+        while self.running:
+            sleep(self.threshold / 4)
+            beat = self.beat
+            stall = self.stall
+            if stall is not None and stall[0] != beat:
+                # the loop is back, the heartbeat after the stall knows how late it was
+                late_after, duration = self.late
+                if late_after == stall[0]:
+                    self._report(stall[1], stall[2], duration)
+                self.stall = None
+            elif stall is None and monotonic() - beat >= self.threshold:
+                frame = sys._current_frames().get(self.loop_thread_id)
+                if frame is None:
+                    continue
+                site, stack = self._capture(frame)
+                # the stack is of the stall only if the loop has not moved on meanwhile
+                if self.beat == beat:
+                    self.stall = (beat, site, stack)
+
+    @staticmethod
+    def _capture(frame: FrameType) -> tuple[str, list[str]]:
+        stack = traceback.extract_stack(frame)[-STACK_DEPTH:]
+        return call_site(stack), traceback.format_list(stack)
+
+    def _report(self, site: str, stack: list[str], duration: float):
+        with self.lock:
+            report = self.reports.get(site)
+            if report is None:
+                report = self.reports[site] = {"count": 0, "total_seconds": 0.0, "max_seconds": 0.0, "stack": stack}
+            report["count"] += 1
+            report["total_seconds"] += duration
+            report["max_seconds"] = max(report["max_seconds"], duration)
+        if report["count"] == 1:
+            logger.warning(f"Event loop blocked for {duration:.3f}s at {site}:\n{''.join(stack)}")
+        else:
+            logger.warning(f"Event loop blocked for {duration:.3f}s at {site} ({report['count']} times)")
+
+    def snapshot(self) -> list[dict]:
+        """
+        Call sites by total blocked time, the worst first.
+        """
+        with self.lock:
+            reports = [{"site": site, **report} for site, report in self.reports.items()]
+        return sorted(reports, key=lambda report: report["total_seconds"], reverse=True)
+
+    def clear(self):
+        with self.lock:
+            self.reports = {}
@@ -0,0 +1,55 @@
+from collections import Counter
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from soc_network.config import get_settings
+from soc_network.services.rate_limit import RateLimitMiddleware
+
+
+class InFlightMiddleware:
+    """
+    Counts requests of the worker process per route ("METHOD /route/path" without PATH_PREFIX):
+    in flight until the response is sent, then in background until the background tasks of the response are done.
+    """
+
+    in_flight: Counter = Counter()
+    in_background: Counter = Counter()
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        route_key = RateLimitMiddleware.get_route_key(scope, get_settings().PATH_PREFIX)
+        counter = self.in_flight
+        counter[route_key] += 1
+
+        async def send_counted(message: Message) -> None:
+            nonlocal counter
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False) \
+                    and counter is self.in_flight:
+                self._done(counter, route_key)
+                counter = self.in_background
+                counter[route_key] += 1
+
+        try:
+            await self.app(scope, receive, send_counted)
+        finally:
+            self._done(counter, route_key)
+
+    @staticmethod
+    def _done(counter: Counter, route_key: str) -> None:
+        counter[route_key] -= 1
+        if counter[route_key] <= 0:
+            del counter[route_key]
+
+    @classmethod
+    def snapshot(cls) -> dict:
+        return {
+            "in_flight": dict(cls.in_flight),
+            "in_background": dict(cls.in_background),
+        }
@@ -0,0 +1,45 @@
+import asyncio
+from collections import deque
+from time import monotonic
+
+
+class LoopLagMonitor:
+    """
+    Event loop lag of the worker process: how much later than asked a short sleep wakes up.
+    A lag means coroutines are starved by blocking code or by too much work.
+    """
+
+    # samples of the last minute are reported
+    WINDOW_SECONDS = 60
+
+    def __init__(self) -> None:
+        if not hasattr(self, "samples"):
+            # (taken at by monotonic clock, lag in seconds)
+            self.samples: deque[tuple[float, float]] = deque()
+
+    def __new__(cls):
+        if not hasattr(cls, "instance"):
+            cls.instance = super(LoopLagMonitor, cls).__new__(cls)
+        return cls.instance  # noqa
+
+    async def run(self, interval: float):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(interval)
+            self.add(max(loop.time() - started - interval, 0.0))
+
+    def add(self, lag: float):
+        now = monotonic()
+        self.samples.append((now, lag))
+        while self.samples[0][0] < now - self.WINDOW_SECONDS:
+            self.samples.popleft()
+
+    def snapshot(self) -> dict:
+        lags = [lag for _, lag in self.samples]
+        return {
+            "last_seconds": lags[-1] if lags else 0.0,
+            "avg_seconds": sum(lags) / len(lags) if lags else 0.0,
+            "max_seconds": max(lags, default=0.0),
+            "samples": len(lags),
+        }
@@ -28,3 +28,15 @@ class VerifierUnavailable(Exception):
 
 class UnVerifiedEmailError(Exception):
     pass
+
+
+class BadCursorError(Exception):
+    pass
+
+
+class InvalidTokenError(Exception):
+    pass
+
+
+class TokenReuseError(Exception):
+    pass
@@ -1,6 +1,8 @@
 from .database import health_check_db
+from .redis import health_check_redis
 
 
 __all__ = [
     "health_check_db",
+    "health_check_redis",
 ]
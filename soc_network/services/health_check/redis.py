@@ -0,0 +1,16 @@
+from time import monotonic
+
+import redis
+from redis import Redis
+
+
+async def health_check_redis(redis_sess: Redis) -> float | None:
+    """
+    Returns the round-trip time of a PING in seconds, None when redis is unavailable.
+    """
+    started = monotonic()
+    try:
+        redis_sess.ping()
+    except (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError):
+        return None
+    return monotonic() - started
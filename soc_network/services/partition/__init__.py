@@ -0,0 +1,6 @@
+from .maintenance import maintain_partitions
+
+
+__all__ = [
+    "maintain_partitions",
+]
@@ -0,0 +1,51 @@
+import asyncio
+import logging
+from datetime import datetime, timezone
+from pathlib import Path
+
+from soc_network.config import get_settings
+from soc_network.db.connection import RedisManager, SessionManager
+from soc_network.repositories import PartitionRepository
+from soc_network.repositories.partition_repository import add_months, month_start
+
+logger = logging.getLogger(__name__)
+
+# only one worker process changes partitions during an interval
+PARTITION_LOCK_KEY = "partition:lock"
+
+
+async def maintain_partitions(interval: int):
+    """
+    Periodically creates monthly partitions of posts ahead and archives the old ones.
+    """
+    while True:
+        try:
+            await maintain_partitions_once(interval)
+        except Exception:  # noqa: keep the loop alive, the next run may succeed
+            logger.exception("Partition maintenance failed.")
+        await asyncio.sleep(interval)
+
+
+async def maintain_partitions_once(interval: int):
+    redis_sess = RedisManager().get_state_client()
+    if not redis_sess.set(PARTITION_LOCK_KEY, 1, nx=True, ex=max(interval - 1, 1)):
+        return
+    settings = get_settings()
+    this_month = month_start(datetime.now(timezone.utc))
+    session_maker = SessionManager().get_session_maker()
+    async with session_maker() as session:
+        partition_repo = PartitionRepository(session)
+        for months in range(settings.PARTITION_MONTHS_AHEAD + 1):
+            month = add_months(this_month, months)
+            if await partition_repo.create_month(month):
+                logger.info(f"Partitions of {month:%Y-%m} created.")
+        if settings.PARTITION_ARCHIVE_AFTER_MONTHS <= 0:
+            return
+        oldest_kept = add_months(this_month, -settings.PARTITION_ARCHIVE_AFTER_MONTHS)
+        # months detached by hand are archived as well, they are not readable until restored anyway
+        months = await partition_repo.attached_months() | await partition_repo.detached_months()
+        for month in sorted(months):
+            if month >= oldest_kept:
+                break
+            paths = await partition_repo.archive_month(month, Path(settings.PARTITION_ARCHIVE_DIR))
+            logger.info(f"Partitions of {month:%Y-%m} archived to {', '.join(map(str, paths))}.")
@@ -1,16 +1,22 @@
+from datetime import datetime
 from uuid import UUID
 
-from soc_network.repositories import PostRepository, PostActionRepository, UserRepository
-from soc_network.db.models import User
-from soc_network.schemas import Post as PostSchema, PostActionEnum
+from soc_network.repositories import PostRepository, PostActionRepository, UserRepository, TrendingRepository
+from soc_network.schemas import Post as PostSchema, PostActionEnum, PostSearchItem, PostSearchPage, TrendingPost
+from soc_network.schemas import Principal, UserReaction, UserReactionsPage, PostEngagement
+from soc_network.services.common import decode_cursor, encode_cursor
 from soc_network.services import exceptions as serv_exc
 from soc_network.repositories import exceptions as db_exc
 
 
 async def create_post(
         post: PostSchema,
-        post_repo: PostRepository
+        post_repo: PostRepository,
+        user_repo: UserRepository,
 ):
+    # the row of a deleted user stays till the purge, tokens of the user must not add posts meanwhile
+    if not await user_repo.get(user_id=post.author_id):
+        raise serv_exc.NoUserError('No such user.')
     try:
         return await post_repo.add(post)
     except db_exc.DbError as e:
@@ -24,10 +30,76 @@ async def get_post(
     return await post_repo.get(post_id=post_id)
 
 
+def make_post_etag(post_id: UUID, version: int) -> str:
+    """
+    Strong ETag of the post state, `version` is dt_updated in microseconds.
+    """
+    return f'"{post_id.hex}-{version:x}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """
+    If-None-Match check, uses weak comparison as RFC 9110 requires for this header.
+    """
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [candidate.strip().removeprefix("W/") for candidate in if_none_match.split(",")]
+    return etag in candidates
+
+
+async def get_post_etag(
+        post_id: UUID,
+        post_repo: PostRepository,
+) -> str | None:
+    version = await post_repo.get_version(post_id=post_id)
+    if version is None:
+        return None
+    return make_post_etag(post_id, version)
+
+
+async def search_posts(
+        query: str,
+        limit: int,
+        post_repo: PostRepository,
+        author_id: UUID | None = None,
+        cursor: str | None = None,
+        since: datetime | None = None,
+) -> PostSearchPage:
+    after = None
+    if cursor is not None:
+        try:
+            rank, post_id = decode_cursor(cursor)
+            after = (float(rank), UUID(post_id))
+        except (ValueError, TypeError):
+            raise serv_exc.BadCursorError(f'Bad cursor: {cursor}')
+    found = await post_repo.search(query=query, limit=limit, author_id=author_id, after=after, since=since)
+    items = [
+        PostSearchItem(id=post.id, body=post.body, author_id=post.author_id, dt_created=post.dt_created, rank=rank)
+        for post, rank in found
+    ]
+    next_cursor = encode_cursor(items[-1].rank, items[-1].id) if len(items) == limit else None
+    return PostSearchPage(items=items, next_cursor=next_cursor)
+
+
+async def get_trending_posts(
+        limit: int,
+        post_repo: PostRepository,
+        trending_repo: TrendingRepository,
+) -> list[TrendingPost]:
+    top = await trending_repo.top(limit=limit)
+    posts = await post_repo.list_by_ids([post_id for post_id, _ in top])
+    scores = dict(top)
+    return [
+        TrendingPost(id=post.id, body=post.body, author_id=post.author_id, dt_created=post.dt_created,
+                     score=scores[post.id])
+        for post in posts
+    ]
+
+
 async def update_post(
         post_id: UUID,
         new_body: str,
-        user: User,
+        user: Principal,
         post_repo: PostRepository,
 ):
     permissions = await have_permissions_to_edit_post(post_id, user, post_repo)
@@ -41,15 +113,10 @@ async def update_post(
 
 async def delete_post(
         post_id: UUID,
-        user: User,
+        user: Principal,
         post_repo: PostRepository,
-        user_repo: UserRepository,
-        post_act_repo: PostActionRepository,
+        trending_repo: TrendingRepository,
 ):
-    user_from_db = await user_repo.get(user_id=user.id)
-    if not user_from_db:
-        raise serv_exc.NoUserError('No such user.')
-
     post = await post_repo.get(post_id=post_id)
     if not post:
         raise serv_exc.NoPostError(f'No such post id: {post_id}')
@@ -58,26 +125,19 @@ async def delete_post(
     if not permissions:
         raise serv_exc.NotPermissionsError(f'User {user.username} have not permissions to delete post {post_id}.')
 
-    # delete all actions that related to post
-    post_acts = await post_act_repo.list_by_post_id(post_id=post_id)
-    for post_act in post_acts:
-        await post_act_repo.delete_by_post_user_id(post_id=post_id, user_id=post_act.user_id)
-
-    await post_repo.delete(post_id=post_id)
+    # actions related to the post are purged in background
+    await post_repo.mark_deleted(post_id=post_id)
+    await trending_repo.remove(post_id=post_id)
 
 
 async def rate_post(
         post_id: UUID,
-        user: User,
+        user: Principal,
         action: PostActionEnum,
         post_repo: PostRepository,
-        user_repo: UserRepository,
         post_act_repo: PostActionRepository,
+        trending_repo: TrendingRepository,
 ):
-    user_from_db = await user_repo.get(user_id=user.id)
-    if not user_from_db:
-        raise serv_exc.NoUserError('No such user.')
-
     post_from_db = await post_repo.get(post_id=post_id)
     if not post_from_db:
         raise serv_exc.NoPostError('No such post.')
@@ -86,34 +146,31 @@ async def rate_post(
     if not permissions:
         raise serv_exc.NotPermissionsError(f'User {user.username} have not permissions to evaluate post {post_id}.')
 
-    # checking that there are no other actions from this user with this post
-    post_acts = await post_act_repo.list_by_post_id_user_id(post_id=post_id, user_id=user.id)
-    # if there is, then delete them all (like - is reverse action for dislike)
-    action_duplicate_flag = False
-    for post_act in post_acts:
-        if post_act.action == action:
-            action_duplicate_flag = True
-            break
-        else:
-            await post_act_repo.delete(user_id=user.id, post_id=post_id, action=post_act.action)
-    if action_duplicate_flag:
+    # a user has one reaction to a post, a new one replaces it
+    user_action = await post_act_repo.get_user_action(post_id=post_id, user_id=user.id)
+    if user_action == action:
         raise serv_exc.ActionDuplicateError('This action duplicates existent action.')
-
-    await post_act_repo.add(user_id=user.id, post_id=post_id, action=action)
+    if user_action is not None:
+        replaced_action, replaced_at = await post_act_repo.change(user_id=user.id, post_id=post_id, action=action)
+        await trending_repo.bump(post_id=post_id, action=replaced_action, sign=-1, reacted_at=replaced_at)
+    else:
+        try:
+            await post_act_repo.add(user_id=user.id, post_id=post_id, action=action)
+        except db_exc.DbError:
+            # the user has a reaction with a code that is not configured anymore, it is replaced as any other
+            replaced_action, replaced_at = await post_act_repo.change(user_id=user.id, post_id=post_id, action=action)
+            await trending_repo.bump(post_id=post_id, action=replaced_action, sign=-1, reacted_at=replaced_at)
+    await trending_repo.bump(post_id=post_id, action=action)
 
 
 async def delete_post_rate(
         post_id: UUID,
-        user: User,
+        user: Principal,
         action: PostActionEnum,
         post_repo: PostRepository,
-        user_repo: UserRepository,
         post_act_repo: PostActionRepository,
+        trending_repo: TrendingRepository,
 ):
-    user_from_db = await user_repo.get(user_id=user.id)
-    if not user_from_db:
-        raise serv_exc.NoUserError('No such user.')
-
     post_from_db = await post_repo.get(post_id=post_id)
     if not post_from_db:
         raise serv_exc.NoPostError('No such post.')
@@ -128,12 +185,62 @@ async def delete_post_rate(
         raise serv_exc.NotPermissionsError(f'There is not action {action} on the post {post_id} from the '
                                            f'user {user.username}')
 
-    await post_act_repo.delete(user_id=user.id, post_id=post_id, action=action)
+    reacted_at = await post_act_repo.delete(user_id=user.id, post_id=post_id, action=action)
+    if reacted_at is not None:
+        await trending_repo.bump(post_id=post_id, action=action, sign=-1, reacted_at=reacted_at)
+
+
+async def list_user_reactions(
+        user: Principal,
+        limit: int,
+        post_act_repo: PostActionRepository,
+        cursor: str | None = None,
+) -> UserReactionsPage:
+    after = None
+    if cursor is not None:
+        try:
+            # cursors issued before one reaction per post carry the action as well
+            dt_created, post_id, *_ = decode_cursor(cursor)
+            after = (datetime.fromisoformat(dt_created), UUID(post_id))
+        except (ValueError, TypeError):
+            raise serv_exc.BadCursorError(f'Bad cursor: {cursor}')
+    post_acts = [
+        post_act async for post_act in post_act_repo.iter_by_user_id(user_id=user.id, limit=limit, after=after)
+    ]
+    # reactions with codes that are not configured are skipped, the page goes on after them
+    items = [UserReaction.from_orm(post_act) for post_act in post_acts if post_act.action is not None]
+    next_cursor = None
+    if len(post_acts) == limit:
+        next_cursor = encode_cursor(post_acts[-1].dt_created.isoformat(), post_acts[-1].post_id)
+    return UserReactionsPage(items=items, next_cursor=next_cursor)
+
+
+async def get_posts_engagement(
+        posts_ids: list[UUID],
+        user: Principal,
+        post_act_repo: PostActionRepository,
+) -> list[PostEngagement]:
+    # duplicates are answered once, order of the first occurrences is kept
+    posts_ids = list(dict.fromkeys(posts_ids))
+    summary = await post_act_repo.summarize_by_post_ids(posts_ids=posts_ids, user_id=user.id)
+    engagement = []
+    for post_id in posts_ids:
+        post_summary = summary[post_id]
+        reactions = {action: count for action, (count, _) in post_summary.items() if count}
+        my_action = next((action for action, (_, user_did) in post_summary.items() if user_did), None)
+        engagement.append(PostEngagement(
+            post_id=post_id,
+            likes=reactions.get(PostActionEnum.LIKE.value, 0),
+            dislikes=reactions.get(PostActionEnum.DISLIKE.value, 0),
+            reactions=reactions,
+            my_action=my_action,
+        ))
+    return engagement
 
 
 async def have_permissions_to_edit_post(
         post_id: UUID,
-        user: User,
+        user: Principal,
         post_repo: PostRepository,
 ):
     post = await post_repo.get(post_id=post_id)
@@ -142,7 +249,7 @@ async def have_permissions_to_edit_post(
 
 async def have_permissions_to_delete_post(
         post_id: UUID,
-        user: User,
+        user: Principal,
         post_repo: PostRepository,
 ):
     post = await post_repo.get(post_id=post_id)
@@ -151,7 +258,7 @@ async def have_permissions_to_delete_post(
 
 async def have_permissions_to_rate_post(
         post_id: UUID,
-        user: User,
+        user: Principal,
         post_repo: PostRepository,
 ):
     post = await post_repo.get(post_id=post_id)
@@ -160,12 +267,9 @@ async def have_permissions_to_rate_post(
 
 async def have_permissions_to_delete_post_act(
         post_id: UUID,
-        user: User,
+        user: Principal,
         action: str,
         post_act_repo: PostActionRepository,
 ):
-    post_acts = await post_act_repo.list_by_post_id_user_id(post_id=post_id, user_id=user.id)
-    for post in post_acts:
-        if post.action == action:
-            return True
-    return False
+    user_action = await post_act_repo.get_user_action(post_id=post_id, user_id=user.id)
+    return user_action == action
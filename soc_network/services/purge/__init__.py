@@ -0,0 +1,6 @@
+from .maintenance import purge_deleted
+
+
+__all__ = [
+    "purge_deleted",
+]
@@ -0,0 +1,143 @@
+import asyncio
+import logging
+from datetime import datetime, timezone
+
+from redis import Redis
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from soc_network.config import get_settings
+from soc_network.db.connection import RedisManager, SessionManager
+from soc_network.repositories import PostRepository, UserRepository, PostActionRepository, TrendingRepository
+from soc_network.repositories import exceptions as db_exc
+
+logger = logging.getLogger(__name__)
+
+# only one worker process purges during an interval, the lock is extended while the purge goes on
+PURGE_LOCK_KEY = "purge:lock"
+# counters of purged rows and the object being purged now
+PURGE_PROGRESS_KEY = "purge:progress"
+
+
+async def purge_deleted(interval: int):
+    """
+    Periodically removes rows and cache of deleted posts and users.
+    """
+    while True:
+        try:
+            await purge_deleted_once(interval)
+        except Exception:  # noqa: keep the loop alive, the next run continues from the tombstones left
+            logger.exception("Purge of deleted posts and users failed.")
+        await asyncio.sleep(interval)
+
+
+async def purge_deleted_once(interval: int):
+    state_redis = RedisManager().get_state_client()
+    if not state_redis.set(PURGE_LOCK_KEY, 1, nx=True, ex=interval):
+        return
+    session_maker = SessionManager().get_session_maker()
+    async with session_maker() as session:
+        purger = Purger(session, RedisManager().get_client(), state_redis, interval)
+        finished = await purger.run()
+    logger.info(f"Purge run {'finished' if finished else 'stopped by the batches limit'}, "
+                f"{purger.batches_done} batches done.")
+
+
+class Purger:
+    """
+    Removes deleted objects in bounded batches, every batch is a separate short transaction.
+    Batches of one run are throttled and limited, the rest is left to the next run.
+    Caches of the purged objects are in `redis_sess`, the lock, the progress and the trending ranking
+    in `state_redis`.
+    """
+
+    def __init__(self, session: AsyncSession, redis_sess: Redis, state_redis: Redis, interval: int):
+        settings = get_settings()
+        self.batch_size = settings.PURGE_BATCH_SIZE
+        self.pause = settings.PURGE_BATCH_PAUSE_MS / 1000
+        self.max_batches = settings.PURGE_MAX_BATCHES
+        self.batches_done = 0
+        # users whose content is purged by this run, only they are deleted at its end
+        self.users_ids = []
+        self.interval = interval
+        self.state_redis = state_redis
+        self.post_repo = PostRepository(session, redis_sess)
+        self.user_repo = UserRepository(session, redis_sess)
+        self.post_act_repo = PostActionRepository(session, redis_sess)
+        self.trending_repo = TrendingRepository(session, state_redis)
+
+    async def run(self) -> bool:
+        """
+        Returns False when the run was stopped by the batches limit.
+        """
+        # posts of deleted users become tombstones first, so they are purged as any deleted post
+        return (
+            await self.purge_users_content()
+            and await self.purge_posts()
+            and await self.purge_users()
+        )
+
+    async def purge_users_content(self) -> bool:
+        self.users_ids = await self.user_repo.list_deleted(limit=self.batch_size)
+        for user_id in self.users_ids:
+            self._track(current=f"user:{user_id}")
+            while posts_ids := await self.post_repo.mark_deleted_by_author(author_id=user_id, limit=self.batch_size):
+                for post_id in posts_ids:
+                    await self.trending_repo.remove(post_id=post_id)
+                if not await self._next_batch():
+                    return False
+            while actions_count := await self.post_act_repo.purge_batch(limit=self.batch_size, user_id=user_id):
+                self._track(actions=actions_count)
+                if not await self._next_batch():
+                    return False
+        return True
+
+    async def purge_posts(self) -> bool:
+        while posts_ids := await self.post_repo.list_deleted(limit=self.batch_size):
+            for post_id in posts_ids:
+                self._track(current=f"post:{post_id}")
+                while actions_count := await self.post_act_repo.purge_batch(limit=self.batch_size, post_id=post_id):
+                    self._track(actions=actions_count)
+                    if not await self._next_batch():
+                        return False
+                await self.post_repo.delete(post_id=post_id)
+                self.post_act_repo.forget_post(post_id=post_id)
+                self._track(posts=1)
+                if not await self._next_batch():
+                    return False
+        return True
+
+    async def purge_users(self) -> bool:
+        for user_id in self.users_ids:
+            if (
+                await self.post_repo.author_has_posts(author_id=user_id)
+                or await self.post_act_repo.user_has_actions(user_id=user_id)
+            ):
+                # rows of the user are beyond the current run or were added since its content was purged
+                continue
+            try:
+                await self.user_repo.delete(user_id=user_id)
+            except db_exc.DbError:
+                logger.info(f"User {user_id} is left to the next purge run, rows of the user were added.")
+                continue
+            self._track(users=1)
+            if not await self._next_batch():
+                return False
+        self._track(current="")
+        return True
+
+    async def _next_batch(self) -> bool:
+        self.batches_done += 1
+        if self.batches_done >= self.max_batches:
+            return False
+        await asyncio.sleep(self.pause)
+        self.state_redis.expire(PURGE_LOCK_KEY, self.interval)
+        return True
+
+    def _track(self, current: str | None = None, **purged_counts: int):
+        pipeline = self.state_redis.pipeline(transaction=False)
+        for name, count in purged_counts.items():
+            pipeline.hincrby(PURGE_PROGRESS_KEY, f"{name}_purged", count)
+        if current is not None:
+            pipeline.hset(PURGE_PROGRESS_KEY, "current", current)
+        pipeline.hset(PURGE_PROGRESS_KEY, "dt_updated", datetime.now(timezone.utc).isoformat())
+        pipeline.execute()
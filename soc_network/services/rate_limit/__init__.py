@@ -0,0 +1,8 @@
+from .limiter import TokenBucketLimiter
+from .middleware import RateLimitMiddleware
+
+
+__all__ = [
+    "RateLimitMiddleware",
+    "TokenBucketLimiter",
+]
@@ -0,0 +1,92 @@
+import logging
+import math
+from time import monotonic
+
+import redis
+from redis import Redis
+
+logger = logging.getLogger(__name__)
+
+# Token buckets of all identities (ip, user) of the request are checked together,
+# tokens are taken only when every bucket has them. Returns {allowed, retry_after_seconds}.
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local ttl = math.ceil(burst / rate * 1000) + 1000
+local buckets = {}
+local retry_after = 0
+for i, key in ipairs(KEYS) do
+    local bucket = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(bucket[1]) or burst
+    local ts = tonumber(bucket[2]) or now
+    tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+    if tokens < 1 then
+        retry_after = math.max(retry_after, (1 - tokens) / rate)
+    end
+    buckets[i] = tokens
+end
+local allowed = 0
+if retry_after == 0 then
+    allowed = 1
+end
+for i, key in ipairs(KEYS) do
+    redis.call('HSET', key, 'tokens', buckets[i] - allowed, 'ts', now)
+    redis.call('PEXPIRE', key, ttl)
+end
+return {allowed, tostring(retry_after)}
+"""
+
+
+class TokenBucketLimiter:
+    """
+    Token bucket rate limiter shared by all processes through redis.
+    Falls back to in-process buckets while redis is unavailable.
+    """
+
+    def __init__(self, redis_sess: Redis, redis_retry_seconds: float = 5.0, local_max_buckets: int = 100000):
+        self.redis = redis_sess
+        self.script = redis_sess.register_script(TOKEN_BUCKET_SCRIPT)
+        self.redis_retry_seconds = redis_retry_seconds
+        self.redis_down_until = 0.0
+        self.local_max_buckets = local_max_buckets
+        self.local_buckets: dict[str, list[float]] = {}
+
+    def acquire(self, keys: list[str], rate: float, burst: int) -> tuple[bool, float]:
+        """
+        Takes one token from every bucket. Returns (allowed, seconds to wait before retry).
+        """
+        if monotonic() >= self.redis_down_until:
+            try:
+                allowed, retry_after = self.script(keys=keys, args=[rate, burst])
+                return bool(allowed), float(retry_after)
+            except (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError):
+                logger.warning("Redis is unavailable, rate limits are checked per process.")
+                self.redis_down_until = monotonic() + self.redis_retry_seconds
+        return self._acquire_local(keys, rate, burst)
+
+    def _acquire_local(self, keys: list[str], rate: float, burst: int) -> tuple[bool, float]:
+        now = monotonic()
+        if len(self.local_buckets) > self.local_max_buckets:
+            # buckets that are refilled by now are equal to new ones
+            self.local_buckets = {
+                key: bucket for key, bucket in self.local_buckets.items()
+                if bucket[0] + (now - bucket[1]) * rate < burst
+            }
+        buckets = []
+        retry_after = 0.0
+        for key in keys:
+            tokens, ts = self.local_buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - ts) * rate)
+            if tokens < 1:
+                retry_after = max(retry_after, (1 - tokens) / rate)
+            buckets.append(tokens)
+        allowed = retry_after == 0
+        for key, tokens in zip(keys, buckets):
+            self.local_buckets[key] = [tokens - allowed, now]
+        return allowed, retry_after
+
+
+def retry_after_header(retry_after: float) -> str:
+    return str(max(1, math.ceil(retry_after)))
@@ -0,0 +1,76 @@
+from jose import JWTError, jwt
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.routing import Match
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from soc_network.config import get_settings
+from soc_network.db.connection import RedisManager
+from .limiter import TokenBucketLimiter, retry_after_header
+
+
+class RateLimitMiddleware:
+    """
+    Rejects requests over per-ip and per-user limits with 429 before routing,
+    so no database session is opened for them.
+    Limits are looked up by "METHOD /route/path" (without PATH_PREFIX) in RATE_LIMITS.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+        settings = get_settings()
+        self.limiter = TokenBucketLimiter(
+            RedisManager().get_state_client(),
+            redis_retry_seconds=settings.RATE_LIMIT_REDIS_RETRY_SECONDS,
+        )
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        settings = get_settings()
+        if scope["type"] != "http" or not settings.RATE_LIMIT_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        route_key = self.get_route_key(scope, settings.PATH_PREFIX)
+        rate, burst = settings.RATE_LIMITS.get(route_key, settings.RATE_LIMIT_DEFAULT)
+        bucket_keys = [f"rate_limit:{route_key}:ip:{scope['client'][0] if scope.get('client') else ''}"]
+        username = self.get_username(scope)
+        if username is not None:
+            bucket_keys.append(f"rate_limit:{route_key}:user:{username}")
+
+        allowed, retry_after = self.limiter.acquire(bucket_keys, rate, burst)
+        if not allowed:
+            response = JSONResponse(
+                status_code=429,
+                content={"code": 429, "message": "Too many requests."},
+                headers={"Retry-After": retry_after_header(retry_after)},
+            )
+            await response(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
+
+    @staticmethod
+    def get_route_key(scope: Scope, path_prefix: str) -> str:
+        path = scope["path"]
+        for route in scope["app"].router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                path = route.path
+                break
+        if path.startswith(path_prefix):
+            path = path[len(path_prefix):]
+        return f"{scope['method']} {path}"
+
+    @staticmethod
+    def get_username(scope: Scope) -> str | None:
+        """
+        Takes the user from the bearer token, only the signature is checked.
+        """
+        scheme, _, token = Headers(scope=scope).get("authorization", "").partition(" ")
+        if scheme.lower() != "bearer" or not token:
+            return None
+        settings = get_settings()
+        try:
+            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        except JWTError:
+            return None
+        return payload.get("sub")
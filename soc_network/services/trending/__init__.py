@@ -0,0 +1,6 @@
+from .maintenance import maintain_trending
+
+
+__all__ = [
+    "maintain_trending",
+]
@@ -0,0 +1,39 @@
+import asyncio
+import logging
+
+from soc_network.db.connection import RedisManager, SessionManager
+from soc_network.repositories import TrendingRepository
+
+logger = logging.getLogger(__name__)
+
+# only one worker process maintains the ranking during an interval
+TRENDING_LOCK_KEY = "post:trending:lock"
+
+
+async def maintain_trending(interval: int):
+    """
+    Periodically compacts trending ranking, rebuilds it from database when it was lost.
+    """
+    while True:
+        try:
+            await maintain_trending_once(interval)
+        except Exception:  # noqa: keep the loop alive, the next run may succeed
+            logger.exception("Trending maintenance failed.")
+        await asyncio.sleep(interval)
+
+
+async def maintain_trending_once(interval: int):
+    redis_sess = RedisManager().get_state_client()
+    if not redis_sess.set(TRENDING_LOCK_KEY, 1, nx=True, ex=max(interval - 1, 1)):
+        return
+    session_maker = SessionManager().get_session_maker()
+    async with session_maker() as session:
+        trending_repo = TrendingRepository(session, redis_sess)
+        if not trending_repo.redis:
+            return
+        if await trending_repo.is_built():
+            size = await trending_repo.compact()
+            logger.info(f"Trending ranking compacted, {size} posts left.")
+        else:
+            await trending_repo.rebuild()
+            logger.info("Trending ranking rebuilt from database.")
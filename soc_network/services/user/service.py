@@ -1,19 +1,21 @@
+import hashlib
 import uuid
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from fastapi import Depends, HTTPException
 from jose import JWTError, jwt
+from redis import Redis
 from sqlalchemy.ext.asyncio import AsyncSession
 from starlette import status
 import aiohttp
 import asyncio
 import logging
 
-from soc_network.repositories import UserRepository
+from soc_network.repositories import UserRepository, RevocationRepository, RefreshTokenRepository
 from soc_network.schemas import RegistrationForm
 from soc_network.config import get_settings
-from soc_network.db.connection import get_session
+from soc_network.db.connection import get_session, get_state_redis, release_connection, set_sticky_key
 from soc_network.db.models import User
-from soc_network.schemas import TokenData
+from soc_network.schemas import Principal, TokenData
 from soc_network.repositories import exceptions as db_exc
 from soc_network.services import exceptions as serv_exc
 
@@ -77,7 +79,7 @@ async def get_additional_user_data(user: RegistrationForm, user_repo: UserReposi
         logger.error("Clearbit is unavailable.")
     if find_status_code == 200:
         try:
-            await user_repo.update_by_email(email=user.email, data=str(resp_json))
+            await user_repo.save_profile_by_email(email=user.email, data=resp_json)
         except db_exc.DbError:
             ...
     else:
@@ -92,7 +94,9 @@ async def authenticate_user(
     username: str,
     password: str,
 ):
-    user = await user_repo.get_by_username(username)
+    user = await user_repo.get_credentials(username)
+    # password hashing is slow, the connection is not needed for it
+    await release_connection(user_repo.session)
     if not user:
         return False
     if not verify_password(password, user.password):
@@ -110,11 +114,78 @@ def create_access_token(
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
+    # jti identifies the token in the revocation list
+    to_encode.update({"exp": expire, "jti": uuid.uuid4().hex})
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
 
 
+def create_refresh_token(
+    data: dict,
+    family_id: str,
+) -> tuple[str, str, float]:
+    """
+    Returns the token, its id and expiry timestamp.
+    """
+    settings = get_settings()
+    expire = datetime.now(timezone.utc) + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
+    token_id = uuid.uuid4().hex
+    to_encode = data.copy()
+    to_encode.update({"exp": expire, "jti": token_id, "typ": "refresh", "fam": family_id})
+    encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
+    return encoded_jwt, token_id, expire.timestamp()
+
+
+async def create_token_pair(
+    username: str,
+    user_id: uuid.UUID,
+    refresh_repo: RefreshTokenRepository,
+) -> dict:
+    """
+    Starts a new refresh token family on login.
+    """
+    family_id = uuid.uuid4().hex
+    data = {"sub": username, "uid": str(user_id)}
+    refresh_token, token_id, expires_at = create_refresh_token(data=data, family_id=family_id)
+    await refresh_repo.start_family(family_id=family_id, token_id=token_id, expires_at=expires_at)
+    access_token = create_access_token(data={**data, "fam": family_id})
+    return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
+
+
+async def refresh_tokens(
+    refresh_token: str,
+    refresh_repo: RefreshTokenRepository,
+    revocation_repo: RevocationRepository,
+) -> dict:
+    """
+    Exchanges the refresh token for a new token pair, only the signature is checked, no password hashing.
+    A refresh token used twice revokes its family, so the stolen copy and the original stop working both.
+    """
+    try:
+        payload = jwt.decode(refresh_token, get_settings().SECRET_KEY, algorithms=[get_settings().ALGORITHM])
+    except JWTError:
+        raise serv_exc.InvalidTokenError("Can not decode refresh token.")
+    username, user_id = payload.get("sub"), payload.get("uid")
+    family_id, token_id = payload.get("fam"), payload.get("jti")
+    if payload.get("typ") != "refresh" or None in (username, user_id, family_id, token_id):
+        raise serv_exc.InvalidTokenError("Not a refresh token.")
+    if await revocation_repo.is_revoked(token_id=token_id, user_id=user_id):
+        raise serv_exc.InvalidTokenError("Refresh token revoked.")
+
+    data = {"sub": username, "uid": user_id}
+    new_refresh_token, new_token_id, expires_at = create_refresh_token(data=data, family_id=family_id)
+    rotation = await refresh_repo.rotate(
+        family_id=family_id, token_id=token_id, new_token_id=new_token_id, expires_at=expires_at,
+    )
+    if rotation == RefreshTokenRepository.REUSED:
+        logger.warning(f"refresh token reuse, family {family_id} of user {username} revoked")
+        raise serv_exc.TokenReuseError("Refresh token already used.")
+    if rotation != RefreshTokenRepository.ROTATED:
+        raise serv_exc.InvalidTokenError("Refresh token expired or revoked.")
+    access_token = create_access_token(data={**data, "fam": family_id})
+    return {"access_token": access_token, "refresh_token": new_refresh_token, "token_type": "bearer"}
+
+
 def verify_password(
     plain_password: str,
     hashed_password: str,
@@ -123,34 +194,91 @@ def verify_password(
     return pwd_context.verify(plain_password, hashed_password)
 
 
-async def get_current_user(
+async def get_current_principal(
     session: AsyncSession = Depends(get_session),
+    redis_sess: Redis = Depends(get_state_redis),
     token: str = Depends(get_settings().OAUTH2_SCHEME),
-) -> User:
+) -> Principal:
+    """
+    Authenticates the request by the access token claims, the user row is not loaded.
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    user_repo = UserRepository(session)
     try:
         payload = jwt.decode(token, get_settings().SECRET_KEY, algorithms=[get_settings().ALGORITHM])
         username: str = payload.get("sub")
-        if username is None:
+        if username is None or payload.get("typ") == "refresh":
             raise credentials_exception
         token_data = TokenData(username=username)
     except JWTError:
         logger.warning(f"can not decode JWT token: {token}")
         raise credentials_exception
-    user = await user_repo.get_by_username(username=token_data.username)
-    if user is None:
-        logger.warning(f"can not find user {user} from JWT token: {token}")
+
+    user_id = payload.get("uid")
+    if user_id is None:
+        # tokens issued before the uid claim, valid until they expire
+        user_repo = UserRepository(session)
+        user = await user_repo.get_credentials(username=token_data.username)
+        await release_connection(session)
+        if user is None:
+            logger.warning(f"can not find user {token_data.username} from JWT token: {token}")
+            raise credentials_exception
+        user_id = user.id
+    principal = Principal(
+        id=user_id,
+        username=token_data.username,
+        token_id=payload.get("jti") or hashlib.sha256(token.encode()).hexdigest(),
+        expires_at=datetime.fromtimestamp(payload["exp"], timezone.utc),
+        family_id=payload.get("fam"),
+    )
+
+    revocation_repo = RevocationRepository(redis_sess)
+    if await revocation_repo.is_revoked(token_id=principal.token_id, user_id=principal.id):
         raise credentials_exception
+    set_sticky_key(str(principal.id))
+    return principal
+
+
+async def get_current_user(
+    principal: Principal = Depends(get_current_principal),
+    session: AsyncSession = Depends(get_session),
+) -> User:
+    """
+    Loads the row of the authenticated user, for routes that need more than id and username.
+    """
+    user_repo = UserRepository(session)
+    user = await user_repo.get(user_id=principal.id)
+    if user is None:
+        logger.warning(f"can not find user {principal.username} from JWT token")
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    # the handler may not need the db anymore or call slow services first
+    await release_connection(session)
     return user
 
 
-async def delete_user(user_repo: UserRepository, user_id: uuid.UUID):
+async def logout(
+    principal: Principal,
+    revocation_repo: RevocationRepository,
+    refresh_repo: RefreshTokenRepository,
+):
+    await revocation_repo.revoke_token(token_id=principal.token_id, expires_at=principal.expires_at.timestamp())
+    if principal.family_id:
+        await refresh_repo.end_family(family_id=principal.family_id)
+
+
+async def delete_user(user_repo: UserRepository, revocation_repo: RevocationRepository, user_id: uuid.UUID):
     user = await user_repo.get(user_id=user_id)
     if not user:
+        # a retry after the revocation has failed, the tokens that still work are revoked now
+        await revocation_repo.revoke_user(user_id=user_id)
         raise serv_exc.NoUserError('No such user.')
-    await user_repo.delete(user_id=user_id)
+    # posts and reactions of the user are purged in background, the user row goes last
+    await user_repo.mark_deleted(user_id=user_id)
+    await revocation_repo.revoke_user(user_id=user_id)
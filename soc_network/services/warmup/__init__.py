@@ -0,0 +1,7 @@
+from .warmup import connect_database, warm_up
+
+
+__all__ = [
+    "connect_database",
+    "warm_up",
+]
@@ -0,0 +1,134 @@
+import asyncio
+import logging
+from uuid import UUID
+
+from fastapi import FastAPI
+from sqlalchemy import exc
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, AsyncSession
+
+from soc_network.config import get_settings
+from soc_network.db.connection import RedisManager, SessionManager
+from soc_network.repositories import PostActionRepository, PostRepository, TrendingRepository, UserRepository
+from soc_network.repositories.local_cache import LocalCache
+from soc_network.services.trending.maintenance import maintain_trending_once
+
+logger = logging.getLogger(__name__)
+
+# statements are prepared by running them for an id that does not exist
+NO_ID = UUID(int=0)
+# preloaded posts go to the local cache only while it listens to invalidations, see services.cache
+LOCAL_CACHE_WAIT_SECONDS = 5
+
+
+async def connect_database():
+    """
+    Opens the first connection of every engine, retrying DB_CONNECT_RETRY times.
+    The first connection initializes the dialect under a thread lock, concurrent first connections
+    of other coroutines would block the event loop waiting for it.
+    """
+    settings = get_settings()
+    manager = SessionManager()
+    for engine in [manager.engine, *manager.replica_engines]:
+        connection = await connect(engine, settings.DB_CONNECT_RETRY, settings.DB_CONNECT_RETRY_DELAY_SECONDS)
+        await connection.close()
+
+
+async def warm_up(application: FastAPI):
+    """
+    Opens database connections in advance and fills the caches with the hot posts,
+    the application is reported ready when it is done. Opening the connections is retried with
+    exponential backoff until it succeeds, the node is not ready meanwhile.
+    """
+    settings = get_settings()
+    delay = settings.WARMUP_RETRY_DELAY_SECONDS
+    while not await warm_up_connections():
+        logger.warning(f"The application is not ready, database warm-up is retried in {delay:.1f}s.")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, settings.WARMUP_RETRY_MAX_DELAY_SECONDS)
+    try:
+        posts_count = await preload_hot_posts(settings.WARMUP_TOP_POSTS)
+        logger.info(f"Caches warmed up with {posts_count} trending posts.")
+    except Exception:  # noqa: cold caches are filled by the requests
+        logger.exception("Cache warm-up failed.")
+    application.state.ready = True
+
+
+async def warm_up_connections() -> bool:
+    settings = get_settings()
+    manager = SessionManager()
+    try:
+        for engine in [manager.engine, *manager.replica_engines]:
+            await open_connections(engine, min(settings.WARMUP_DB_CONNECTIONS, settings.DB_POOL_SIZE))
+    except Exception:  # noqa: retried by the caller, requests open connections themselves meanwhile
+        logger.exception("Database warm-up failed.")
+        return False
+    return True
+
+
+async def open_connections(engine: AsyncEngine, count: int):
+    """
+    Opens `count` connections of the engine pool and prepares the hot statements on each of them.
+    """
+    settings = get_settings()
+    connections = []
+    try:
+        while len(connections) < count:
+            connections.append(await connect(engine, settings.DB_CONNECT_RETRY, settings.DB_CONNECT_RETRY_DELAY_SECONDS))
+        await asyncio.gather(*(prepare_statements(connection) for connection in connections))
+    finally:
+        # closed connections stay open in the pool
+        for connection in connections:
+            await connection.close()
+
+
+async def connect(engine: AsyncEngine, attempts: int, delay: float) -> AsyncConnection:
+    for attempt in range(1, attempts + 1):
+        try:
+            return await engine.connect()
+        except (OSError, exc.DBAPIError) as error:
+            if attempt == attempts:
+                raise
+            logger.warning(f"Database connection attempt {attempt} of {attempts} failed: {error}")
+            await asyncio.sleep(delay)
+
+
+async def prepare_statements(connection: AsyncConnection):
+    """
+    Runs the reads of the request path, asyncpg keeps their prepared statements in the connection.
+    """
+    async with AsyncSession(bind=connection, expire_on_commit=False) as session:
+        post_repo = PostRepository(session)
+        user_repo = UserRepository(session)
+        post_act_repo = PostActionRepository(session)
+        await post_repo.get(post_id=NO_ID)
+        await post_repo.get_version(post_id=NO_ID)
+        await user_repo.get(user_id=NO_ID)
+        await user_repo.get_credentials(username="")
+        await post_act_repo.get_user_action(post_id=NO_ID, user_id=NO_ID)
+
+
+async def preload_hot_posts(limit: int) -> int:
+    """
+    Loads posts of the trending ranking and their reactions into redis and the local cache.
+    """
+    settings = get_settings()
+    redis_sess = RedisManager().get_client()
+    local_cache = LocalCache()
+    for _ in range(LOCAL_CACHE_WAIT_SECONDS * 10):
+        if local_cache.listening:
+            break
+        await asyncio.sleep(0.1)
+    session_maker = SessionManager().get_session_maker()
+    async with session_maker() as session:
+        trending_repo = TrendingRepository(session, RedisManager().get_state_client())
+        if not trending_repo.redis:
+            return 0
+        if not await trending_repo.is_built():
+            await maintain_trending_once(settings.TRENDING_COMPACT_INTERVAL_SECONDS)
+        posts_ids = [post_id for post_id, _ in await trending_repo.top(limit)]
+        post_repo = PostRepository(session, redis_sess)
+        post_act_repo = PostActionRepository(session, redis_sess)
+        posts = await post_repo.list_by_ids(posts_ids)
+        for post in posts:
+            await post_act_repo.list_by_post_id(post_id=post.id)
+    return len(posts)
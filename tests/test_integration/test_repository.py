@@ -1,9 +1,50 @@
+import asyncio
+import itertools
+import time
 import uuid
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pydantic
 import pytest
+import redis
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import create_async_engine
 
-from soc_network.repositories import UserRepository, PostRepository, PostActionRepository, exceptions as db_exc
-from soc_network.db.connection import get_session_for_test
+from soc_network.repositories import (
+    UserRepository,
+    PostRepository,
+    PostActionRepository,
+    PartitionRepository,
+    RefreshTokenRepository,
+    RevocationRepository,
+    TrendingRepository,
+    exceptions as db_exc,
+)
+from soc_network.repositories import local_cache as local_cache_module
+from soc_network.repositories.cache_stats_repository import key_class
+from soc_network.repositories.local_cache import INVALIDATION_CHANNEL, LocalCache
+from soc_network.repositories.partition_repository import add_months, month_start
+from soc_network.repositories.post_repository import DELETED_VERSION, SET_VERSION_SCRIPT
+from soc_network.repositories import revocation_repository as revocation_module
+from soc_network.repositories.revocation_repository import REVOKED_KEY
+from soc_network.repositories.trending_repository import TRENDING_BUILT_KEY, TRENDING_EPOCH_KEY, TRENDING_KEY
+from soc_network.config import DefaultSettings, get_settings
+from soc_network.db.connection import RedisManager, SessionManager, get_session_for_test, set_sticky_key
+from soc_network.db.connection.session import STICKY_KEY_PREFIX, RoutingSession
+from soc_network.db.connection.pool_metrics import PoolMetrics, TimedQueuePool
+from soc_network.db.models import Post, PostAction, UserProfile
+from soc_network.db.uuid7 import uuid7, uuid7_min
 from soc_network.schemas import RegistrationForm, Post as PostSchema
+from soc_network.services.cache import listen_invalidations
+from soc_network.services.purge import maintenance as purge_module
+from soc_network.services.purge.maintenance import PURGE_PROGRESS_KEY, Purger
+from soc_network.services.rate_limit import TokenBucketLimiter, limiter as limiter_module
+from soc_network.services.rate_limit.limiter import retry_after_header
+from soc_network.services.diagnostics import BlockingCallWatchdog, LoopLagMonitor
+from soc_network.services.user.service import verify_password
+from soc_network.services.warmup import warmup as warmup_module
+from soc_network.services.warmup.warmup import open_connections
 
 
 pytestmark = pytest.mark.asyncio
@@ -23,6 +64,26 @@ class TestUserRepo:
         await user_repo.delete(user_id=new_user_id)
         await sess.close()
 
+    async def test_save_user_profile(self):
+        sess = await get_session_for_test()
+        user_repo = UserRepository(sess)
+        potential_user = RegistrationForm(username='janedoe', password='hackme', email='janedoe@mail.com')
+        new_user_id = await user_repo.add(potential_user)
+
+        data = {'name': {'fullName': 'Jane Doe'}, 'employment': {'name': 'Acme', 'title': None}}
+        await user_repo.save_profile_by_email(email=potential_user.email, data=data)
+        await user_repo.save_profile_by_email(email=potential_user.email, data={**data, 'location': 'Oslo'})
+        profile = await sess.get(UserProfile, new_user_id)
+        assert (profile.full_name, profile.company, profile.location) == ('Jane Doe', 'Acme', 'Oslo')
+
+        credentials = await user_repo.get_credentials(username=potential_user.username)
+        assert credentials._fields == ('id', 'username', 'password')
+        assert credentials.id == new_user_id
+
+        # the profile goes with the user
+        await user_repo.delete(user_id=new_user_id)
+        await sess.close()
+
 
 class TestPostRepo:
     async def test_add_post(self):
@@ -45,6 +106,78 @@ class TestPostRepo:
         await user_repo.delete(user_id=new_user_id)
         await sess.close()
 
+    async def test_version_not_overwritten_by_stale_read(self):
+        sess = await get_session_for_test()
+        user_repo = UserRepository(sess)
+        potential_user = RegistrationForm(username='editor', password='hackme', email='editor@mail.com')
+        new_user_id = await user_repo.add(potential_user)
+        redis_sess = RedisManager().get_client()
+        post_repo = PostRepository(sess, redis_sess)
+        post_id = await post_repo.add(PostSchema(body='First version.', author_id=new_user_id))
+        version_key = f'post:version:{post_id}'
+
+        old_version = await post_repo.get_version(post_id=post_id)
+        await post_repo.update(post_id=post_id, new_body='Second version.')
+        new_version = await post_repo.get_version(post_id=post_id)
+        assert new_version > old_version
+        assert new_version == int((await post_repo.get(post_id=post_id)).dt_updated.timestamp() * 1_000_000)
+        # a read that loaded the version before the update fills the cache after it
+        redis_sess.eval(SET_VERSION_SCRIPT, 1, version_key, old_version, 300, DELETED_VERSION)
+        assert int(redis_sess.get(version_key)) == new_version
+
+        await post_repo.mark_deleted(post_id=post_id)
+        redis_sess.eval(SET_VERSION_SCRIPT, 1, version_key, new_version, 300, DELETED_VERSION)
+        assert await post_repo.get_version(post_id=post_id) is None
+
+        await post_repo.delete(post_id=post_id)
+        await user_repo.delete(user_id=new_user_id)
+        await sess.close()
+
+    async def test_post_ids_time_ordered(self):
+        sess = await get_session_for_test()
+        user_repo = UserRepository(sess)
+        potential_user = RegistrationForm(username='johndoe', password='hackme', email='johndoe@mail.com')
+        new_user_id = await user_repo.add(potential_user)
+
+        post_repo = PostRepository(sess)
+        posts_ids = [await post_repo.add(post=PostSchema(body=f"Post {i}.", author_id=new_user_id)) for i in range(5)]
+        assert all(post_id.version == 7 for post_id in posts_ids)
+        assert posts_ids == sorted(posts_ids)
+
+        for post_id in posts_ids:
+            await post_repo.delete(post_id=post_id)
+        await user_repo.delete(user_id=new_user_id)
+        await sess.close()
+
+    async def test_search_post(self):
+        sess = await get_session_for_test()
+        user_repo = UserRepository(sess)
+        potential_user = RegistrationForm(username='johndoe', password='hackme', email='johndoe@mail.com')
+        new_user_id = await user_repo.add(potential_user)
+
+        post_repo = PostRepository(sess)
+        bodies = ['Cats are great.', 'Dogs and cats.', 'Only dogs here.']
+        posts_ids = [await post_repo.add(post=PostSchema(body=body, author_id=new_user_id)) for body in bodies]
+
+        found = await post_repo.search(query='cats', limit=1)
+        assert len(found) == 1
+        last_post, last_rank = found[-1]
+        found += await post_repo.search(query='cats', limit=10, after=(last_rank, last_post.id))
+        assert {post.id for post, _ in found} == set(posts_ids[:2])
+
+        found = await post_repo.search(query='dogs', limit=10, author_id=uuid.uuid4())
+        assert found == []
+
+        found = await post_repo.search(query='cats', limit=10, since=datetime.now(timezone.utc) - timedelta(hours=1))
+        assert {post.id for post, _ in found} == set(posts_ids[:2])
+        found = await post_repo.search(query='cats', limit=10, since=datetime.now(timezone.utc) + timedelta(hours=1))
+        assert found == []
+
+        for post_id in posts_ids:
+            await post_repo.delete(post_id=post_id)
+        await user_repo.delete(user_id=new_user_id)
+        await sess.close()
+
     async def test_delete_not_existent_post(self):
         sess = await get_session_for_test()
         post_repo = PostRepository(sess)
@@ -144,7 +277,7 @@ class TestPostActRepo:
         await post_act_repo.add(users_ids[1], posts_ids[-1], action='like'.upper())
         await post_act_repo.add(users_ids[1], posts_ids[-2], action='like'.upper())
 
-        acts_list = await post_act_repo.list_by(user_id=users_ids[2])
+        acts_list = await post_act_repo.list_by_user_id(user_id=users_ids[2])
         assert acts_list[0].post_id == posts_ids[0]
 
         await post_act_repo.delete(users_ids[1], posts_ids[0], action='like'.upper())
@@ -161,9 +294,863 @@ class TestPostActRepo:
 
         await sess.close()
 
+    async def test_iter_post_act_by_user_id(self, create_users_and_posts):
+        users_ids, posts_ids = create_users_and_posts
+        sess = await get_session_for_test()
+        post_act_repo = PostActionRepository(sess)
+        for post_id in posts_ids:
+            await post_act_repo.add(users_ids[1], post_id, action='like'.upper())
+
+        first_page = [post_act async for post_act in post_act_repo.iter_by_user_id(users_ids[1], limit=3)]
+        last = first_page[-1]
+        second_page = [
+            post_act async for post_act in
+            post_act_repo.iter_by_user_id(users_ids[1], limit=3, after=(last.dt_created, last.post_id))
+        ]
+        assert len(first_page) == 3
+        assert len(second_page) == 2
+        assert {post_act.post_id for post_act in first_page + second_page} == set(posts_ids)
+
+        for post_id in posts_ids:
+            await post_act_repo.delete(users_ids[1], post_id, action='like'.upper())
+        await sess.close()
+
+    async def test_list_post_act_single_flight(self, create_users_and_posts, monkeypatch):
+        users_ids, posts_ids = create_users_and_posts
+        sess = await get_session_for_test()
+        redis_sess = RedisManager().get_client()
+        redis_key = f'post_action:{posts_ids[0]}:users'
+        redis_sess.delete(redis_key, f'post_action:{posts_ids[0]}:counts')
+        post_act_repo = PostActionRepository(sess, redis_sess)
+        for user_id in users_ids:
+            await post_act_repo.add(user_id, posts_ids[0], action='like'.upper())
+
+        db_queries = []
+        select_by_post_id = post_act_repo._select_by_post_id
+
+        async def counted_select(*args):
+            db_queries.append(args)
+            return await select_by_post_id(*args)
+
+        monkeypatch.setattr(post_act_repo, '_select_by_post_id', counted_select)
+        results = await asyncio.gather(*[
+            post_act_repo.list_by_post_id_action(posts_ids[0], action='like'.upper()) for _ in range(10)
+        ])
+        assert len(db_queries) == 1
+        for post_acts in results:
+            assert {post_act.user_id for post_act in post_acts} == set(users_ids)
+        # reactions of the users and the filled mark
+        assert redis_sess.hlen(redis_key) == len(users_ids) + 1
+
+        for user_id in users_ids:
+            await post_act_repo.delete(user_id, posts_ids[0], action='like'.upper())
+        await sess.close()
+
+    async def test_summarize_post_act_by_post_ids(self, create_users_and_posts):
+        users_ids, posts_ids = create_users_and_posts
+        sess = await get_session_for_test()
+        post_act_repo = PostActionRepository(sess)
+        await post_act_repo.add(users_ids[1], posts_ids[0], action='like'.upper())
+        await post_act_repo.add(users_ids[2], posts_ids[0], action='like'.upper())
+        await post_act_repo.add(users_ids[2], posts_ids[1], action='dislike'.upper())
+
+        summary = await post_act_repo.summarize_by_post_ids(posts_ids[:3], user_id=users_ids[1])
+        assert summary[posts_ids[0]]['LIKE'] == (2, True)
+        assert summary[posts_ids[0]]['DISLIKE'] == (0, False)
+        assert summary[posts_ids[1]]['LIKE'] == (0, False)
+        assert summary[posts_ids[1]]['DISLIKE'] == (1, False)
+        assert all(count == 0 for count, _ in summary[posts_ids[2]].values())
+
+        await post_act_repo.delete(users_ids[1], posts_ids[0], action='like'.upper())
+        await post_act_repo.delete(users_ids[2], posts_ids[0], action='like'.upper())
+        await post_act_repo.delete(users_ids[2], posts_ids[1], action='dislike'.upper())
+        await sess.close()
+
+    async def test_change_post_act_cached(self, create_users_and_posts):
+        users_ids, posts_ids = create_users_and_posts
+        sess = await get_session_for_test()
+        redis_sess = RedisManager().get_client()
+        redis_sess.delete(f'post_action:{posts_ids[0]}:users', f'post_action:{posts_ids[0]}:counts')
+        post_act_repo = PostActionRepository(sess, redis_sess)
+        await post_act_repo.add(users_ids[1], posts_ids[0], action='LIKE')
+        await post_act_repo.add(users_ids[2], posts_ids[0], action='LIKE')
+        with pytest.raises(db_exc.DbError):
+            await post_act_repo.add(users_ids[1], posts_ids[0], action='LOVE')
+        await sess.rollback()
+
+        # fills the cache, later changes are applied to it
+        await post_act_repo.list_by_post_id(posts_ids[0])
+        await post_act_repo.change(users_ids[1], posts_ids[0], action='LOVE')
+        await post_act_repo.delete(users_ids[2], posts_ids[0], action='LIKE')
+        assert await post_act_repo.get_user_action(posts_ids[0], users_ids[1]) == 'LOVE'
+        summary = await post_act_repo.summarize_by_post_ids([posts_ids[0]], user_id=users_ids[1])
+        assert {action: counts for action, counts in summary[posts_ids[0]].items() if counts[0]} == \
+            {'LOVE': (1, True)}
+        assert [post_act.action for post_act in await post_act_repo.list_by_post_id(posts_ids[0])] == ['LOVE']
+
+        await post_act_repo.delete(users_ids[1], posts_ids[0], action='LOVE')
+        await sess.close()
+
+    async def test_rebuild_evicted_post_act_cache(self, create_users_and_posts):
+        users_ids, posts_ids = create_users_and_posts
+        sess = await get_session_for_test()
+        redis_sess = RedisManager().get_client()
+        users_key, counts_key = f'post_action:{posts_ids[0]}:users', f'post_action:{posts_ids[0]}:counts'
+        redis_sess.delete(users_key, counts_key)
+        post_act_repo = PostActionRepository(sess, redis_sess)
+        await post_act_repo.add(users_ids[1], posts_ids[0], action='LIKE')
+        await post_act_repo.list_by_post_id(posts_ids[0])
+        ttl = get_settings().REACTION_CACHE_TTL_SECONDS
+        assert 0 < redis_sess.ttl(users_key) <= ttl and 0 < redis_sess.ttl(counts_key) <= ttl
+
+        # reads extend the lifetime of both hashes
+        redis_sess.expire(users_key, 5)
+        redis_sess.expire(counts_key, 5)
+        await post_act_repo.summarize_by_post_ids([posts_ids[0]], user_id=users_ids[1])
+        assert redis_sess.ttl(users_key) > 5 and redis_sess.ttl(counts_key) > 5
+
+        # redis evicts one of the hashes, the change drops the other one and reads go to the db
+        redis_sess.delete(counts_key)
+        await post_act_repo.add(users_ids[2], posts_ids[0], action='DISLIKE')
+        assert not redis_sess.exists(users_key)
+        summary = await post_act_repo.summarize_by_post_ids([posts_ids[0]], user_id=users_ids[2])
+        assert summary[posts_ids[0]]['LIKE'] == (1, False) and summary[posts_ids[0]]['DISLIKE'] == (1, True)
+        assert await post_act_repo.get_user_action(posts_ids[0], users_ids[2]) == 'DISLIKE'
+
+        # the next list fills both hashes again
+        assert sorted(post_act.action for post_act in await post_act_repo.list_by_post_id(posts_ids[0])) == \
+            ['DISLIKE', 'LIKE']
+        like, dislike = (str(get_settings().REACTIONS[action]).encode() for action in ('LIKE', 'DISLIKE'))
+        assert redis_sess.hlen(users_key) == 3
+        assert {key: int(value) for key, value in redis_sess.hgetall(counts_key).items()} == \
+            {b'_': 1, like: 1, dislike: 1}
+
+        await post_act_repo.delete(users_ids[1], posts_ids[0], action='LIKE')
+        await post_act_repo.delete(users_ids[2], posts_ids[0], action='DISLIKE')
+        await sess.close()
+
+    async def test_skip_unknown_reaction_codes(self, create_users_and_posts):
+        users_ids, posts_ids = create_users_and_posts
+        sess = await get_session_for_test()
+        redis_sess = RedisManager().get_client()
+        redis_sess.delete(f'post_action:{posts_ids[0]}:users', f'post_action:{posts_ids[0]}:counts')
+        post_act_repo = PostActionRepository(sess, redis_sess)
+        # put with a reaction removed from the settings since
+        sess.add(PostAction(user_id=users_ids[1], post_id=posts_ids[0], reaction=32000))
+        await sess.commit()
+        await post_act_repo.add(users_ids[2], posts_ids[0], action='LIKE')
+
+        for _ in range(2):
+            # from the db, then from the hashes filled by the list
+            summary = await post_act_repo.summarize_by_post_ids([posts_ids[0]], user_id=users_ids[1])
+            assert {action for action, (count, _) in summary[posts_ids[0]].items() if count} == {'LIKE'}
+            assert [post_act.action for post_act in await post_act_repo.list_by_post_id(posts_ids[0])] == ['LIKE']
+        assert await post_act_repo.get_user_action(posts_ids[0], users_ids[1]) is None
+
+        # a new reaction replaces the unknown one
+        with pytest.raises(db_exc.DbError):
+            await post_act_repo.add(users_ids[1], posts_ids[0], action='DISLIKE')
+        replaced_action, _ = await post_act_repo.change(users_ids[1], posts_ids[0], action='DISLIKE')
+        assert replaced_action is None
+        assert await post_act_repo.get_user_action(posts_ids[0], users_ids[1]) == 'DISLIKE'
+
+        await post_act_repo.delete(users_ids[1], posts_ids[0], action='DISLIKE')
+        await post_act_repo.delete(users_ids[2], posts_ids[0], action='LIKE')
+        await sess.close()
+
+    async def test_reactions_setting(self):
+        reactions = get_settings().REACTIONS
+        assert DefaultSettings(REACTIONS={**reactions, 'WOW': 100}).REACTIONS['WOW'] == 100
+        for bad_reactions in (
+            {'LIKE': 1, 'LOVE': 3},
+            {**reactions, 'WOW': reactions['LIKE']},
+            {**reactions, 'WOW': 0},
+        ):
+            with pytest.raises(pydantic.ValidationError):
+                DefaultSettings(REACTIONS=bad_reactions)
+
+    async def test_skip_post_act_fill_raced_by_write(self, create_users_and_posts, monkeypatch):
+        users_ids, posts_ids = create_users_and_posts
+        sess = await get_session_for_test()
+        writer_sess = await get_session_for_test()
+        redis_sess = RedisManager().get_client()
+        users_key = f'post_action:{posts_ids[0]}:users'
+        redis_sess.delete(users_key, f'post_action:{posts_ids[0]}:counts')
+        post_act_repo = PostActionRepository(sess, redis_sess)
+        writer_post_act_repo = PostActionRepository(writer_sess, redis_sess)
+        select_by_post_id = post_act_repo._select_by_post_id
+
+        async def select_then_write(*args):
+            reactions = await select_by_post_id(*args)
+            # the reaction commits after the fill query, it finds no cached hashes to change
+            await writer_post_act_repo.add(users_ids[1], posts_ids[0], action='LIKE')
+            return reactions
+
+        monkeypatch.setattr(post_act_repo, '_select_by_post_id', select_then_write)
+        assert await post_act_repo.list_by_post_id(posts_ids[0]) == []
+        # the fill that missed the reaction is not cached
+        assert not redis_sess.exists(users_key)
+        monkeypatch.undo()
+        assert [post_act.user_id for post_act in await post_act_repo.list_by_post_id(posts_ids[0])] == [users_ids[1]]
+        assert redis_sess.hlen(users_key) == 2
+
+        await post_act_repo.delete(users_ids[1], posts_ids[0], action='LIKE')
+        await writer_sess.close()
+        await sess.close()
+
+    async def test_get_user_post_act(self, create_users_and_posts):
+        users_ids, posts_ids = create_users_and_posts
+        sess = await get_session_for_test()
+        redis_sess = RedisManager().get_client()
+        redis_sess.delete(f'post_action:{posts_ids[0]}:users', f'post_action:{posts_ids[0]}:counts')
+        post_act_repo = PostActionRepository(sess, redis_sess)
+
+        assert await post_act_repo.get_user_action(posts_ids[0], users_ids[1]) is None
+        await post_act_repo.add(users_ids[1], posts_ids[0], action='like'.upper())
+        # negative cache is dropped by add
+        assert await post_act_repo.get_user_action(posts_ids[0], users_ids[1]) == 'like'.upper()
+
+        await post_act_repo.list_by_post_id(posts_ids[0])
+        assert await post_act_repo.get_user_action(posts_ids[0], users_ids[1]) == 'like'.upper()
+        assert await post_act_repo.get_user_action(posts_ids[0], users_ids[2]) is None
+
+        await post_act_repo.delete(users_ids[1], posts_ids[0], action='like'.upper())
+        assert await post_act_repo.get_user_action(posts_ids[0], users_ids[1]) is None
+        await sess.close()
+
+    async def test_purge_post_act_of_deleted_post(self, create_users_and_posts):
+        users_ids, posts_ids = create_users_and_posts
+        sess = await get_session_for_test()
+        post_repo = PostRepository(sess)
+        post_act_repo = PostActionRepository(sess)
+        for user_id in users_ids:
+            await post_act_repo.add(user_id, posts_ids[0], action='like'.upper())
+
+        await post_repo.mark_deleted(posts_ids[0])
+        assert await post_repo.get(posts_ids[0]) is None
+        assert await post_repo.list_deleted(limit=10) == [posts_ids[0]]
+
+        assert await post_act_repo.purge_batch(limit=2, post_id=posts_ids[0]) == 2
+        assert await post_act_repo.purge_batch(limit=2, post_id=posts_ids[0]) == 1
+        assert await post_act_repo.purge_batch(limit=2, post_id=posts_ids[0]) == 0
+        await sess.close()
+
     async def test_add_post_act_not_exist_fk(self):
         sess = await get_session_for_test()
         post_act_repo = PostActionRepository(sess)
         with pytest.raises(db_exc.DbError):
             await post_act_repo.add(uuid.uuid4(), uuid.uuid4(), action='like'.upper())
         await sess.close()
+
+
+class TestPurger:
+    @pytest.fixture()
+    def purge_settings(self, monkeypatch):
+        settings = get_settings().copy(
+            update={'PURGE_BATCH_SIZE': 1, 'PURGE_BATCH_PAUSE_MS': 20, 'PURGE_MAX_BATCHES': 4}
+        )
+        monkeypatch.setattr(purge_module, 'get_settings', lambda: settings)
+        return settings
+
+    @staticmethod
+    def record_purges(purger, monkeypatch, purged):
+        purge_batch, delete_post, delete_user = (
+            purger.post_act_repo.purge_batch, purger.post_repo.delete, purger.user_repo.delete
+        )
+
+        async def recorded_purge_batch(limit, post_id=None, user_id=None):
+            count = await purge_batch(limit=limit, post_id=post_id, user_id=user_id)
+            if count:
+                purged.append(('actions', post_id or user_id))
+            return count
+
+        async def recorded_delete_post(post_id):
+            await delete_post(post_id=post_id)
+            purged.append(('post', post_id))
+
+        async def recorded_delete_user(user_id):
+            await delete_user(user_id=user_id)
+            purged.append(('user', user_id))
+
+        monkeypatch.setattr(purger.post_act_repo, 'purge_batch', recorded_purge_batch)
+        monkeypatch.setattr(purger.post_repo, 'delete', recorded_delete_post)
+        monkeypatch.setattr(purger.user_repo, 'delete', recorded_delete_user)
+
+    async def test_purge_deleted_user(self, purge_settings, monkeypatch):
+        sess = await get_session_for_test()
+        state_redis = RedisManager().get_state_client()
+        state_redis.delete(PURGE_PROGRESS_KEY)
+        user_repo = UserRepository(sess)
+        author_id, reader_id, other_id = [
+            await user_repo.add(RegistrationForm(username=name, password='hackme', email=f'{name}@mail.com'))
+            for name in ('johndoe', 'foo', 'kek')
+        ]
+        post_repo = PostRepository(sess)
+        posts_ids = [await post_repo.add(post=PostSchema(body=body, author_id=author_id)) for body in ('One.', 'Two.')]
+        other_post_id = await post_repo.add(post=PostSchema(body='Other.', author_id=other_id))
+        post_act_repo = PostActionRepository(sess)
+        await post_act_repo.add(author_id, other_post_id, action='LIKE')
+        await post_act_repo.add(reader_id, posts_ids[0], action='LIKE')
+        await post_act_repo.add(reader_id, other_post_id, action='DISLIKE')
+        await user_repo.mark_deleted(author_id)
+        purged = []
+
+        # two posts are marked deleted, actions of the user and of the first purged post take the other batches
+        purger = Purger(sess, None, state_redis, interval=60)
+        self.record_purges(purger, monkeypatch, purged)
+        started = time.monotonic()
+        assert not await purger.run()
+        assert purger.batches_done == purge_settings.PURGE_MAX_BATCHES
+        assert time.monotonic() - started >= 3 * purge_settings.PURGE_BATCH_PAUSE_MS / 1000
+        assert purged[0] == ('actions', author_id)
+
+        # the reader is deleted after the user list of the run is taken, its reactions are left to the next run
+        purger = Purger(sess, None, state_redis, interval=60)
+        self.record_purges(purger, monkeypatch, purged)
+        purge_posts = purger.purge_posts
+
+        async def purge_posts_after_user_deleted():
+            await user_repo.mark_deleted(reader_id)
+            return await purge_posts()
+
+        monkeypatch.setattr(purger, 'purge_posts', purge_posts_after_user_deleted)
+        assert await purger.run()
+        assert purger.users_ids == [author_id]
+
+        # actions go before their post, posts before their author
+        assert {step for step in purged if step[0] == 'post'} == {('post', post_id) for post_id in posts_ids}
+        assert purged.index(('actions', posts_ids[0])) < purged.index(('post', posts_ids[0]))
+        assert purged[-1] == ('user', author_id)
+        progress = {name.decode(): value.decode() for name, value in state_redis.hgetall(PURGE_PROGRESS_KEY).items()}
+        assert progress['actions_purged'] == '2'
+        assert progress['posts_purged'] == '2'
+        assert progress['users_purged'] == '1'
+        assert progress['current'] == ''
+
+        assert await post_act_repo.user_has_actions(user_id=reader_id)
+        with pytest.raises(db_exc.DbError):
+            await user_repo.delete(user_id=reader_id)
+
+        await post_act_repo.purge_batch(limit=10, user_id=reader_id)
+        await user_repo.delete(user_id=reader_id)
+        await post_repo.delete(post_id=other_post_id)
+        await user_repo.delete(user_id=other_id)
+        state_redis.delete(PURGE_PROGRESS_KEY)
+        await sess.close()
+
+
+class TestPartitionRepo:
+    async def test_create_archive_restore_month(self, tmp_path):
+        sess = await get_session_for_test()
+        user_repo = UserRepository(sess)
+        potential_user = RegistrationForm(username='johndoe', password='hackme', email='johndoe@mail.com')
+        new_user_id = await user_repo.add(potential_user)
+        partition_repo = PartitionRepository(sess)
+        month = add_months(month_start(datetime.now(timezone.utc)), 24)
+
+        # the month has no partitions yet, the post and its reaction go to the legacy ones
+        post_id = uuid7_min(datetime(month.year, month.month, 2, tzinfo=timezone.utc))
+        sess.add(Post(id=post_id, body='From the future.', author_id=new_user_id))
+        await sess.commit()
+        post_act_repo = PostActionRepository(sess)
+        await post_act_repo.add(new_user_id, post_id, action='LIKE')
+
+        async def partition_of_post():
+            partition_query = text("SELECT tableoid::regclass::text FROM post WHERE id = :post_id")
+            return (await sess.execute(partition_query, {'post_id': post_id})).scalar()
+
+        assert await partition_of_post() == 'post_legacy'
+        assert await partition_repo.create_month(month)
+        assert not await partition_repo.create_month(month)
+        assert await partition_of_post() == PartitionRepository.partition_name('post', month)
+
+        # a failed archive leaves the month attached and readable
+        not_a_directory = tmp_path / 'file'
+        not_a_directory.write_text('')
+        with pytest.raises(db_exc.ArchiveError):
+            await partition_repo.archive_month(month, not_a_directory)
+        blocked = tmp_path / 'blocked'
+        (blocked / f"{PartitionRepository.partition_name('post', month)}.csv.gz.part").mkdir(parents=True)
+        with pytest.raises(db_exc.ArchiveError):
+            await partition_repo.archive_month(month, blocked)
+        assert month in await partition_repo.attached_months()
+        assert await partition_of_post() == PartitionRepository.partition_name('post', month)
+
+        await partition_repo.detach_month(month)
+        assert month in await partition_repo.detached_months()
+        paths = await partition_repo.archive_month(month, tmp_path)
+        assert month not in await partition_repo.detached_months()
+        assert [path.name for path in paths] == [
+            f'{PartitionRepository.partition_name(table, month)}.csv.gz' for table in ('post', 'post_action')
+        ]
+        assert await PostRepository(sess).get(post_id=post_id) is None
+
+        await partition_repo.restore_month(month, tmp_path)
+        assert (await PostRepository(sess).get(post_id=post_id)).body == 'From the future.'
+        assert await post_act_repo.get_user_action(post_id=post_id, user_id=new_user_id) == 'LIKE'
+
+        await partition_repo.archive_month(month, tmp_path)
+        await user_repo.delete(user_id=new_user_id)
+        await sess.close()
+
+
+class TestLocalCache:
+    async def test_evict_and_skip_stale_fill(self, monkeypatch):
+        local_cache = LocalCache()
+        local_cache.start_listening()
+        settings = local_cache_module.get_settings().copy(update={'LOCAL_CACHE_MAX_BYTES': 4096})
+        monkeypatch.setattr(local_cache_module, 'get_settings', lambda: settings)
+        try:
+            for i in range(100):
+                local_cache.set(f'test:{i}', 'x' * 100, local_cache.stamp())
+            assert 0 < local_cache.size <= 4096
+            assert local_cache.get('test:0') is None
+            assert local_cache.get('test:99') == 'x' * 100
+
+            # the key is changed while its value is loaded, the loaded value is not stored
+            stamp = local_cache.stamp()
+            local_cache.discard('test:loaded')
+            local_cache.set('test:loaded', 'stale', stamp)
+            assert local_cache.get('test:loaded') is None
+        finally:
+            local_cache.stop_listening()
+
+    async def test_invalidate_from_other_process(self):
+        sess = await get_session_for_test()
+        redis_sess = RedisManager().get_client()
+        user_repo = UserRepository(sess)
+        potential_user = RegistrationForm(username='johndoe', password='hackme', email='johndoe@mail.com')
+        new_user_id = await user_repo.add(potential_user)
+        post_repo = PostRepository(sess, redis_sess)
+        post_id = await post_repo.add(PostSchema(body='Cached.', author_id=new_user_id))
+
+        local_cache = LocalCache()
+        listener = asyncio.create_task(listen_invalidations())
+        try:
+            while not local_cache.enabled:
+                await asyncio.sleep(0.01)
+            assert (await post_repo.get(post_id=post_id)).body == 'Cached.'
+            assert local_cache.get(f'post:{post_id}').body == 'Cached.'
+
+            # another worker process changes the post
+            redis_sess.publish(INVALIDATION_CHANNEL, f'post:{post_id}')
+            for _ in range(100):
+                if local_cache.get(f'post:{post_id}') is None:
+                    break
+                await asyncio.sleep(0.02)
+            assert local_cache.get(f'post:{post_id}') is None
+
+            await post_repo.get(post_id=post_id)
+            await post_repo.update(post_id=post_id, new_body='Changed.')
+            assert (await post_repo.get(post_id=post_id)).body == 'Changed.'
+        finally:
+            listener.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await listener
+        assert not local_cache.enabled
+
+        await post_repo.delete(post_id=post_id)
+        await user_repo.delete(user_id=new_user_id)
+        await sess.close()
+
+
+class TestCacheStatsRepo:
+    async def test_key_class(self):
+        post_id, user_id = uuid.uuid4(), uuid.uuid4()
+        assert key_class(f'post_action:{post_id}:users') == key_class(f'post_action:{post_id}:counts') == 'reactions'
+        assert key_class(f'post_action:none:{post_id}:{user_id}') == 'reaction_misses'
+        assert key_class(f'post:version:{post_id}') == 'post_versions'
+        assert key_class(f'lock:post_action:{post_id}:users') == key_class('purge:lock') == 'locks'
+        assert key_class('post:trending') == 'trending'
+        assert key_class('post:trending:lock') == 'locks'
+        assert key_class('auth:revoked') == 'auth'
+        assert key_class('something:else') == 'other'
+
+
+class TestWarmUp:
+    async def test_open_connections(self):
+        sess = await get_session_for_test()
+        engine = SessionManager().engine
+        await open_connections(engine, 3)
+        # connections stay in the pool with the statements prepared
+        assert engine.pool.checkedin() == 3
+        connection = await engine.connect()
+        dbapi_connection = (await connection.get_raw_connection()).dbapi_connection
+        assert len(dbapi_connection._prepared_statement_cache) >= 5
+        await connection.close()
+        await sess.close()
+
+    async def test_retry_failed_warm_up(self, monkeypatch):
+        settings = get_settings().copy(update={'WARMUP_RETRY_DELAY_SECONDS': 0.01})
+        monkeypatch.setattr(warmup_module, 'get_settings', lambda: settings)
+        attempts = []
+
+        async def open_connections_while_db_down(engine, count):
+            attempts.append(engine)
+            if len(attempts) <= 3:
+                raise ConnectionRefusedError('Connection refused')
+
+        async def preload_hot_posts(limit):
+            return 0
+
+        monkeypatch.setattr(warmup_module, 'open_connections', open_connections_while_db_down)
+        monkeypatch.setattr(warmup_module, 'preload_hot_posts', preload_hot_posts)
+        application = SimpleNamespace(state=SimpleNamespace(ready=False))
+        started = time.monotonic()
+        await warmup_module.warm_up(application)
+        # the node becomes ready with the first warm-up that succeeds, after 0.01 + 0.02 + 0.04 seconds of backoff
+        assert application.state.ready and len(attempts) == 4
+        assert time.monotonic() - started >= 0.07
+
+
+class TestDiagnostics:
+    async def test_pool_wait(self):
+        engine = create_async_engine(
+            get_settings().database_uri, pool_size=1, max_overflow=0, poolclass=TimedQueuePool,
+        )
+        metrics = PoolMetrics(engine, slow_checkout_seconds=60)
+        connection = await engine.connect()
+        waiter = asyncio.create_task(engine.connect().start())
+        await asyncio.sleep(0.2)
+        assert metrics.snapshot()["waiting"] == 1
+        await connection.close()
+        await (await waiter).close()
+        snapshot = metrics.snapshot()
+        assert snapshot["waiting"] == 0
+        assert snapshot["max_wait_seconds"] >= 0.2
+        await engine.dispose()
+
+    async def test_loop_lag(self):
+        monitor = LoopLagMonitor()
+        monitor.samples.clear()
+        sampler = asyncio.create_task(monitor.run(0.01))
+        await asyncio.sleep(0.05)
+        # blocks the loop, the sampler wakes up late
+        time.sleep(0.2)
+        await asyncio.sleep(0.05)
+        sampler.cancel()
+        assert monitor.snapshot()["max_seconds"] >= 0.15
+        monitor.samples.clear()
+
+    async def test_blocking_call_watchdog(self, tmp_path):
+        hashed_password = get_settings().PWD_CONTEXT.hash("hackme")
+        watchdog = BlockingCallWatchdog()
+        watchdog.clear()
+        watcher = asyncio.create_task(watchdog.run(0.05, str(tmp_path / "blocking.log")))
+        await asyncio.sleep(0.1)
+        # bcrypt on the event loop
+        assert verify_password("hackme", hashed_password)
+        await asyncio.sleep(0.1)
+        watcher.cancel()
+        [report] = watchdog.snapshot()
+        assert report["site"].endswith("verify_password")
+        assert report["count"] == 1 and report["max_seconds"] >= 0.05
+        watchdog.clear()
+
+
+class TestRefreshTokenRepo:
+    async def test_rotate_refresh_token(self):
+        refresh_repo = RefreshTokenRepository(RedisManager().get_client())
+        family_id = uuid.uuid4().hex
+        expires_at = time.time() + 60
+        await refresh_repo.start_family(family_id, 'first', expires_at)
+
+        assert await refresh_repo.rotate(family_id, 'first', 'second', expires_at) == RefreshTokenRepository.ROTATED
+        # the replaced token is presented again, the family is revoked
+        assert await refresh_repo.rotate(family_id, 'first', 'third', expires_at) == RefreshTokenRepository.REUSED
+        assert await refresh_repo.rotate(family_id, 'second', 'third', expires_at) == RefreshTokenRepository.MISSING
+
+
+class TestRevocationRepo:
+    @pytest.fixture()
+    def clock(self, monkeypatch):
+        clock = [100.0]
+        monkeypatch.setattr(revocation_module, "monotonic", lambda: clock[0])
+        monkeypatch.setattr(RevocationRepository, "_cache", {})
+        return clock
+
+    @pytest.fixture()
+    def unavailable_redis(self):
+        def fail(*args, **kwargs):
+            raise redis.exceptions.TimeoutError("Timeout reading from socket")
+
+        pipeline = SimpleNamespace(zadd=lambda *args: None, zremrangebyscore=lambda *args: None, execute=fail)
+        return SimpleNamespace(ping=lambda: True, zmscore=fail, pipeline=lambda **kwargs: pipeline)
+
+    async def test_revoke_token(self, clock):
+        revocation_repo = RevocationRepository(RedisManager().get_client())
+        user_id = uuid.uuid4()
+        token_id = uuid.uuid4().hex
+        assert not await revocation_repo.is_revoked(token_id, user_id)
+        await revocation_repo.revoke_token(token_id, time.time() + 60)
+        assert await revocation_repo.is_revoked(token_id, user_id)
+        assert not await revocation_repo.is_revoked(uuid.uuid4().hex, user_id)
+        # other processes read it from redis
+        RevocationRepository._cache = {}
+        assert await revocation_repo.is_revoked(token_id, user_id)
+
+    async def test_revoke_user(self, clock):
+        revocation_repo = RevocationRepository(RedisManager().get_client())
+        user_id = uuid.uuid4()
+        await revocation_repo.revoke_user(user_id)
+        RevocationRepository._cache = {}
+        assert await revocation_repo.is_revoked(uuid.uuid4().hex, user_id)
+        assert not await revocation_repo.is_revoked(uuid.uuid4().hex, uuid.uuid4())
+
+    async def test_cache_expiry(self, clock):
+        redis_sess = RedisManager().get_client()
+        revocation_repo = RevocationRepository(redis_sess)
+        user_id = uuid.uuid4()
+        token_id = uuid.uuid4().hex
+        assert not await revocation_repo.is_revoked(token_id, user_id)
+        # revoked by another process, this one trusts its cache for a while
+        redis_sess.zadd(REVOKED_KEY, {f"token:{token_id}": time.time() + 60})
+        assert not await revocation_repo.is_revoked(token_id, user_id)
+        clock[0] += get_settings().AUTH_REVOCATION_CACHE_SECONDS
+        assert await revocation_repo.is_revoked(token_id, user_id)
+
+    async def test_redis_unavailable(self, clock, unavailable_redis):
+        for revocation_repo in (RevocationRepository(), RevocationRepository(unavailable_redis)):
+            user_id = uuid.uuid4()
+            token_id = uuid.uuid4().hex
+            with pytest.raises(db_exc.DbUnavailable) as exc_info:
+                await revocation_repo.is_revoked(token_id, user_id)
+            assert exc_info.value.code == 503
+            with pytest.raises(db_exc.DbUnavailable):
+                await revocation_repo.revoke_token(token_id, time.time() + 60)
+            with pytest.raises(db_exc.DbUnavailable):
+                await revocation_repo.revoke_user(user_id)
+            # not stored, still rejected by this process
+            assert await revocation_repo.is_revoked(token_id, user_id)
+
+
+class TestRedisManager:
+    async def test_state_redis(self):
+        manager = RedisManager()
+        settings = get_settings()
+        assert manager.state_pool is manager.pool
+        try:
+            manager.refresh(settings.copy(update={'REDIS_STATE_DB': settings.REDIS_CACHE_DB + 1}))
+            assert manager.state_pool is not manager.pool
+            key = f'state:{uuid.uuid4()}'
+            manager.get_state_client().set(key, 1, ex=60)
+            assert manager.get_state_client().exists(key) and not manager.get_client().exists(key)
+            assert manager.pool_stats(state=True)['created'] >= 1
+            manager.get_state_client().delete(key)
+        finally:
+            manager.refresh(settings)
+        assert manager.state_pool is manager.pool
+
+
+class TestRoutingSession:
+    @pytest.fixture()
+    def engines(self, monkeypatch):
+        manager = SessionManager()
+        primary = SimpleNamespace(sync_engine="primary")
+        replicas = [SimpleNamespace(sync_engine="replica_0"), SimpleNamespace(sync_engine="replica_1")]
+        monkeypatch.setattr(manager, "engine", primary)
+        monkeypatch.setattr(manager, "replica_engines", replicas)
+        monkeypatch.setattr(manager, "replica_down_until", {})
+        monkeypatch.setattr(manager, "replica_counter", itertools.count())
+        monkeypatch.setattr(manager, "last_writes", {})
+        monkeypatch.setattr(manager, "sticky_seconds", 5)
+        set_sticky_key(None)
+        return manager
+
+    async def test_writes_to_primary(self, engines):
+        session = RoutingSession()
+        assert session.get_bind(clause=text("SELECT 1")) == "primary"
+        session = RoutingSession()
+        assert session.get_bind(clause=select(Post).with_for_update()) == "primary"
+        session = RoutingSession()
+        assert session.get_bind(clause=select(Post).execution_options(use_primary=True)) == "primary"
+        session = RoutingSession()
+        session._flushing = True
+        assert session.get_bind(clause=select(Post)) == "primary"
+
+    async def test_cache_fills_read_primary(self, engines):
+        statements = []
+
+        class NoRows(list):
+            def first(self):
+                return None
+
+        async def execute(statement):
+            statements.append(statement)
+            return NoRows()
+
+        session = SimpleNamespace(execute=execute, scalars=execute)
+        redis_sess = RedisManager().get_client()
+        post_id, user_id = uuid7(), uuid.uuid4()
+        post_act_repo = PostActionRepository(session, redis_sess)
+        await post_act_repo._select_by_post_id(post_id)
+        # the miss is cached as the negative key
+        assert await post_act_repo.get_user_action(post_id, user_id) is None
+        redis_sess.delete(post_act_repo._no_action_key(post_id, user_id))
+        assert [RoutingSession().get_bind(clause=statement) for statement in statements] == ["primary", "primary"]
+
+    async def test_reads_round_robin(self, engines):
+        binds = [RoutingSession().get_bind(clause=select(Post)) for _ in range(4)]
+        assert binds == ["replica_0", "replica_1", "replica_0", "replica_1"]
+
+    async def test_replica_down(self, engines):
+        engines.replica_down_until[0] = time.monotonic() + 60
+        assert {RoutingSession().get_bind(clause=select(Post)) for _ in range(3)} == {"replica_1"}
+        engines.replica_down_until[1] = time.monotonic() + 60
+        assert RoutingSession().get_bind(clause=select(Post)) == "primary"
+
+    async def test_read_your_writes(self, engines):
+        session = RoutingSession()
+        session.get_bind(clause=text("UPDATE post SET body = body"))
+        # the same session and other sessions of the same client read from the primary
+        assert session.get_bind(clause=select(Post)) == "primary"
+        set_sticky_key(None)
+        assert RoutingSession().get_bind(clause=select(Post)) == "replica_0"
+
+        user_key = str(uuid.uuid4())
+        set_sticky_key(user_key)
+        RoutingSession().get_bind(clause=text("UPDATE post SET body = body"))
+        assert RoutingSession().get_bind(clause=select(Post)) == "primary"
+        # the next request of the client comes to another worker process
+        engines.last_writes.clear()
+        assert RoutingSession().get_bind(clause=select(Post)) == "primary"
+        RedisManager().get_state_client().delete(STICKY_KEY_PREFIX + user_key)
+        assert RoutingSession().get_bind(clause=select(Post)) == "replica_1"
+        set_sticky_key(None)
+
+    async def test_sticky_mark_expires(self, engines, monkeypatch):
+        monkeypatch.setattr(engines, "sticky_seconds", 0.05)
+        user_key = str(uuid.uuid4())
+        set_sticky_key(user_key)
+        RoutingSession().get_bind(clause=text("UPDATE post SET body = body"))
+        engines.last_writes.clear()
+        assert RoutingSession().get_bind(clause=select(Post)) == "primary"
+        await asyncio.sleep(0.1)
+        assert RoutingSession().get_bind(clause=select(Post)) == "replica_0"
+        set_sticky_key(None)
+
+
+class TestTrendingRepo:
+    @pytest.fixture()
+    async def trending_repo(self):
+        sess = await get_session_for_test()
+        redis_sess = RedisManager().get_client()
+        redis_sess.delete(TRENDING_KEY, TRENDING_EPOCH_KEY, TRENDING_BUILT_KEY)
+        yield TrendingRepository(sess, redis_sess)
+        redis_sess.delete(TRENDING_KEY, TRENDING_EPOCH_KEY, TRENDING_BUILT_KEY)
+        await sess.close()
+
+    async def test_redis_unavailable(self):
+        def fail(*args, **kwargs):
+            raise redis.exceptions.ConnectionError("Connection refused")
+
+        trending_repo = TrendingRepository(None, SimpleNamespace(ping=lambda: True, eval=fail, zrem=fail))
+        # reactions and deletes go on while the ranking is out of reach
+        await trending_repo.bump(uuid7(), 'LIKE')
+        await trending_repo.remove(uuid7())
+
+    async def test_bump_and_take_back(self, trending_repo):
+        post_id = uuid7()
+        half_life = get_settings().TRENDING_HALF_LIFE_HOURS * 3600
+        # the ranking and 10 likes of the post are 4 half-lives old, a like put now weighs 2 ** 4
+        started = datetime.now(timezone.utc) - timedelta(seconds=4 * half_life)
+        trending_repo.redis.set(TRENDING_EPOCH_KEY, started.timestamp())
+        for _ in range(10):
+            await trending_repo.bump(post_id, 'LIKE', reacted_at=started)
+        await trending_repo.bump(post_id, 'LIKE')
+        assert await trending_repo.top(10) == [(post_id, pytest.approx(26))]
+
+        # a taken back like subtracts the weight it added
+        await trending_repo.bump(post_id, 'LIKE', sign=-1, reacted_at=started)
+        assert await trending_repo.top(10) == [(post_id, pytest.approx(25))]
+        for _ in range(9):
+            await trending_repo.bump(post_id, 'LIKE', sign=-1, reacted_at=started)
+        await trending_repo.bump(post_id, 'LIKE', sign=-1)
+        assert await trending_repo.top(10) == []
+
+    async def test_skip_posts_left_out_of_rebuild(self, trending_repo):
+        too_old = datetime.now(timezone.utc) - timedelta(days=get_settings().TRENDING_POST_MAX_AGE_DAYS + 1)
+        # posts with version 4 ids predate the version 7 ones, rebuild does not see them either
+        for post_id in (uuid.uuid4(), uuid7_min(too_old)):
+            await trending_repo.bump(post_id, 'LIKE')
+        assert await trending_repo.top(10) == []
+
+    async def test_rebuild(self, trending_repo):
+        sess = trending_repo.session
+        user_repo, post_repo, post_act_repo = UserRepository(sess), PostRepository(sess), PostActionRepository(sess)
+        users_ids = [
+            await user_repo.add(RegistrationForm(username=name, password='hackme', email=f'{name}@mail.com'))
+            for name in ('trendsetter', 'follower')
+        ]
+        post_id = await post_repo.add(PostSchema(body='Trending post.', author_id=users_ids[0]))
+        await post_act_repo.add(users_ids[0], post_id, action='LIKE')
+        await post_act_repo.add(users_ids[1], post_id, action='LOVE')
+
+        await trending_repo.rebuild()
+        assert await trending_repo.is_built()
+        score = dict(await trending_repo.top(100))[post_id]
+        # reactions are counted from the start of their hour
+        assert 2.5 * 2 ** (-1 / get_settings().TRENDING_HALF_LIFE_HOURS) <= score <= 2.5
+
+        await post_act_repo.delete(users_ids[0], post_id, action='LIKE')
+        await post_act_repo.delete(users_ids[1], post_id, action='LOVE')
+        await post_repo.delete(post_id=post_id)
+        for user_id in users_ids:
+            await user_repo.delete(user_id=user_id)
+
+
+class TestTokenBucketLimiter:
+    @pytest.fixture()
+    def clock(self, monkeypatch):
+        clock = [100.0]
+        monkeypatch.setattr(limiter_module, "monotonic", lambda: clock[0])
+        return clock
+
+    @pytest.fixture()
+    def unavailable_redis(self):
+        calls = []
+
+        def script(keys, args):
+            calls.append(keys)
+            raise redis.exceptions.TimeoutError("Timeout connecting to server")
+
+        return SimpleNamespace(register_script=lambda _: script, calls=calls)
+
+    async def test_local_buckets(self, clock, unavailable_redis):
+        limiter = TokenBucketLimiter(unavailable_redis)
+        # a burst of 3, then a token every 2 seconds
+        assert [limiter._acquire_local(['ip'], 0.5, 3)[0] for _ in range(3)] == [True, True, True]
+        assert limiter._acquire_local(['ip'], 0.5, 3) == (False, pytest.approx(2))
+        clock[0] += 1.5
+        allowed, retry_after = limiter._acquire_local(['ip'], 0.5, 3)
+        assert not allowed and retry_after == pytest.approx(0.5)
+        assert retry_after_header(retry_after) == '1'
+        clock[0] += 0.5
+        assert limiter._acquire_local(['ip'], 0.5, 3) == (True, 0.0)
+
+        # a request takes tokens only when every bucket of it has them
+        assert limiter._acquire_local(['ip', 'user'], 0.5, 3) == (False, pytest.approx(2))
+        assert limiter.local_buckets['user'][0] == 3
+        assert limiter._acquire_local(['other ip', 'user'], 0.5, 3) == (True, 0.0)
+        assert limiter.local_buckets['user'][0] == 2
+
+    async def test_retry_after_header(self):
+        assert retry_after_header(0.01) == '1'
+        assert retry_after_header(2.0) == '2'
+        assert retry_after_header(2.01) == '3'
+
+    async def test_fall_back_while_redis_unavailable(self, clock, unavailable_redis):
+        limiter = TokenBucketLimiter(unavailable_redis, redis_retry_seconds=5)
+        assert limiter.acquire(['ip'], 1, 1) == (True, 0.0)
+        assert limiter.acquire(['ip'], 1, 1) == (False, pytest.approx(1))
+        # redis is not asked again till the retry time
+        assert len(unavailable_redis.calls) == 1
+        clock[0] += 5
+        limiter.acquire(['ip'], 1, 1)
+        assert len(unavailable_redis.calls) == 2
+
+    async def test_redis_timeouts(self):
+        settings = get_settings()
+        connection_kwargs = RedisManager().pool.connection_kwargs
+        assert connection_kwargs['socket_connect_timeout'] == settings.REDIS_CONNECT_TIMEOUT_SECONDS
+        assert connection_kwargs['socket_timeout'] == settings.REDIS_SOCKET_TIMEOUT_SECONDS